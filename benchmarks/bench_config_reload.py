@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : bench_config_reload.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : 大量 entry 时重新加载配置的性能测试
+#
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rtk_utils.config_loader import ConfigWatcher
+
+
+def make_entry(index):
+    return {'stationPort': 20000 + index, 'stationMode': 'client', 'listenPort': 30000 + index,
+            'filterExclude': ['1001-1004'], 'decimation': {'1005': 10}}
+
+
+def timed(func):
+    """Returns: return (tuple[float, object]): 耗时 (ms), 返回值"""
+    time_start = time.perf_counter()
+    result = func()
+    return (time.perf_counter() - time_start) * 1000, result
+
+
+def main(files=50, entries_per_file=100):
+    config_dir = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(config_dir, 'config.json'), 'w') as fp:
+            json.dump({'entry': {}}, fp)
+        for i in range(files):
+            with open(os.path.join(config_dir, 'entry%03d.json' % i), 'w') as fp:
+                json.dump({'entry': {'e%d' % (i * entries_per_file + j): make_entry(i * entries_per_file + j)
+                                     for j in range(entries_per_file)}}, fp)
+        print('%d entries in %d files' % (files * entries_per_file, files + 1))
+
+        # 原先每次重新加载都等同于首次加载
+        ms, result = timed(lambda: ConfigWatcher(config_dir).load())
+        print('%-16s: %8.1f ms' % ('full load', ms))
+
+        watcher = ConfigWatcher(config_dir)
+        watcher.load()
+        ms, result = timed(watcher.has_changed)
+        print('%-16s: %8.1f ms' % ('check unchanged', ms))
+
+        # 修改一个文件中的一个 entry
+        file_name = os.path.join(config_dir, 'entry%03d.json' % (files // 2))
+        with open(file_name) as fp:
+            configs = json.load(fp)
+        name = sorted(configs['entry'].keys())[0]
+        configs['entry'][name]['enableLog'] = 'true'
+        with open(file_name, 'w') as fp:
+            json.dump(configs, fp)
+        ms, (configs, diff) = timed(watcher.load)
+        print('%-16s: %8.1f ms, %s' % ('reload 1 change', ms, diff))
+    finally:
+        shutil.rmtree(config_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : bench_crc.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : CRC-24Q 各实现的性能测试
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rtk_protocol.crc24q import crc24q, crc24q_bytewise, crc24q_batch
+
+CRC24Q_DIV = '1100001100100110011111011'
+
+
+def crc24q_bitstring(data):
+    """原先没有 crcmod 时使用的逐位长除法，作为对照"""
+    msg = list(''.join(['{0:08b}'.format(x) for x in data]) + '0' * 24)
+    for i in range(len(msg) - 24):
+        if msg[i] == '1':
+            for j in range(len(CRC24Q_DIV)):
+                msg[i + j] = str((int(msg[i + j]) + int(CRC24Q_DIV[j])) % 2)
+    return int(''.join(msg[-24:]), 2)
+
+
+def bench(func, messages, repeat):
+    """逐条计算 messages 的 CRC
+
+    Returns:
+        return (float): 每 KB 耗时 (us)
+    """
+    total_kb = sum(len(message) for message in messages) * repeat / 1024
+    time_start = time.perf_counter()
+    for i in range(repeat):
+        for message in messages:
+            func(message)
+    return (time.perf_counter() - time_start) * 1e6 / total_kb
+
+
+def bench_batch(messages, repeat):
+    """一次计算所有 messages 的 CRC
+
+    Returns:
+        return (float): 每 KB 耗时 (us)
+    """
+    total_kb = sum(len(message) for message in messages) * repeat / 1024
+    time_start = time.perf_counter()
+    for i in range(repeat):
+        crc24q_batch(messages)
+    return (time.perf_counter() - time_start) * 1e6 / total_kb
+
+
+def main():
+    # 典型的 MSM 报文长度
+    messages = [os.urandom(size) for size in (20, 150, 300, 500, 1020) * 20]
+
+    results = [('bitstring', bench(crc24q_bitstring, messages[:5], 1)),
+               ('bytewise', bench(crc24q_bytewise, messages, 20)),
+               ('slicing-by-4', bench(crc24q, messages, 20))]
+    try:
+        import crcmod
+        func = crcmod.mkCrcFun(0b1100001100100110011111011, initCrc=0, rev=False)
+        assert all(func(message) == crc24q(message) for message in messages)
+        results.append(('crcmod', bench(func, messages, 200)))
+    except ImportError:
+        print('crcmod not installed')
+    try:
+        assert list(crc24q_batch(messages)) == [crc24q(message) for message in messages]
+        # 离线工具一次校验的报文数较多
+        results.append(('numpy batch', bench_batch(messages * 50, 4)))
+    except ImportError:
+        print('numpy not installed')
+
+    for name, us_per_kb in results:
+        print('%-12s: %10.2f us/KB' % (name, us_per_kb))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : bench_startup.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : 多组差分的启动各阶段耗时和停止耗时
+#
+
+import multiprocessing
+import os
+import selectors
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rtk_trans.rtk_process_mgr import RtkProcessMgr
+from rtk_utils import log
+from rtk_utils.config_loader import Entry
+from rtk_utils.status_board import STARTUP_PHASES, get_startup_report
+
+BASE_PORT = 23000
+
+
+def run_stations(ports, stop_event):
+    """模拟基站，接受连接后每 0.1 s 发送一次数据"""
+    selector = selectors.DefaultSelector()
+    for port in ports:
+        server = socket.socket()
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind(('127.0.0.1', port))
+        server.listen(1)
+        selector.register(server, selectors.EVENT_READ)
+    conns = []
+    while not stop_event.is_set():
+        for key, mask in selector.select(timeout=0.1):
+            conns.append(key.fileobj.accept()[0])
+        for conn in conns[:]:
+            try:
+                conn.send(b'$GPGGA,bench*00\r\n')
+            except OSError:
+                conns.remove(conn)
+    for conn in conns:
+        conn.close()
+
+
+def run_rover(port, stop_event):
+    """模拟客户端，监听端口打开后立即连接，一直接收数据"""
+    while not stop_event.is_set():
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1) as rover:
+                while not stop_event.is_set() and len(rover.recv(4096)) > 0:
+                    pass
+        except OSError:
+            time.sleep(0.01)
+
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))] if len(values) > 0 else float('nan')
+
+
+def main(count=20):
+    multiprocessing.current_process().name = 'rtk'
+    log.init('rtk', False)
+    entries = {'bench%d' % i: Entry({'stationPort': BASE_PORT + i * 3, 'stationMode': 'server',
+                                     'stationIpAddress': '127.0.0.1', 'listenPort': BASE_PORT + i * 3 + 1,
+                                     'protocol': 'raw'})
+               for i in range(count)}
+    stop_event = threading.Event()
+    threads = [threading.Thread(target=run_stations, args=([entry.station_port for entry in entries.values()],
+                                                           stop_event))]
+    threads += [threading.Thread(target=run_rover, args=(entry.listen_port, stop_event)) for entry in entries.values()]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    mgr = RtkProcessMgr({'entry': entries})
+    mgr.start()
+    # 等待所有差分都向客户端发送了数据
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        time.sleep(0.5)
+        board = mgr.status_board.read_all()
+        if len(board) == count and all(values['first_send_time'] > 0 for values in board.values()):
+            break
+    reports = [dict(get_startup_report(values)) for values in mgr.status_board.read_all().values()]
+    print('%d entries' % count)
+    for phase, field in STARTUP_PHASES:
+        values = [report[phase] for report in reports if report[phase] is not None]
+        print('%-20s: p50 %8.1f ms, p90 %8.1f ms, max %8.1f ms (%d/%d)'
+              % (phase, percentile(values, 0.5), percentile(values, 0.9), max(values, default=float('nan')),
+                 len(values), len(reports)))
+
+    time_start = time.perf_counter()
+    mgr.running = False
+    mgr.join()
+    print('%-20s: %8.1f ms' % ('shutdown', (time.perf_counter() - time_start) * 1000))
+    stop_event.set()
+    log.close_all()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : bench_station_recv.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : StationConnectionThread 接收路径的性能测试
+#
+
+import os
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rtk_trans.station_connection_thread import StationConnectionThread
+from rtk_utils.config_loader import Entry
+
+
+def bench(total_kb, chunk_size):
+    """经 socketpair 发送 total_kb 数据，测量接收、解析路径的耗时与内存
+
+    Args:
+        total_kb (int): 总数据量 (KB)
+        chunk_size (int): 发送端每次发送的长度
+
+    Returns:
+        us_per_kb (float): 每 KB 耗时 (us)
+        peak_kb (float): 接收过程中的内存峰值 (KB)
+        rcv_per_kb (float): 每 KB 的 recv 次数
+    """
+    sock_send, sock_rcv = socket.socketpair()
+    config = Entry({'stationPort': 0, 'stationMode': 'client', 'listenPort': 0})
+    connection = StationConnectionThread('bench', sock_rcv, 'bench', config)
+    connection.got_data_cb = lambda data: None
+
+    def feed():
+        payload = os.urandom(chunk_size)
+        for i in range(total_kb * 1024 // chunk_size):
+            sock_send.sendall(payload)
+        sock_send.close()
+
+    feeder = threading.Thread(target=feed)
+    tracemalloc.start()
+    time_start = time.perf_counter()
+    feeder.start()
+    try:
+        connection.send_and_receive_data()
+    except RuntimeError:
+        pass    # socket connection broken, 数据接收完毕
+    time_used = time.perf_counter() - time_start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    feeder.join()
+    connection.disconnect()
+    return time_used * 1e6 / total_kb, peak / 1024, connection.rcv_count / total_kb
+
+
+def main():
+    total_kb = int(sys.argv[1]) if len(sys.argv) > 1 else 16384
+    for chunk_size in (256, 1460, 8192):
+        us_per_kb, peak_kb, rcv_per_kb = bench(total_kb, chunk_size)
+        print('chunk %5d: %8.2f us/KB, peak %8.1f KB, %6.3f recv/KB'
+              % (chunk_size, us_per_kb, peak_kb, rcv_per_kb))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : bench_transcode.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : MsmTranscoder 的性能测试
+#
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from rtk_protocol.msm_transcoder import BitWriter, MsmTranscoder, SAT_FIELDS, SIG_FIELDS
+from rtk_protocol.rtcm_message import MSM_SAT_MASK_POS
+from rtk_protocol.rtcm_util import crc24q_func
+
+# 一个历元的 MSM7 报文: (报文类型, 卫星数, 信号号)
+EPOCH = ((1077, 10, (2, 3, 22)), (1087, 8, (2, 3)), (1097, 8, (2, 15, 22)), (1127, 12, (2, 14, 22)))
+
+
+def make_msm(msg_type, num_of_sat, signals, rnd):
+    """生成填充随机观测值的 MSM 报文
+
+    Args:
+        msg_type (int): 报文类型
+        num_of_sat (int): 卫星数
+        signals (tuple[int]): 信号号
+        rnd (random.Random): 随机数生成器
+
+    Returns:
+        return (bytes): 完整的 rtcm 报文
+    """
+    level = msg_type % 10
+    satellites = sorted(rnd.sample(range(1, 41), num_of_sat))
+    writer = BitWriter()
+    writer.write(msg_type, 12)
+    writer.write(0, MSM_SAT_MASK_POS - 12)
+    writer.write(sum(1 << (64 - sat) for sat in satellites), 64)
+    writer.write(sum(1 << (32 - sig) for sig in signals), 32)
+    writer.write((1 << (num_of_sat * len(signals))) - 1, num_of_sat * len(signals))
+    for df, bits, signed in SAT_FIELDS[level]:
+        for i in range(num_of_sat):
+            writer.write(rnd.getrandbits(bits), bits)
+    for df, bits, signed in SIG_FIELDS[level]:
+        for i in range(num_of_sat * len(signals)):
+            writer.write(rnd.randrange(705) if df == 407 else rnd.getrandbits(bits), bits)
+    payload = writer.to_bytes()
+    message = bytes((0xd3, len(payload) >> 8, len(payload) & 0xff)) + payload
+    return message + crc24q_func(message).to_bytes(3, 'big')
+
+
+def bench(transcoder, epoch, repeat):
+    """重复转码一个历元的报文
+
+    Returns:
+        us_per_epoch (float): 每个历元的耗时 (us)
+        ratio (float): 输出与输入的字节数之比
+    """
+    len_in = sum(len(data) for data in epoch)
+    len_out = sum(len(transcoder.transcode(data) or b'') for data in epoch)
+    time_start = time.perf_counter()
+    for i in range(repeat):
+        for data in epoch:
+            transcoder.transcode(data)
+    return (time.perf_counter() - time_start) * 1e6 / repeat, len_out / len_in
+
+
+def main():
+    rnd = random.Random(0)
+    epoch = [make_msm(msg_type, num_of_sat, signals, rnd) for msg_type, num_of_sat, signals in EPOCH]
+    print('epoch: %d messages, %d bytes' % (len(epoch), sum(len(data) for data in epoch)))
+    cases = (('passthrough', MsmTranscoder()),
+             ('msm7 -> msm5', MsmTranscoder(5)),
+             ('msm7 -> msm4', MsmTranscoder(4)),
+             ('drop signals', MsmTranscoder(drop_signals={'GPS': [22], 'Galileo': [22], 'BDS': [22]})),
+             ('msm4, no glo', MsmTranscoder(4, drop_gnss=['GLONASS'])))
+    for name, transcoder in cases:
+        us_per_epoch, ratio = bench(transcoder, epoch, 200)
+        # 1 Hz 的差分数据，每个核每秒可以转码的历元数即为数据流数
+        print('%-12s: %8.1f us/epoch, output %3.0f%%, %6d streams/core at 1 Hz'
+              % (name, us_per_epoch, ratio * 100, 1e6 / us_per_epoch))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,21 +6,22 @@
 # Description   :
 #
 
+from rtk_protocol.byte_buffer import ByteBuffer
 from rtk_utils import log
 
 
 class BaseDataHandler:
     def __init__(self):
-        self.data = []
+        self.data = ByteBuffer()
 
     def push_back(self, data):
-        """加入新收到的数据 (list)
+        """加入新收到的数据
 
         Args:
-            data (list): 新收到的数据
+            data (bytes): 新收到的数据，可以是任意 bytes-like 对象
         """
         try:
-            self.data.extend(data)
+            self.data.append(data)
         except Exception as e:
             log.error('checker error when add: %s' % e)
 
@@ -31,17 +32,12 @@ class BaseDataHandler:
             len_to_remove (int): 要删除的数据长度
 
         Returns:
-            ret_data (list): 被删除的数据
+            ret_data (bytes): 被删除的数据
         """
         ret_data = None
         try:
             if len_to_remove > 0:
-                if len_to_remove < len(self.data):
-                    ret_data = self.data[:len_to_remove]
-                    self.data = self.data[len_to_remove:]
-                else:
-                    ret_data = self.data[:]
-                    self.data.clear()
+                ret_data = self.data.pop(len_to_remove)
         except Exception as e:
             log.error('checker error when remove data: %s' % e)
         return ret_data
@@ -7,7 +7,9 @@
 #
 
 from rtk_protocol.base_data_handler import BaseDataHandler
+from rtk_protocol.msm_transcoder import MsmTranscoder
 from rtk_protocol.rtcm_checker import RtcmChecker
+from rtk_protocol.rtcm_filter import RtcmFilter
 from rtk_utils import log
 
 
@@ -23,29 +25,37 @@ class BaseProtocolHandler(BaseDataHandler):
         super().__init__()
         self.config = config
         # rtk_filter 表示 rtcm 报文过滤。
-        # None 表示不过滤，[] (empty list) 表示保留所有 rtcm 报文，list 表示保留其中的整数对应的报文
-        self.rtk_filter = config['filter'] if 'filter' in config.keys() else None
-        self.rtcm_checker = RtcmChecker(self.rtk_filter)
-        self.data = []
+        # None 表示不解析报文直接转发，否则只转发通过 filter, filter_exclude, decimation 的 rtcm 报文
+        self.rtk_filter = RtcmFilter.from_config(config)
+        self.transcoder = MsmTranscoder.from_config(config.get('transcode'))
+        if self.rtk_filter is None and (self.transcoder is not None or config.get('transcode_ports')):
+            # 转码需要完整的报文
+            self.rtk_filter = RtcmFilter()
+        self.rtcm_checker = RtcmChecker(self.rtk_filter, self.transcoder)
+        # 握手成功后是否直接转发收到的数据，不经过 get_parsed_data_list。
+        # 需要在握手后继续处理数据的子类应设为 False
+        self.passthrough = self.rtk_filter is None
 
     def handshake(self):
         """重载方法实现握手"""
         return True
 
-    def get_parsed_data(self):
+    def get_parsed_data_list(self):
         """解析数据
 
         Returns:
-            return (bytes): 解析了的完整报文
+            return (list[bytes]): 解析了的所有完整报文
         """
 
         # 拷贝
-        self.rtcm_checker.push_back(self.data)
-        self.data.clear()
+        if len(self.data) > 0:
+            with self.data.view() as data:
+                self.rtcm_checker.push_back(data)
+            self.data.clear()
 
         try:
             # 解析
-            return self.rtcm_checker.get_parsed_data()
+            return self.rtcm_checker.get_parsed_data_list()
         except Exception as e:
             log.error('checker error when parse msg: %s' % e)
-        return None
+        return []
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : byte_buffer.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   :
+#
+
+COMPACT_SIZE = 4096
+
+
+class ByteBuffer:
+    """从尾部写入、从头部取出的字节缓冲区
+
+    数据保存在一个 bytearray 中，start 为读位置。取出数据只移动 start，
+    已读部分超过 COMPACT_SIZE 且超过一半时才压缩，因此每次取出的摊还代价为 O(1)。
+    """
+
+    def __init__(self):
+        """构造函数"""
+        self.buffer = bytearray()
+        self.start = 0
+
+    def __len__(self):
+        return len(self.buffer) - self.start
+
+    def append(self, data):
+        """写入数据
+
+        Args:
+            data (bytes): 要写入的数据，可以是任意 bytes-like 对象
+        """
+        self.buffer += data
+
+    def view(self):
+        """获取所有未读数据，不拷贝
+
+        写入、取出数据前必须先 release 返回值，建议使用 with 语句。
+
+        Returns:
+            return (memoryview): 未读数据
+        """
+        return memoryview(self.buffer)[self.start:]
+
+    def pop(self, length):
+        """从头部取出数据
+
+        Args:
+            length (int): 要取出的长度
+
+        Returns:
+            return (bytes): 取出的数据
+        """
+        data = bytes(self.buffer[self.start:self.start + length])
+        self.consume(length)
+        return data
+
+    def consume(self, length):
+        """从头部丢弃数据
+
+        Args:
+            length (int): 要丢弃的长度
+        """
+        self.start += length
+        if self.start >= len(self.buffer):
+            self.clear()
+        elif self.start >= COMPACT_SIZE and self.start * 2 >= len(self.buffer):
+            del self.buffer[:self.start]
+            self.start = 0
+
+    def clear(self):
+        """清空"""
+        self.buffer.clear()
+        self.start = 0
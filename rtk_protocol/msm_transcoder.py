@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : msm_transcoder.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : MSM 报文降级、删减卫星系统和信号
+#
+
+from rtk_protocol.rtcm_message import RtcmMessage, MSM_GNSS, EPOCH_TIME_POS, MSM_CELL_MASK_POS, MSM_SAT_MASK_POS
+from rtk_protocol.rtcm_util import crc24q_func
+
+# 各级 MSM 报文中，每颗卫星、每个信号的数据字段 (DF 编号, bit 数, 是否有符号)，依次排列
+SAT_FIELDS = {
+    1: ((398, 10, False),),
+    2: ((398, 10, False),),
+    3: ((398, 10, False),),
+    4: ((397, 8, False), (398, 10, False)),
+    5: ((397, 8, False), (0, 4, False), (398, 10, False), (399, 14, True)),     # 0: 卫星扩展信息
+    6: ((397, 8, False), (398, 10, False)),
+    7: ((397, 8, False), (0, 4, False), (398, 10, False), (399, 14, True)),
+}
+SIG_FIELDS = {
+    1: ((400, 15, True),),
+    2: ((401, 22, True), (402, 4, False), (420, 1, False)),
+    3: ((400, 15, True), (401, 22, True), (402, 4, False), (420, 1, False)),
+    4: ((400, 15, True), (401, 22, True), (402, 4, False), (420, 1, False), (403, 6, False)),
+    5: ((400, 15, True), (401, 22, True), (402, 4, False), (420, 1, False), (403, 6, False), (404, 15, True)),
+    6: ((405, 20, True), (406, 24, True), (407, 10, False), (420, 1, False), (408, 10, False)),
+    7: ((405, 20, True), (406, 24, True), (407, 10, False), (420, 1, False), (408, 10, False), (404, 15, True)),
+}
+# DF 编号 -> (bit 数, 是否有符号)
+SIG_BITS = {df: (bits, signed) for fields in SIG_FIELDS.values() for df, bits, signed in fields}
+# 低精度字段 -> 可以转换得到该字段的高精度字段
+LOW_RES_SOURCE = {400: 405, 401: 406, 402: 407, 403: 408}
+# 精细伪距、相位由高精度转为低精度时右移的位数: 2^-29 ms -> 2^-24 ms, 2^-31 ms -> 2^-29 ms
+RESOLUTION_SHIFT = {400: 5, 401: 2}
+# 表示无效值的字段值
+INVALID = {400: -(1 << 14), 401: -(1 << 21), 404: -(1 << 14), 405: -(1 << 19), 406: -(1 << 23)}
+# MSM 报文头中同步标志 (multiple message bit) 的位置，不含 3 字节帧头
+MULTIPLE_MESSAGE_POS = EPOCH_TIME_POS + 30
+
+
+def lock_time_ms(indicator):
+    """DF407 扩展锁定时间指示 -> 最小锁定时间 (ms)"""
+    if indicator < 64:
+        return indicator
+    k = indicator // 32 - 1
+    return (indicator - 32 * k) << k
+
+
+def lock_time_indicator(time_ms):
+    """最小锁定时间 (ms) -> DF402 锁定时间指示"""
+    if time_ms < 32:
+        return 0
+    return min(15, time_ms.bit_length() - 5)
+
+
+def convert_field(df, source_df, value):
+    """由高精度字段计算低精度字段
+
+    Args:
+        df (int): 要计算的字段
+        source_df (int): 高精度字段
+        value (int): 高精度字段的值
+
+    Returns:
+        return (int): 低精度字段的值
+    """
+    if value == INVALID.get(source_df):
+        return INVALID[df]
+    if df in RESOLUTION_SHIFT:
+        shift = RESOLUTION_SHIFT[df]
+        limit = (1 << (SIG_BITS[df][0] - 1)) - 1
+        return max(-limit, min(limit, (value + (1 << (shift - 1))) >> shift))
+    elif df == 402:
+        return lock_time_indicator(lock_time_ms(value))
+    else:
+        # 2^-4 dB-Hz -> 1 dB-Hz
+        return min(63, (value + 8) >> 4)
+
+
+def convert_column(df, source_df, chunks):
+    """由一组高精度字段计算低精度字段
+
+    Args:
+        df (int): 要计算的字段
+        source_df (int): 高精度字段
+        chunks (list[str]): 高精度字段的 '0', '1' 字符串
+
+    Returns:
+        return (str): 低精度字段依次拼接的 '0', '1' 字符串
+    """
+    bits = SIG_BITS[df][0]
+    source_bits, source_signed = SIG_BITS[source_df]
+    if not source_signed:
+        # 无符号字段只有 1024 种取值，查表
+        table = CONVERT_TABLES[df]
+        return ''.join(table[int(chunk, 2)] for chunk in chunks)
+    # 与 convert_field 相同，展开以减少函数调用
+    fmt = '0%db' % bits
+    mask = (1 << bits) - 1
+    sign = 1 << (source_bits - 1)
+    shift = RESOLUTION_SHIFT[df]
+    half = 1 << (shift - 1)
+    limit = (1 << (bits - 1)) - 1
+    invalid = format(INVALID[df] & mask, fmt)
+    invalid_source = format(INVALID[source_df] & ((1 << source_bits) - 1), '0%db' % source_bits)
+    return ''.join(invalid if chunk == invalid_source else
+                   format(max(-limit, min(limit, (((int(chunk, 2) ^ sign) - sign) + half) >> shift)) & mask, fmt)
+                   for chunk in chunks)
+
+
+# 由无符号高精度字段计算低精度字段的查表: 低精度字段 -> 高精度字段的值 -> '0', '1' 字符串
+CONVERT_TABLES = {df: ['{0:0{1}b}'.format(convert_field(df, source_df, value), SIG_BITS[df][0])
+                       for value in range(1 << SIG_BITS[source_df][0])]
+                  for df, source_df in LOW_RES_SOURCE.items() if not SIG_BITS[source_df][1]}
+
+
+def clear_multiple_message(data):
+    """把 MSM 报文的同步标志改为 0, 并重新计算 CRC
+
+    Args:
+        data (bytes): 完整的 MSM 报文
+
+    Returns:
+        return (bytes): 修改后的报文
+    """
+    message = bytearray(data[:-3])
+    message[3 + MULTIPLE_MESSAGE_POS // 8] &= ~(0x80 >> (MULTIPLE_MESSAGE_POS % 8)) & 0xff
+    return bytes(message) + crc24q_func(message).to_bytes(3, 'big')
+
+
+class BitWriter:
+    """按大端序依次写入若干 bit
+
+    以 '0', '1' 字符串拼接，最后一次转为 bytes, 避免反复移位大整数。
+    """
+
+    def __init__(self):
+        """构造函数"""
+        self.parts = []
+        self.length = 0
+
+    def write(self, value, bits):
+        """写入 value 的低 bits 位，负数写入补码"""
+        self.parts.append(format(value & ((1 << bits) - 1), '0%db' % bits))
+        self.length += bits
+
+    def write_bits(self, bits):
+        """写入 '0', '1' 字符串"""
+        self.parts.append(bits)
+        self.length += len(bits)
+
+    def to_bytes(self):
+        """补齐到整字节"""
+        padding = -self.length % 8
+        return (int(''.join(self.parts), 2) << padding).to_bytes((self.length + padding) // 8, 'big')
+
+
+class MsmTranscoder:
+    """MSM 报文转码
+
+    把 MSM6/7 转为 MSM4/5 (或 MSM7 转为 MSM6), 删除指定的卫星系统和信号，并重新计算 CRC。
+    不是 MSM 的报文原样返回。
+    对连续的报文流应使用 transcode_stream, 删除某历元的最后一条 MSM 时会修正之前一条的同步标志。
+    """
+
+    def __init__(self, msm_level=None, drop_gnss=None, drop_signals=None):
+        """构造函数
+
+        Args:
+            msm_level (int): 输出的 MSM 等级 4~7, None 表示不转换
+            drop_gnss (list[str]): 删除的卫星系统，如 "GLONASS"
+            drop_signals (dict[str, list[int]]): 各卫星系统要删除的信号号
+        """
+        gnss_names = {name.lower(): name for name in MSM_GNSS.values()}
+        if msm_level is not None and not 4 <= msm_level <= 7:
+            raise Exception('msmLevel should be 4 ~ 7.')
+        self.msm_level = msm_level
+        self.drop_gnss = set()
+        for name in drop_gnss or []:
+            if name.lower() not in gnss_names:
+                raise Exception('Unrecognized gnss "%s".' % name)
+            self.drop_gnss.add(gnss_names[name.lower()])
+        self.drop_signals = {}
+        for name, signals in (drop_signals or {}).items():
+            if name.lower() not in gnss_names:
+                raise Exception('Unrecognized gnss "%s".' % name)
+            self.drop_signals[gnss_names[name.lower()]] = set(int(sig) for sig in signals)
+        self.held = None            # 暂存的同步标志为 1 的 MSM (转码后), 等待同一历元的下一条 MSM
+        self.held_station_id = None
+
+    @staticmethod
+    def from_config(config):
+        """根据配置生成转码工具
+
+        Args:
+            config (dict): 转码配置，包括 msmLevel, dropGnss, dropSignals
+
+        Returns:
+            return (MsmTranscoder): 转码工具, 没有配置时为 None
+        """
+        if not config:
+            return None
+        msm_level = int(config['msmLevel']) if 'msmLevel' in config.keys() else None
+        return MsmTranscoder(msm_level, config.get('dropGnss'), config.get('dropSignals'))
+
+    def get_output_level(self, level):
+        """输出的 MSM 等级
+
+        Args:
+            level (int): 输入的 MSM 等级
+
+        Returns:
+            return (int): 输出的 MSM 等级，无法转换时与输入相同
+        """
+        if self.msm_level is None or self.msm_level >= level:
+            return level
+        input_fields = set(df for df, bits, signed in SIG_FIELDS[level] + SAT_FIELDS[level])
+        for df, bits, signed in SIG_FIELDS[self.msm_level] + SAT_FIELDS[self.msm_level]:
+            if df not in input_fields and LOW_RES_SOURCE.get(df) not in input_fields:
+                return level
+        return self.msm_level
+
+    def transcode_stream(self, data):
+        """转码报文流中的一条报文，并维护 MSM 的同步标志
+
+        历元的最后一条 MSM (同步标志为 0) 被删除时，需要把之前最后一条保留的 MSM 的同步标志改为 0,
+        否则接收机会一直等待该历元结束。因此保留的同步标志为 1 的 MSM 暂不返回，
+        等同一历元的下一条 MSM 到达、确定它是否为最后一条后再返回。不是 MSM 的报文不暂存，直接返回。
+
+        不同卫星系统的历元时间的时间系统不同 (GLONASS 为莫斯科时间的日内秒), 无法直接比较，
+        因此以同步标志划分历元: 同一基站的 MSM 直到同步标志为 0 的一条为止属于同一历元。
+
+        Args:
+            data (bytes): 完整的 rtcm 报文
+
+        Returns:
+            return (list[bytes]): 可以发送的报文，可能为空，也可能包括之前暂存的报文
+        """
+        msg = RtcmMessage(data) if len(data) >= 6 + 22 and data[0] == 0xd3 else None
+        if msg is None or not msg.is_msm:
+            transcoded = self.transcode(data)
+            return [transcoded] if transcoded is not None else []
+        messages = []
+        station_id = msg.station_id
+        if self.held is not None and self.held_station_id != station_id:
+            # 其他基站的报文，之前的历元不完整，原样发送
+            messages.append(self.held)
+            self.held = None
+        multiple_message = msg.multiple_message
+        transcoded = self.transcode(data)
+        if transcoded is None:
+            if not multiple_message and self.held is not None:
+                # 删除了历元的最后一条 MSM
+                messages.append(clear_multiple_message(self.held))
+                self.held = None
+            return messages
+        if self.held is not None:
+            messages.append(self.held)
+            self.held = None
+        if multiple_message:
+            self.held = transcoded
+            self.held_station_id = station_id
+        else:
+            messages.append(transcoded)
+        return messages
+
+    def transcode(self, data):
+        """转码一条报文
+
+        不修正其他报文的同步标志，见 transcode_stream。
+
+        Args:
+            data (bytes): 完整的 rtcm 报文
+
+        Returns:
+            return (bytes): 转码后的报文, None 表示整条报文被删除
+        """
+        if len(data) < 6 + 22 or data[0] != 0xd3:
+            return data
+        msg = RtcmMessage(data)
+        if not msg.is_msm:
+            return data
+        gnss = msg.gnss
+        if gnss in self.drop_gnss:
+            return None
+        level = msg.msm_level
+        out_level = self.get_output_level(level)
+        drop_signals = self.drop_signals.get(gnss, set())
+        if out_level == level and len(drop_signals & set(msg.signals)) == 0:
+            return data
+
+        # 解析，各字段保留为 '0', '1' 字符串，需要换算时再转为整数
+        satellites = msg.satellites
+        signals = msg.signals
+        cells = msg.cells
+        bits_data = format(int.from_bytes(data, 'big'), '0%db' % (len(data) * 8))
+        pos = 24 + MSM_CELL_MASK_POS + len(satellites) * len(signals)     # 跳过帧头和报文头
+        sat_data = {}
+        for df, bits, signed in SAT_FIELDS[level]:
+            sat_data[df] = [bits_data[i:i + bits] for i in range(pos, pos + len(satellites) * bits, bits)]
+            pos += len(satellites) * bits
+        cell_data = {}
+        for df, bits, signed in SIG_FIELDS[level]:
+            cell_data[df] = [bits_data[i:i + bits] for i in range(pos, pos + len(cells) * bits, bits)]
+            pos += len(cells) * bits
+
+        # 删除信号，以及没有信号的卫星
+        kept_cells = [i for i, (sat, sig) in enumerate(cells) if sig not in drop_signals]
+        if len(kept_cells) == 0:
+            return None
+        out_satellites = sorted(set(cells[i][0] for i in kept_cells))
+        out_signals = sorted(set(cells[i][1] for i in kept_cells))
+        kept_sats = [satellites.index(sat) for sat in out_satellites]
+        out_cells = set(cells[i] for i in kept_cells)
+
+        # 编码
+        writer = BitWriter()
+        writer.write(msg.msg_type - level + out_level, 12)
+        writer.write_bits(bits_data[24 + 12:24 + MSM_SAT_MASK_POS])
+        writer.write(sum(1 << (64 - sat) for sat in out_satellites), 64)
+        writer.write(sum(1 << (32 - sig) for sig in out_signals), 32)
+        writer.write_bits(''.join('1' if (sat, sig) in out_cells else '0'
+                                  for sat in out_satellites for sig in out_signals))
+        for df, bits, signed in SAT_FIELDS[out_level]:
+            writer.write_bits(''.join(sat_data[df][i] for i in kept_sats))
+        for df, bits, signed in SIG_FIELDS[out_level]:
+            if df in cell_data:
+                writer.write_bits(''.join(cell_data[df][i] for i in kept_cells))
+            else:
+                source_df = LOW_RES_SOURCE[df]
+                writer.write_bits(convert_column(df, source_df, [cell_data[source_df][i] for i in kept_cells]))
+        payload = writer.to_bytes()
+        if len(payload) > 1023:
+            return data
+        message = bytes((0xd3, len(payload) >> 8, len(payload) & 0xff)) + payload
+        return message + crc24q_func(message).to_bytes(3, 'big')
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : nmea_protocol_handler.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   :
+#
+
+from rtk_protocol.base_data_handler import BaseDataHandler
+from rtk_utils import log
+
+MAX_SENTENCE_SIZE = 1024
+
+
+class NmeaProtocolHandler(BaseDataHandler):
+    """解析 NMEA 语句，只转发校验和正确的完整语句"""
+
+    def __init__(self, config):
+        """构造函数
+
+        Args:
+            config (dict): 配置
+        """
+        super().__init__()
+        self.config = config
+        self.passthrough = False
+
+    def handshake(self):
+        """不需要握手"""
+        return True
+
+    def get_parsed_data_list(self):
+        """解析数据
+
+        Returns:
+            return (list[bytes]): 完整的语句，含行尾的换行
+        """
+        parsed_data_list = []
+        buffer = self.data.buffer
+        pos = self.data.start
+        while True:
+            start = buffer.find(b'$', pos)
+            if start < 0:
+                pos = len(buffer)
+                break
+            end = buffer.find(b'\n', start)
+            if end < 0:
+                # 不完整的语句，过长时丢弃
+                pos = start if len(buffer) - start <= MAX_SENTENCE_SIZE else start + 1
+                break
+            sentence = bytes(buffer[start:end + 1])
+            if check_sentence(sentence):
+                parsed_data_list.append(sentence)
+            else:
+                log.debug('nmea: bad sentence: %s' % sentence)
+            pos = end + 1
+        self.data.consume(pos - self.data.start)
+        return parsed_data_list
+
+
+def check_sentence(sentence):
+    """检查语句的校验和
+
+    Args:
+        sentence (bytes): 以 $ 开头的一行
+
+    Returns:
+        return (bool): 是否正确
+    """
+    body, sep, checksum = sentence.rstrip(b'\r\n')[1:].partition(b'*')
+    if len(sep) == 0 or len(checksum) != 2:
+        return False
+    value = 0
+    for b in body:
+        value ^= b
+    try:
+        return value == int(checksum, 16)
+    except ValueError:
+        return False
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : raw_protocol_handler.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   :
+#
+
+from rtk_protocol.base_data_handler import BaseDataHandler
+
+
+class RawProtocolHandler(BaseDataHandler):
+    """不解析数据，原样转发
+
+    忽略 filter 等报文过滤、转码规则。
+    """
+
+    def __init__(self, config):
+        """构造函数
+
+        Args:
+            config (dict): 配置
+        """
+        super().__init__()
+        self.config = config
+        self.passthrough = True
+
+    def handshake(self):
+        """不需要握手"""
+        return True
+
+    def get_parsed_data_list(self):
+        """取出所有数据
+
+        Returns:
+            return (list[bytes]): 收到的数据
+        """
+        if len(self.data) <= 0:
+            return []
+        return [self.pop_front(len(self.data))]
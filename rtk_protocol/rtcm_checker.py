@@ -7,62 +7,64 @@
 #
 
 from rtk_protocol.base_data_handler import BaseDataHandler
-from rtk_protocol.rtcm_util import try_parse
+from rtk_protocol.rtcm_util import iter_frames
 from rtk_utils import log
 
 
 class RtcmChecker(BaseDataHandler):
     """解析差分数据的线程"""
 
-    def __init__(self, acceptable_rtcm_msg_type):
+    def __init__(self, rtcm_filter, transcoder=None):
         """构造函数
 
         Args:
-            acceptable_rtcm_msg_type (list[int]): 使用的 rtcm 类型
+            rtcm_filter (RtcmFilter): 报文过滤器, None 表示不解析报文
+            transcoder (MsmTranscoder): 对通过过滤的报文转码, None 表示不转码
         """
         super().__init__()
-        self.is_acceptable_msg_type = None
-        if isinstance(acceptable_rtcm_msg_type, list):
-            if len(acceptable_rtcm_msg_type) > 0:
-                self.is_acceptable_msg_type = lambda x: x in acceptable_rtcm_msg_type
-            else:
-                self.is_acceptable_msg_type = lambda x: True
-        self.data = []
+        self.rtcm_filter = rtcm_filter
+        self.transcoder = transcoder
 
-    def get_parsed_data(self):
+    def get_parsed_data_list(self):
         """解析数据
 
+        单次扫描缓冲区，取出所有完整的报文，丢弃无法解析的数据，保留未接收完的报文。
+
         Returns:
-            return (bytes): 解析了的完整报文
+            return (list[bytes]): 解析了的完整报文
         """
 
         if len(self.data) <= 0:
-            return None
-        # 拷贝
-        data = self.data[:]
-        if self.is_acceptable_msg_type is None:
+            return []
+        if self.rtcm_filter is None:
             # 如果不用解析
-            self.data.clear()
-            return bytes(data)
+            return [self.pop_front(len(self.data))]
 
+        parsed_data_list = []
+        buffer = self.data.buffer
+        start = self.data.start
+        pos = start     # 已处理到的位置
         try:
             # 解析
-            index, len_message, msg_type = try_parse(data)
-            if index > 0:
-                # 删除无法解析的数据
-                log.debug('unknown data size: %d' % index)
-                # print unknown data
-                # print([hex(x) for x in data[:index]])
-                # print(bytes(data[:index]).decode('utf-8', errors='ignore'))
-                self.pop_front(index)
-            if len_message > 0:
-                # 删除解析后的数据
-                log.debug('pkg size: %d, msg size: %d, msg type: %d' % (len_message, len_message - 6, msg_type))
-                # print([hex(x) for x in data[:index + len_message]])
-                # print(bytes(data[:index + len_message]).decode('utf-8', errors='ignore'))
-                parsed_data = bytes(self.pop_front(len_message))
-                if self.is_acceptable_msg_type(msg_type):
-                    return parsed_data
+            for index, len_message, msg_type in iter_frames(buffer, start):
+                if index > pos:
+                    # 无法解析的数据
+                    log.debug('unknown data size: %d' % (index - pos))
+                    # print unknown data
+                    # print(bytes(buffer[pos:index]).decode('utf-8', errors='ignore'))
+                if len_message > 0:
+                    log.debug('pkg size: %d, msg size: %d, msg type: %d' % (len_message, len_message - 6, msg_type))
+                    if self.rtcm_filter.accept(msg_type, buffer, index):
+                        message = bytes(buffer[index:index + len_message])
+                        if self.transcoder is not None:
+                            parsed_data_list += self.transcoder.transcode_stream(message)
+                        else:
+                            parsed_data_list.append(message)
+                    pos = index + len_message
+                else:
+                    pos = index
         except Exception as e:
             log.error('checker error when parse msg: %s' % e)
-        return None
+        # 删除处理过的数据
+        self.data.consume(pos - start)
+        return parsed_data_list
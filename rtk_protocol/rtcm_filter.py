@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : rtcm_filter.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : rtcm 报文过滤、降频规则
+#
+
+import time
+
+from rtk_protocol.rtcm_util import get_bits
+
+MSG_TYPE_COUNT = 4096   # 报文类型为 12 bit
+
+# 对每种报文类型的处理
+A_DROP = 0
+A_PASS = 1
+A_RULE = 2      # 需要检查降频规则
+
+# 降频规则，只在星历更新时转发
+R_IODE = 'iode'
+
+# 星历报文中 (卫星号 bit 数, 星历版本号的位置, 星历版本号 bit 数)，位置不含 12 bit 的报文类型
+# GPS IODE, GLONASS tb, Galileo IODnav, BDS AODE, QZSS IODE, NavIC IODEC
+EPHEMERIS_ISSUE_BITS = {
+    1019: (6, 36, 8),
+    1020: (6, 29, 7),
+    1041: (6, 112, 8),
+    1042: (6, 37, 5),
+    1044: (4, 66, 8),
+    1045: (6, 18, 10),
+    1046: (6, 18, 10),
+}
+
+
+def parse_msg_types(items):
+    """解析报文类型列表
+
+    Args:
+        items (list): 报文类型，每项为整数，或 "1074-1124" 形式的闭区间
+
+    Returns:
+        return (set[int]): 报文类型的集合
+    """
+    msg_types = set()
+    for item in items:
+        if isinstance(item, str) and '-' in item:
+            first, last = (int(x) for x in item.split('-', 1))
+        else:
+            first = last = int(item)
+        if not 0 <= first <= last < MSG_TYPE_COUNT:
+            raise Exception('Invalid rtcm message type "%s".' % item)
+        msg_types.update(range(first, last + 1))
+    return msg_types
+
+
+class RtcmFilter:
+    """rtcm 报文过滤
+
+    include / exclude 在构造时编译为以报文类型为下标的查表，每条报文只需查一次表。
+    降频规则对某类报文限制转发频率：数字表示至少间隔若干秒才转发一次，
+    R_IODE 表示每颗卫星的星历版本号变化时才转发。
+    """
+
+    def __init__(self, include=None, exclude=None, decimation=None):
+        """构造函数
+
+        Args:
+            include (list): 保留的报文类型, None 或 [] 表示所有类型
+            exclude (list): 丢弃的报文类型
+            decimation (dict): 降频规则，键为报文类型，值为间隔秒数或 R_IODE
+        """
+        include_set = parse_msg_types(include) if include else range(MSG_TYPE_COUNT)
+        exclude_set = parse_msg_types(exclude) if exclude else set()
+        self.table = bytearray(MSG_TYPE_COUNT)
+        for msg_type in include_set:
+            if msg_type not in exclude_set:
+                self.table[msg_type] = A_PASS
+
+        self.intervals = {}         # 报文类型 -> 最小间隔 (s)
+        self.last_forward = {}      # 报文类型 -> 上次转发的时间
+        self.last_issue = {}        # (报文类型, 卫星号) -> 上次转发的星历版本号
+        for key, rule in (decimation or {}).items():
+            for msg_type in parse_msg_types([key]):
+                if isinstance(rule, str) and rule.lower().strip() == R_IODE:
+                    if msg_type not in EPHEMERIS_ISSUE_BITS:
+                        raise Exception('Decimation "%s" only applies to ephemeris, not %d.' % (R_IODE, msg_type))
+                    self.intervals.pop(msg_type, None)
+                else:
+                    interval = float(rule)
+                    if interval <= 0:
+                        raise Exception('Decimation interval of %d should be positive.' % msg_type)
+                    self.intervals[msg_type] = interval
+                if self.table[msg_type] == A_PASS:
+                    self.table[msg_type] = A_RULE
+
+    @staticmethod
+    def from_config(config):
+        """根据配置生成过滤器
+
+        Args:
+            config (dict): 配置
+
+        Returns:
+            return (RtcmFilter): 过滤器, None 表示不解析报文，直接转发
+        """
+        include = config.get('filter')
+        exclude = config.get('filter_exclude')
+        decimation = config.get('decimation')
+        if include is None and not exclude and not decimation:
+            return None
+        return RtcmFilter(include, exclude, decimation)
+
+    def accept(self, msg_type, data, pos):
+        """判断是否转发一条报文
+
+        Args:
+            msg_type (int): 报文类型
+            data (bytearray): 报文所在的缓冲区
+            pos (int): 报文在 data 中的位置
+
+        Returns:
+            return (bool): 是否转发
+        """
+        action = self.table[msg_type]
+        if action != A_RULE:
+            return action == A_PASS
+
+        interval = self.intervals.get(msg_type)
+        if interval is not None:
+            now = time.monotonic()
+            last = self.last_forward.get(msg_type)
+            if last is not None and now - last < interval:
+                return False
+            self.last_forward[msg_type] = now
+            return True
+
+        # 星历版本号
+        sat_bits, issue_pos, issue_bits = EPHEMERIS_ISSUE_BITS[msg_type]
+        sat_id = get_bits(data, (pos + 3) * 8 + 12, sat_bits)
+        issue = get_bits(data, (pos + 3) * 8 + 12 + issue_pos, issue_bits)
+        if self.last_issue.get((msg_type, sat_id)) == issue:
+            return False
+        self.last_issue[(msg_type, sat_id)] = issue
+        return True
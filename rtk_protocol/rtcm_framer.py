@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : rtcm_framer.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : 把任意切分的 rtcm 数据流切分为完整的报文
+#
+
+from rtk_protocol.rtcm_util import iter_frames
+
+
+class RtcmFramer:
+    """把任意切分的 rtcm 数据流切分为完整的报文
+
+    不解析报文直接转发时，收到的数据是 TCP 的任意片段，报文可能跨越多个片段。
+    切分后写入 ring 的每个数据包都从报文边界开始，客户端跳过数据时不会收到半条报文。
+    未接收完的报文留到下次；无法解析的数据不丢弃，单独作为一个数据包原样转发。
+    """
+
+    def __init__(self):
+        """构造函数"""
+        self.pending = bytearray()      # 未接收完的报文
+
+    def split(self, data):
+        """切分收到的数据
+
+        没有未接收完的报文、且 data 恰好是一条报文时 (已解析过的报文、逐条发送的基站) 直接返回，
+        只检查长度，不重复计算 CRC。
+
+        Args:
+            data (bytes): 收到的数据
+
+        Returns:
+            return (list[bytes]): 完整的报文，以及无法解析的数据
+        """
+        if len(self.pending) == 0 and len(data) >= 6 and data[0] == 0xd3 \
+                and ((data[1] & 0b11) << 8) + data[2] + 6 == len(data):
+            return [data]
+        self.pending += data
+        buffer = self.pending
+        packets = []
+        pos = 0     # 已处理到的位置
+        for index, len_message, msg_type in iter_frames(buffer):
+            if index > pos:
+                packets.append(bytes(buffer[pos:index]))
+            if len_message > 0:
+                packets.append(bytes(buffer[index:index + len_message]))
+                pos = index + len_message
+            else:
+                pos = index
+        del buffer[:pos]
+        return packets
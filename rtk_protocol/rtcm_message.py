@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : rtcm_message.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : 按需解析 rtcm 报文头
+#
+
+from rtk_protocol.rtcm_util import get_bits, get_signed_bits
+
+# MSM 报文类型的十位 -> 卫星系统
+MSM_GNSS = {7: 'GPS', 8: 'GLONASS', 9: 'Galileo', 10: 'SBAS', 11: 'QZSS', 12: 'BDS', 13: 'NavIC'}
+
+# 以下位置都从报文内容开始算起，不含 3 字节帧头
+STATION_ID_POS = 12
+EPOCH_TIME_POS = 24
+MSM_SAT_MASK_POS = 73
+MSM_SIG_MASK_POS = 137
+MSM_CELL_MASK_POS = 169
+
+
+class RtcmMessage:
+    """一条完整 rtcm 报文的视图
+
+    不拷贝报文，各字段在访问时才从缓冲区中解析。
+    构造后缓冲区中对应的数据不能被修改。
+    """
+
+    __slots__ = ('data', 'pos', '_satellites', '_signals')
+
+    def __init__(self, data, pos=0):
+        """构造函数
+
+        Args:
+            data (bytes): 报文所在的缓冲区，可以是任意 bytes-like 对象
+            pos (int): 报文在 data 中的位置，即引导字 0xd3 的位置
+        """
+        self.data = data
+        self.pos = pos
+        self._satellites = None
+        self._signals = None
+
+    def get_bits(self, pos, length):
+        """取出报文内容中的无符号整数
+
+        Args:
+            pos (int): 起始 bit 的位置，不含帧头
+            length (int): bit 数
+
+        Returns:
+            return (int): 无符号整数
+        """
+        return get_bits(self.data, (self.pos + 3) * 8 + pos, length)
+
+    @property
+    def length(self):
+        """含帧头、CRC 的报文总长度"""
+        return ((self.data[self.pos + 1] & 0b11) << 8) + self.data[self.pos + 2] + 6
+
+    @property
+    def msg_type(self):
+        """报文类型"""
+        return self.get_bits(0, 12)
+
+    @property
+    def is_msm(self):
+        """是否为 MSM1~7 报文"""
+        msg_type = self.msg_type
+        return 1071 <= msg_type <= 1137 and 1 <= msg_type % 10 <= 7
+
+    @property
+    def msm_level(self):
+        """MSM 报文的等级 1~7, 其他报文为 None"""
+        return self.msg_type % 10 if self.is_msm else None
+
+    @property
+    def gnss(self):
+        """MSM 报文的卫星系统，其他报文为 None"""
+        return MSM_GNSS.get(self.msg_type // 10 - 100) if self.is_msm else None
+
+    @property
+    def station_id(self):
+        """基站 ID, 没有该字段的报文为 None"""
+        msg_type = self.msg_type
+        if self.is_msm or 1001 <= msg_type <= 1012 or msg_type in (1005, 1006, 1007, 1008, 1033, 1230):
+            return self.get_bits(STATION_ID_POS, 12)
+        return None
+
+    @property
+    def epoch_time(self):
+        """观测报文的历元时间 (ms), 其他报文为 None
+
+        GPS 等为周内秒，GLONASS 为日内秒，不含 GLONASS MSM 中的星期。
+        """
+        msg_type = self.msg_type
+        if 1009 <= msg_type <= 1012:
+            return self.get_bits(EPOCH_TIME_POS, 27)
+        if self.is_msm and self.gnss == 'GLONASS':
+            # 3 bit 星期 + 27 bit 日内秒
+            return self.get_bits(EPOCH_TIME_POS + 3, 27)
+        if self.is_msm or 1001 <= msg_type <= 1004:
+            return self.get_bits(EPOCH_TIME_POS, 30)
+        return None
+
+    @property
+    def multiple_message(self):
+        """观测报文的同步标志，为 True 时同一历元还有后续观测报文。其他报文为 None"""
+        msg_type = self.msg_type
+        if 1009 <= msg_type <= 1012:
+            return self.get_bits(EPOCH_TIME_POS + 27, 1) == 1
+        if self.is_msm or 1001 <= msg_type <= 1004:
+            return self.get_bits(EPOCH_TIME_POS + 30, 1) == 1
+        return None
+
+    @property
+    def satellites(self):
+        """MSM 报文中的卫星号列表 (从 1 开始), 其他报文为 None"""
+        if self._satellites is None and self.is_msm:
+            mask = self.get_bits(MSM_SAT_MASK_POS, 64)
+            self._satellites = [i + 1 for i in range(64) if mask & (1 << (63 - i))]
+        return self._satellites
+
+    @property
+    def signals(self):
+        """MSM 报文中的信号号列表 (从 1 开始), 其他报文为 None"""
+        if self._signals is None and self.is_msm:
+            mask = self.get_bits(MSM_SIG_MASK_POS, 32)
+            self._signals = [i + 1 for i in range(32) if mask & (1 << (31 - i))]
+        return self._signals
+
+    @property
+    def cells(self):
+        """MSM 报文中有观测值的 (卫星号, 信号号) 列表, 其他报文为 None"""
+        satellites = self.satellites
+        if satellites is None:
+            return None
+        signals = self.signals
+        count = len(satellites) * len(signals)
+        if count == 0:
+            return []
+        mask = self.get_bits(MSM_CELL_MASK_POS, count)
+        return [(sat, sig) for i, (sat, sig) in enumerate((sat, sig) for sat in satellites for sig in signals)
+                if mask & (1 << (count - 1 - i))]
+
+    @property
+    def arp(self):
+        """1005, 1006 报文中天线参考点的 ECEF 坐标 (m), 其他报文为 None
+
+        Returns:
+            return (tuple[float]): (x, y, z)
+        """
+        if self.msg_type not in (1005, 1006):
+            return None
+        return tuple(get_signed_bits(self.data, (self.pos + 3) * 8 + pos, 38) * 0.0001 for pos in (34, 74, 114))
+
+    @property
+    def antenna_height(self):
+        """1006 报文中的天线高 (m), 其他报文为 None"""
+        if self.msg_type != 1006:
+            return None
+        return self.get_bits(152, 16) * 0.0001
@@ -6,40 +6,62 @@
 # Description   :
 #
 
+from rtk_protocol.crc24q import crc24q
+
 try:
     import crcmod
     crc24q_func = crcmod.mkCrcFun(0b1100001100100110011111011, initCrc=0, rev=False)
 except ImportError:
-    print('Warning: failed to import crcmod.')
-    crc24q_func = None
+    # 没有 crcmod 时使用查表法
+    crc24q_func = crc24q
 
 
-def try_parse(data):
-    """从头开始，逐字节尝试解析
+def iter_frames(data, start=0, end=None):
+    """单次扫描 data[start:end]，逐个找出完整的 rtcm 报文
 
-    Args:
-        data (list): 要解析的数据
+    用 find 查找引导字 0xd3，校验失败时从下一个 0xd3 继续，因此对任意数据都是线性时间。
 
-    Returns:
-        index (int): 尝试到的位置
-        len_message (int): 报文总长度，-1表示没有报文，-2表示报文未完
-        msg_type (int): 报文类型
+    Args:
+        data (bytearray): 要解析的数据，需支持 find，如 bytes, bytearray
+        start (int): 开始位置
+        end (int): 结束位置, None 表示到末尾
+
+    Yields:
+        index (int): 报文在 data 中的位置
+        len_message (int): 报文总长度。最后一项为 -1 表示 index 之前的数据都已处理，
+            为 -2 表示从 index 开始可能是一条未接收完的报文
+        msg_type (int): 报文类型，最后一项为 -1
     """
-    for i in range(0, len(data) - 1):
-        len_message = try_parse_from_begin(data[i:])
-        if len_message > 0 and i + len_message <= len(data):
-            msg_type = get_msg_type(data[i+3:])
-            return i, len_message, msg_type
-        if len_message == -2:   # 报文未完，不能删除
-            return 0, len_message, -1
-    return len(data), -1, -1
-
-
-def try_parse_from_begin(data):
-    """从 data 首字节开始解析
+    if end is None:
+        end = len(data)
+    view = memoryview(data)
+    try:
+        pos = start
+        while True:
+            pos = data.find(b'\xd3', pos, end)
+            if pos < 0:
+                yield end, -1, -1
+                return
+            len_message = check_frame(view, pos, end)
+            if len_message > 0:
+                yield pos, len_message, get_msg_type(view[pos + 3:pos + 5])
+                pos += len_message
+            elif len_message == -2:
+                yield pos, -2, -1
+                return
+            else:
+                pos += 1
+    finally:
+        view.release()
+
+
+def check_frame(data, pos, end):
+    """检查从 data[pos] 开始是否为一条完整的 rtcm 报文
 
     Args:
-        data (list): 要解析的数据
+        data (memoryview): 要解析的数据
+        pos (int): 报文起始位置，应为引导字 0xd3
+        end (int): 数据结束位置
 
     Returns:
         return (int):
@@ -49,74 +71,109 @@ def try_parse_from_begin(data):
     """
 
     # 检查引导字和保留字
-    if (len(data) < 3) or (data[0] != 0xd3) or (data[1] & 0b11111100 != 0x0):
+    if end - pos < 3:
+        return -2
+    if (data[pos] != 0xd3) or (data[pos + 1] & 0b11111100 != 0x0):
         return -1
 
     # 报文长度
-    len_rtcm = (data[1] & 0b11) * 0x100 + data[2]
+    len_rtcm = (data[pos + 1] & 0b11) * 0x100 + data[pos + 2]
     len_full_message = len_rtcm + 3 + 3     # 加上引导字、保留字、校验后的总长度
     if len_rtcm <= 0:
         return -1
-    elif len_full_message > len(data):
+    elif pos + len_full_message > end:
         return -2
 
     # 校验
-    message = data[0:3+len_rtcm]
-    crc_from_message = int.from_bytes(data[3+len_rtcm:3+len_rtcm+3], 'big')
+    message = data[pos:pos + 3 + len_rtcm]
+    crc_from_message = int.from_bytes(data[pos + 3 + len_rtcm:pos + len_full_message], 'big')
 
     # 计算 CRC
-    if crc24q_func is not None:
-        crc = crc24q_func(bytes(message))
-    else:
-        message_binary = ''.join(['{0:08b}'.format(x) for x in message])
-        crc = int(get_crc(message_binary), 2)
-
-    if crc != crc_from_message:
+    if crc24q_func(bytes(message)) != crc_from_message:
         return -1
 
     return len_full_message
 
 
-def get_crc(msg, div='1100001100100110011111011', code='0'*24):
-    """Cyclic Redundancy Check
+def get_msg_type(msg):
+    """判断报文类型
+
+    Args:
+        msg (list): 待解析消息
+
+    Returns:
+        msg_type (int): 消息类型
+    """
+    msg_type = (msg[0] << 4) + ((msg[1] & 0xF0) >> 4)
+    return msg_type
+
+
+def get_bits(data, pos, length):
+    """取出大端序的若干 bit
+
+    Args:
+        data (bytes): 数据，可以是任意 bytes-like 对象
+        pos (int): 起始 bit 的位置
+        length (int): bit 数
+
+    Returns:
+        return (int): 无符号整数
+    """
+    first = pos // 8
+    last = (pos + length - 1) // 8
+    value = int.from_bytes(data[first:last + 1], 'big')
+    return (value >> ((last + 1) * 8 - pos - length)) & ((1 << length) - 1)
+
 
-    https://gist.github.com/evansneath/4650991
+def get_signed_bits(data, pos, length):
+    """取出大端序、补码表示的若干 bit
 
     Args:
-        msg (str): 需要校验的信息
-        div (str): 生成多项式
-        code (str): 需要校验的信息
+        data (bytes): 数据，可以是任意 bytes-like 对象
+        pos (int): 起始 bit 的位置
+        length (int): bit 数
 
     Returns:
-        return (str): CRC码，默认使用 CRC-24Q 方法
+        return (int): 有符号整数
     """
-    # Append the code to the message. If no code is given, default to '000'
-    msg += code
+    value = get_bits(data, pos, length)
+    if value & (1 << (length - 1)):
+        value -= 1 << length
+    return value
+
+
+def is_single_frame(data):
+    """判断 data 是否恰好是一条 rtcm 报文，只检查引导字和长度，不计算 CRC
 
-    # Convert msg and div into list form for easier handling
-    msg = list(msg)
-    div = list(div)
+    Args:
+        data (bytes): 数据
 
-    # Loop over every message bit (minus the appended code)
-    for i in range(len(msg)-len(code)):
-        # If that message bit is 1, perform modulo 2 multiplication
-        if msg[i] == '1':
-            for j in range(len(div)):
-                # Perform modulo 2 multiplication on each index of the divisor
-                msg[i+j] = str((int(msg[i+j])+int(div[j]))%2)
+    Returns:
+        return (bool): 是否为单条报文
+    """
+    return len(data) >= 6 and data[0] == 0xd3 and ((data[1] & 0b11) << 8) + data[2] + 6 == len(data)
 
-    # Output the last error-checking code portion of the message generated
-    return ''.join(msg[-len(code):])
 
+def get_sync_flag(data):
+    """取出观测报文的同步标志 (multiple message bit)
 
-def get_msg_type(msg):
-    """判断报文类型
+    MSM 报文以及 1001~1004, 1009~1012 报文中有同步标志，
+    为 1 时表示同一历元还有后续的观测报文，为 0 时表示该历元的观测报文已发送完毕。
+    基站信息、星历等其他报文不属于某个历元，没有同步标志。
 
     Args:
-        msg (list): 待解析消息
+        data (bytes): 完整的 rtcm 报文
 
     Returns:
-        msg_type (int): 消息类型
+        return (bool): 同步标志，不是观测报文 (或不是单条报文) 时为 None
     """
-    msg_type = (msg[0] << 4) + ((msg[1] & 0xF0) >> 4)
-    return msg_type
+    if len(data) < 12 or not is_single_frame(data):
+        return None
+    msg_type = get_msg_type(data[3:])
+    if (1071 <= msg_type <= 1137 and 1 <= msg_type % 10 <= 7) or 1001 <= msg_type <= 1004:
+        sync_bit = 54   # 12 bit 类型, 12 bit 基站 ID, 30 bit 历元时间
+    elif 1009 <= msg_type <= 1012:
+        sync_bit = 51   # GLONASS 历元时间为 27 bit
+    else:
+        return None
+    return data[3 + sync_bit // 8] & (0x80 >> (sync_bit % 8)) != 0
@@ -3,19 +3,102 @@
 # File          : select_protocol.py
 # Author        : bssthu
 # Project       : rtk_trans
-# Description   : 编辑本文件，根据 config 决定使用的协议解析工具
+# Description   : 根据 config 中的 protocol 选择协议解析工具
 #
 
-from rtk_protocol.base_protocol_handler import BaseProtocolHandler
+import importlib
+
+# 内置的协议解析工具，名称 -> '模块:类'。首次使用时才导入
+BUILTIN_PROTOCOLS = {
+    'rtcm3': 'rtk_protocol.base_protocol_handler:BaseProtocolHandler',
+    'raw': 'rtk_protocol.raw_protocol_handler:RawProtocolHandler',
+    'nmea': 'rtk_protocol.nmea_protocol_handler:NmeaProtocolHandler',
+    'ubx': 'rtk_protocol.ubx_protocol_handler:UbxProtocolHandler',
+}
+DEFAULT_PROTOCOL = 'rtcm3'
+# 其他 python 包可以通过这个 entry point 组注册协议解析工具
+ENTRY_POINT_GROUP = 'rtk_trans.protocols'
+
+protocol_classes = {}   # 已导入的协议解析类
+entry_point_cache = None    # 已安装的包注册的协议解析工具，查找一次后缓存
+
+
+def get_entry_points():
+    """查找已安装的包注册的协议解析工具，不导入
+
+    需要扫描所有已安装的包，较慢。检查每个 entry 的配置时都会调用，因此只查找一次。
+
+    Returns:
+        return (dict[str, importlib.metadata.EntryPoint]): 名称 -> entry point
+    """
+    global entry_point_cache
+    if entry_point_cache is None:
+        try:
+            from importlib.metadata import entry_points
+        except ImportError:
+            entry_point_cache = {}
+            return entry_point_cache
+        eps = entry_points()
+        if hasattr(eps, 'select'):
+            eps = eps.select(group=ENTRY_POINT_GROUP)
+        else:
+            eps = eps.get(ENTRY_POINT_GROUP, [])    # python < 3.10
+        entry_point_cache = {ep.name.lower(): ep for ep in eps}
+    return entry_point_cache
+
+
+def get_protocol_names():
+    """所有可用的协议名
+
+    Returns:
+        return (list[str]): 协议名
+    """
+    return sorted(set(BUILTIN_PROTOCOLS.keys()) | set(get_entry_points().keys()) | set(protocol_classes.keys()))
+
+
+def register_protocol(name, handler_class):
+    """注册协议解析类
+
+    Args:
+        name (str): 协议名
+        handler_class (type): 协议解析类，构造函数的参数为 config (dict)
+    """
+    protocol_classes[name.lower()] = handler_class
+
+
+def load_protocol(name):
+    """获取协议解析类，首次使用时导入
+
+    Args:
+        name (str): 协议名
+
+    Returns:
+        return (type): 协议解析类
+    """
+    name = name.lower()
+    if name not in protocol_classes:
+        if name in BUILTIN_PROTOCOLS:
+            module_name, class_name = BUILTIN_PROTOCOLS[name].split(':')
+            protocol_classes[name] = getattr(importlib.import_module(module_name), class_name)
+        else:
+            eps = get_entry_points()
+            if name not in eps:
+                raise Exception('Unrecognized protocol "%s". Should be one of %s.' % (name, get_protocol_names()))
+            protocol_classes[name] = eps[name].load()
+    return protocol_classes[name]
 
 
 def select_protocol(config):
     """根据配置选择协议解析类
 
+    协议解析工具需实现 push_back, handshake, get_parsed_data_list，
+    以及 passthrough 属性: 为 True 时，握手后收到的数据不经解析直接转发，不拷贝到解析工具中。
+
     Args:
         config (dict): 配置
 
     Returns:
         return (BaseProtocolHandler): 协议解析工具的实例
     """
-    return BaseProtocolHandler(config)
+    name = config.get('protocol') or DEFAULT_PROTOCOL
+    return load_protocol(name)(config)
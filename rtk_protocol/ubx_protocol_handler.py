@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : ubx_protocol_handler.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   :
+#
+
+from rtk_protocol.base_data_handler import BaseDataHandler
+from rtk_utils import log
+
+UBX_SYNC = b'\xb5\x62'
+
+
+class UbxProtocolHandler(BaseDataHandler):
+    """解析 u-blox UBX 二进制报文，只转发校验和正确的完整报文"""
+
+    def __init__(self, config):
+        """构造函数
+
+        Args:
+            config (dict): 配置
+        """
+        super().__init__()
+        self.config = config
+        self.passthrough = False
+
+    def handshake(self):
+        """不需要握手"""
+        return True
+
+    def get_parsed_data_list(self):
+        """解析数据
+
+        Returns:
+            return (list[bytes]): 完整的 UBX 报文
+        """
+        parsed_data_list = []
+        buffer = self.data.buffer
+        pos = self.data.start
+        while True:
+            start = buffer.find(UBX_SYNC, pos)
+            if start < 0:
+                # 最后一个字节可能是同步字的开头
+                pos = max(pos, len(buffer) - 1)
+                break
+            if len(buffer) - start < 8:
+                pos = start
+                break
+            len_message = buffer[start + 4] + (buffer[start + 5] << 8) + 8
+            if len(buffer) - start < len_message:
+                pos = start
+                break
+            if get_checksum(buffer, start + 2, start + len_message - 2) == bytes(buffer[start + len_message - 2:
+                                                                                       start + len_message]):
+                parsed_data_list.append(bytes(buffer[start:start + len_message]))
+                pos = start + len_message
+            else:
+                log.debug('ubx: bad checksum')
+                pos = start + 1
+        self.data.consume(pos - self.data.start)
+        return parsed_data_list
+
+
+def get_checksum(data, start, end):
+    """8-bit Fletcher 校验
+
+    Args:
+        data (bytearray): 数据
+        start (int): 校验范围的起点
+        end (int): 校验范围的终点
+
+    Returns:
+        return (bytes): CK_A, CK_B
+    """
+    ck_a = 0
+    ck_b = 0
+    for b in data[start:end]:
+        ck_a = (ck_a + b) & 0xff
+        ck_b = (ck_b + ck_a) & 0xff
+    return bytes((ck_a, ck_b))
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : broadcast_ring.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   :
+#
+
+import bisect
+import collections
+import threading
+import time
+
+RING_SIZE = 262144
+
+
+class BroadcastRing:
+    """向所有客户端广播数据的环形缓冲区
+
+    每个数据包 (一般为一条完整的 rtcm 报文) 只写入一次，各客户端只保存自己的读位置 (cursor)。
+    cursor 为自开始写入以来的绝对偏移，小于 head 的数据已被覆盖。
+    同时记录每个数据包的接收时间，以及每个历元的起点，用于以历元为单位丢弃数据。
+    """
+
+    def __init__(self, capacity=RING_SIZE):
+        """构造函数
+
+        Args:
+            capacity (int): 缓冲区大小 (bytes)
+        """
+        self.capacity = capacity
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.frames = collections.deque()   # 各数据包的 (起点, 终点)
+        self.frame_times = {}               # 数据包起点 -> 接收时间
+        self.epoch_starts = collections.deque()     # 各历元的起点
+        self.epoch_times = collections.deque()      # 各历元的接收时间
+        self.head = 0       # 最旧的数据包的起点
+        self.tail = 0       # 写入位置
+        self.lock = threading.RLock()       # thread 模式下，写入与各 SenderThread 的读取不在同一线程
+
+    def append(self, data, rcv_time=None, epoch_start=True):
+        """写入一个数据包，必要时覆盖最旧的数据包
+
+        Args:
+            data (bytes): 数据包
+            rcv_time (float): 接收时间 (time.perf_counter), None 表示当前时间
+            epoch_start (bool): 是否为新历元的第一个数据包
+
+        Returns:
+            return (bool): 是否写入成功，数据包比缓冲区还大时失败
+        """
+        len_data = len(data)
+        if len_data <= 0 or len_data > self.capacity:
+            return False
+        if rcv_time is None:
+            rcv_time = time.perf_counter()
+        with self.lock:
+            # 覆盖旧的数据包
+            while self.tail + len_data - self.head > self.capacity:
+                start, end = self.frames.popleft()
+                del self.frame_times[start]
+                self.head = end
+            while len(self.epoch_starts) > 0 and self.epoch_starts[0] < self.head:
+                self.epoch_starts.popleft()
+                self.epoch_times.popleft()
+            # 写入，可能分为两段
+            pos = self.tail % self.capacity
+            len_first = min(len_data, self.capacity - pos)
+            self.buffer[pos:pos + len_first] = data[:len_first]
+            if len_first < len_data:
+                self.buffer[:len_data - len_first] = data[len_first:]
+            self.frames.append((self.tail, self.tail + len_data))
+            self.frame_times[self.tail] = rcv_time
+            if epoch_start:
+                self.epoch_starts.append(self.tail)
+                self.epoch_times.append(rcv_time)
+            self.tail += len_data
+        return True
+
+    def is_boundary(self, cursor):
+        """cursor 是否位于数据包的边界上
+
+        Args:
+            cursor (int): 读位置
+
+        Returns:
+            return (bool): 是否位于边界
+        """
+        return cursor == self.tail or cursor in self.frame_times
+
+    def find_epoch(self, min_start, min_rcv_time):
+        """查找满足条件的第一个历元的起点
+
+        Args:
+            min_start (int): 历元起点不小于此值
+            min_rcv_time (float): 历元的接收时间不早于此值
+
+        Returns:
+            return (int): 历元起点，没有满足条件的历元时返回 tail
+        """
+        with self.lock:
+            index = max(bisect.bisect_left(self.epoch_starts, min_start),
+                        bisect.bisect_left(self.epoch_times, min_rcv_time))
+            if index < len(self.epoch_starts):
+                return self.epoch_starts[index]
+            return self.tail
+
+    def get_views(self, cursor, max_size=None):
+        """获取 cursor 之后的数据，不拷贝
+
+        调用者需保证 head <= cursor <= tail，且在使用完返回值之前不会有新的写入 (持有 lock)。
+
+        Args:
+            cursor (int): 读位置
+            max_size (int): 最多获取的数据长度, None 表示不限
+
+        Returns:
+            return (list[memoryview]): 数据，环绕时分为两段
+        """
+        len_data = self.tail - cursor
+        if max_size is not None:
+            len_data = min(len_data, max_size)
+        if len_data <= 0:
+            return []
+        pos = cursor % self.capacity
+        len_first = min(len_data, self.capacity - pos)
+        views = [self.view[pos:pos + len_first]]
+        if len_first < len_data:
+            views.append(self.view[:len_data - len_first])
+        return views
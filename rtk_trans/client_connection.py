@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : client_connection.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   :
+#
+
+import selectors
+import socket
+import time
+
+from rtk_trans.link_compression import LINK_ACK, LINK_HELLO, LinkCompressor
+from rtk_utils import log
+
+UPLINK_BUFFER_SIZE = 256
+HANDOFF_SEND_TIMEOUT = 3    # 移交前向所有客户端发送完 ring 中剩余数据的总超时 (s)
+
+
+class ClientConnection:
+    """由 ServerThread 的事件循环统一管理的客户端连接
+
+    socket 为非阻塞，读写均由 selector 的事件驱动，直接发送 ring 的 memoryview，不需要拷贝。
+    select 模式下由 ServerThread 统一管理；thread 模式下由 SenderThread 在各自的线程中管理，
+    此时发送期间持有 ring.lock，防止数据被同时覆盖。
+    """
+
+    def __init__(self, client_socket, address, _id, selector, ring, max_coalesce_size, policy, snapshot,
+                 link_compression=False):
+        """构造函数
+
+        Args:
+            client_socket (socket.socket): 与客户端通信的 socket
+            address (tuple[str, int]): 客户端地址
+            _id (int): 连接的 ID
+            selector (selectors.BaseSelector): 所属事件循环的 selector
+            ring (BroadcastRing): 待分发数据所在的缓冲区
+            max_coalesce_size (int): 每次写 socket 的最大长度
+            policy (ClientPolicy): 慢客户端的处理策略
+            snapshot (bytes): 连接建立后首先发送的缓存报文
+            link_compression (bool): 客户端 (下游的 rtk_trans) 请求时，是否压缩发送的数据
+        """
+        self.client_socket = client_socket
+        self.address = address
+        self.sender_id = _id
+        self.selector = selector
+        self.ring = ring
+        self.max_coalesce_size = max_coalesce_size
+        self.policy = policy
+        self.snapshot = memoryview(snapshot) if len(snapshot) > 0 else None
+        self.cursor = ring.tail     # 只发送连接建立之后的数据
+        self.in_frame = False
+        self.send_count = 0
+        self.sent_bytes = 0
+        self.first_send_time = 0    # 第一次发送完 ring 中数据的时间 (time.time)
+        self.drop_count = 0
+        self.drop_bytes = 0
+        self.uplink_buffer = bytearray()    # 来自客户端的不完整的一行
+        self.last_gga = None                # 客户端最近上传的 GGA 语句
+        self.link_compression = link_compression
+        self.compress_requested = False     # 收到 LINK_HELLO, 等待数据包边界
+        self.compressor = None
+        self.out_buffer = bytearray()       # 压缩链路中待发送的数据
+        self.detaching = False              # 移交给新的进程，关闭时不关闭 socket
+        self.running = True
+
+        self.client_socket.setblocking(False)
+        self.selector.register(self.client_socket, selectors.EVENT_READ, self.handle_event)
+        log.info('client connection %d: start, %s' % (self.sender_id, self.address))
+
+    def handle_event(self, mask):
+        """selector 事件回调
+
+        Args:
+            mask (int): 就绪的事件
+        """
+        if mask & selectors.EVENT_READ:
+            self.receive_data()
+        if self.running and mask & selectors.EVENT_WRITE:
+            self.send_data()
+
+    def receive_data(self):
+        """接收来自客户端的数据，只保留其中的 GGA 语句"""
+        try:
+            rcv_buf = self.client_socket.recv(UPLINK_BUFFER_SIZE)
+            if len(rcv_buf) == 0:
+                log.info('client connection %d has disconnected.' % self.sender_id)
+                self.disconnect()
+            else:
+                self.parse_uplink(rcv_buf)
+                if self.compress_requested:
+                    self.send_data()    # 尽快回复 LINK_ACK
+        except (BlockingIOError, InterruptedError):
+            pass
+        except Exception as e:
+            log.error('client connection %d error: %s' % (self.sender_id, e))
+            self.disconnect()
+
+    def parse_uplink(self, data):
+        """从客户端上传的数据中找出 GGA 语句，以及压缩链路的请求
+
+        Args:
+            data (bytes): 收到的数据
+        """
+        self.uplink_buffer += data
+        lines = self.uplink_buffer.split(b'\n')
+        self.uplink_buffer = lines.pop()[-UPLINK_BUFFER_SIZE:]  # 不完整的一行，留到下次
+        for line in lines:
+            line = line.strip()
+            if line.startswith(b'$') and line[3:6] == b'GGA':
+                self.last_gga = line.decode('ascii', errors='ignore')
+            elif line == LINK_HELLO.strip() and self.link_compression and self.compressor is None:
+                self.compress_requested = True
+
+    def send_data(self):
+        """尽可能多地发送 cursor 之后的数据，socket 缓冲区满时等待 EVENT_WRITE"""
+        with self.ring.lock:
+            self.send_data_locked()
+        if self.running:
+            self.update_events()
+
+    def send_data_locked(self):
+        """send_data 的实现，调用者持有 ring.lock"""
+        cursor = self.policy.apply(self.ring, self.cursor)
+        if cursor is None:
+            log.info('client connection %d: too slow, disconnect.' % self.sender_id)
+            self.disconnect()
+            return
+        if cursor < self.ring.head:
+            # 落后太多，未发送的数据已被覆盖，从仍在 ring 中的第一个历元继续发送
+            if self.in_frame:
+                log.info('client connection %d: too slow, drop.' % self.sender_id)
+                self.disconnect()
+                return
+            cursor = self.ring.find_epoch(self.ring.head, 0)
+        if cursor > self.cursor:
+            self.drop(cursor - self.cursor)
+            self.cursor = cursor
+        try:
+            while self.snapshot is not None:
+                sent = self.client_socket.send(self.snapshot)
+                self.sent_bytes += sent
+                self.snapshot = self.snapshot[sent:] if sent < len(self.snapshot) else None
+            if self.compress_requested and self.ring.is_boundary(self.cursor):
+                # 之后的数据均压缩
+                self.compress_requested = False
+                self.compressor = LinkCompressor()
+                self.out_buffer += LINK_ACK
+                log.info('client connection %d: compressed link.' % self.sender_id)
+            if self.compressor is not None:
+                self.send_compressed()
+            while self.compressor is None and self.cursor < self.ring.tail:
+                # 环绕时的两段数据合并为一次 sendmsg
+                views = self.ring.get_views(self.cursor, self.max_coalesce_size)
+                len_views = sum(len(view) for view in views)
+                sent = send_views(self.client_socket, views)
+                self.cursor += sent
+                self.sent_bytes += sent
+                if sent < len_views:
+                    break
+                self.send_count += 1
+                if self.first_send_time == 0:
+                    self.first_send_time = time.time()
+        except (BlockingIOError, InterruptedError):
+            pass
+        except Exception as e:
+            log.error('client connection %d error: %s' % (self.sender_id, e))
+            self.disconnect()
+        # 只发送了数据包的一部分时，剩下的部分不能被跳过
+        self.in_frame = not self.ring.is_boundary(self.cursor)
+
+    def send_compressed(self):
+        """压缩 cursor 之后的数据并发送，追上 ring.tail 时 flush"""
+        while True:
+            if len(self.out_buffer) == 0:
+                if self.cursor >= self.ring.tail:
+                    break
+                views = self.ring.get_views(self.cursor, self.max_coalesce_size)
+                self.cursor += sum(len(view) for view in views)
+                self.out_buffer += self.compressor.compress(views, self.cursor == self.ring.tail)
+                continue
+            sent = self.client_socket.send(self.out_buffer)
+            del self.out_buffer[:sent]
+            self.sent_bytes += sent
+            if len(self.out_buffer) > 0:
+                break
+            self.send_count += 1
+            if self.first_send_time == 0:
+                self.first_send_time = time.time()
+
+    def get_link_string(self):
+        """压缩链路的统计，用于显示
+
+        Returns:
+            return (str): 压缩率和耗时，未压缩时为空
+        """
+        return ', ' + self.compressor.get_stats_string() if self.compressor is not None else ''
+
+    def drop(self, len_drop):
+        """记录丢弃的数据
+
+        Args:
+            len_drop (int): 丢弃的数据长度
+        """
+        self.drop_count += 1
+        self.drop_bytes += len_drop
+        log.debug('client connection %d: skip %d bytes.' % (self.sender_id, len_drop))
+
+    def has_pending_data(self):
+        """是否有未发送完的数据
+
+        Returns:
+            return (bool): 是否有未发送完的数据
+        """
+        return self.snapshot is not None or self.cursor < self.ring.tail or len(self.out_buffer) > 0
+
+    def update_events(self):
+        """有数据待发送时才关注 EVENT_WRITE"""
+        events = selectors.EVENT_READ
+        if self.has_pending_data():
+            events |= selectors.EVENT_WRITE
+        if self.selector.get_key(self.client_socket).events != events:
+            self.selector.modify(self.client_socket, events, self.handle_event)
+
+    def detach(self, deadline):
+        """停止发送并取出 socket, 用于移交给新的进程
+
+        先以阻塞方式发送完 ring 中剩余的数据，新的进程从数据包边界处继续发送，客户端不会丢失数据。
+        thread 模式下需在 SenderThread 退出后调用。
+
+        Args:
+            deadline (float): 发送剩余数据的最迟时间 (time.time), 各客户端共用，之后仍未发送完的客户端断开
+
+        Returns:
+            return (socket.socket): 与客户端通信的 socket, 无法移交时 (压缩链路、发送失败等) 关闭并返回 None
+        """
+        self.detaching = True
+        self.disconnect()
+        try:
+            if self.compressor is not None:
+                raise Exception('compressed link')
+            with self.ring.lock:
+                if self.snapshot is not None:
+                    self.send_before(self.snapshot, deadline)
+                    self.snapshot = None
+                if self.cursor < self.ring.head:
+                    raise Exception('data overwritten')
+                for view in self.ring.get_views(self.cursor):
+                    self.send_before(view, deadline)
+                    self.sent_bytes += len(view)
+                self.cursor = self.ring.tail
+            return self.client_socket
+        except Exception as e:
+            log.info('client connection %d: failed to detach: %s' % (self.sender_id, e))
+            self.detaching = False
+            self.close()
+            return None
+
+    def send_before(self, data, deadline):
+        """以阻塞方式发送数据，到 deadline 时仍未发送完则抛出异常
+
+        已过 deadline 时以非阻塞方式发送，发送缓冲区放得下时仍然成功，不因前面的慢客户端而断开。
+        """
+        self.client_socket.settimeout(max(0, deadline - time.time()))
+        self.client_socket.sendall(data)
+
+    def disconnect(self):
+        """断开连接"""
+        if not self.running:
+            return
+        self.running = False
+        self.close()
+
+    def close(self):
+        """从 selector 中移除并关闭 socket"""
+        try:
+            self.selector.unregister(self.client_socket)
+        except (KeyError, ValueError):
+            pass
+        if self.detaching:
+            log.info('client connection %d: detached' % self.sender_id)
+            return
+        try:
+            self.client_socket.close()
+        except socket.error:
+            pass
+        except Exception as e:
+            log.error('client connection %d exception when close: %s' % (self.sender_id, e))
+        log.info('client connection %d: bye' % self.sender_id)
+
+
+def send_views(sock, views):
+    """用一次系统调用发送多段数据 (scatter/gather)
+
+    Args:
+        sock (socket.socket): socket
+        views (list[memoryview]): 要发送的数据
+
+    Returns:
+        return (int): 实际发送的长度
+    """
+    if len(views) == 1:
+        return sock.send(views[0])
+    elif hasattr(sock, 'sendmsg'):
+        return sock.sendmsg(views)
+    else:
+        return sock.send(b''.join(views))   # Windows 没有 sendmsg
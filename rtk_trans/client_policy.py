@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : client_policy.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   :
+#
+
+import time
+
+from rtk_utils.config_loader import Entry
+
+
+class ClientPolicy:
+    """慢客户端的处理策略
+
+    客户端待发送的数据超过字节上限，或最旧的待发送数据超过时间上限时，
+    丢弃最旧的若干个完整历元，或直接断开连接。
+    只发送了一部分的数据包总是会发送完毕，因此客户端不会收到不完整的报文。
+    """
+
+    A_DROP_OLDEST = 'dropoldest'
+    A_DISCONNECT = 'disconnect'
+
+    def __init__(self, max_bytes, max_age_ms, action):
+        """构造函数
+
+        Args:
+            max_bytes (int): 每个客户端待发送数据的字节上限
+            max_age_ms (int): 待发送数据的时间上限 (ms), 0 表示不限
+            action (str): 超限时的处理，A_DROP_OLDEST 或 A_DISCONNECT
+        """
+        self.max_bytes = max_bytes
+        self.max_age = max_age_ms / 1000 if max_age_ms > 0 else None
+        self.action = action
+
+    @staticmethod
+    def from_config(config):
+        """根据配置生成策略
+
+        Args:
+            config (Entry): 配置
+
+        Returns:
+            return (ClientPolicy): 策略
+        """
+        return ClientPolicy(config.client_max_bytes, config.client_max_age_ms, config.client_overflow)
+
+    def apply(self, ring, cursor):
+        """检查客户端是否超限
+
+        在 ring 被其他线程写入时，调用者需持有 ring.lock。
+
+        Args:
+            ring (BroadcastRing): 待分发数据所在的缓冲区
+            cursor (int): 客户端的读位置
+
+        Returns:
+            return (int): 新的读位置, None 表示需要断开连接
+        """
+        len_pending = ring.tail - cursor
+        if len_pending <= 0:
+            return cursor
+        rcv_time = ring.frame_times.get(cursor)
+        if rcv_time is None:
+            # 正在发送的数据包不能丢弃，或者数据已被覆盖，由调用者处理
+            return cursor
+        now = time.perf_counter()
+        too_old = self.max_age is not None and now - rcv_time > self.max_age
+        if len_pending <= self.max_bytes and not too_old:
+            return cursor
+        if self.action == ClientPolicy.A_DISCONNECT:
+            return None
+        min_rcv_time = now - self.max_age if self.max_age is not None else rcv_time
+        return ring.find_epoch(max(cursor + 1, ring.tail - self.max_bytes), min_rcv_time)
@@ -7,34 +7,207 @@
 #
 
 import queue
+import selectors
+import socket
+import time
 
+from rtk_trans.broadcast_ring import BroadcastRing
+from rtk_protocol.rtcm_framer import RtcmFramer
+from rtk_protocol.rtcm_util import get_sync_flag, is_single_frame
+from rtk_protocol.select_protocol import DEFAULT_PROTOCOL
+from rtk_trans.client_connection import ClientConnection, HANDOFF_SEND_TIMEOUT
+from rtk_trans.client_policy import ClientPolicy
 from rtk_trans.sender_thread import SenderThread
+from rtk_trans.snapshot_cache import SnapshotCache
+from rtk_utils.config_loader import Entry
 from rtk_utils import log
 
 
 class Dispatcher:
     """向客户端分发收到的差分数据的工具"""
 
-    def __init__(self):
-        """构造函数"""
+    def __init__(self, config, transcoder=None):
+        """构造函数
+
+        Args:
+            config (Entry): 配置。config.sender_mode 为 'thread' 表示每个客户端一个 SenderThread,
+                为 'select' 表示所有客户端由 selector 在 ServerThread 中统一管理
+            transcoder (MsmTranscoder): 切分为报文后、写入 ring 之前对报文转码, None 表示不转码
+        """
         super().__init__()
-        self.data_queue = queue.Queue()
+        self.sender_mode = config.sender_mode
+        self.max_coalesce_size = config.max_coalesce_size
+        self.link_compression = config.compress_listen_link
+        self.policy = ClientPolicy.from_config(config)
+        self.selector = selectors.DefaultSelector()
+        self.data_queue = queue.Queue()     # 成员为: (数据包, 收到的时间)
+        self.ring = BroadcastRing()
+        self.epoch_open = False     # 当前历元是否已有数据包写入 (或加入 batch), 且该历元还未结束
+        # 同一历元的数据包攒齐后一起写入 ring, 各客户端每个历元只写一次 socket
+        self.epoch_batch = config.epoch_batch_ms / 1000
+        self.batch = []         # 成员为: (数据包, 收到的时间, 是否为历元起点, 加入 batch 的时间)
+        self.batch_deadline = None  # 最迟写入 batch 的时间 (time.perf_counter)
+        self.snapshot_cache = SnapshotCache() if config.snapshot_cache else None
+        # 不解析报文直接转发时，收到的是任意切分的数据，需先切分为报文再写入 ring
+        self.framer = RtcmFramer() if config.protocol == DEFAULT_PROTOCOL else None
+        self.transcoder = transcoder
         self.clients = {}
         self.new_client_id = 0
         self.running = True
 
+        # 收到数据时立即唤醒 selector
+        self.wakeup_rcv, self.wakeup_send = socket.socketpair()
+        self.wakeup_rcv.setblocking(False)
+        self.wakeup_send.setblocking(False)
+        self.wakeup_pending = False
+        self.selector.register(self.wakeup_rcv, selectors.EVENT_READ, lambda mask: self.dispatch())
+
+        # 从收到数据到写入 ring 的延迟，不含在 batch 中等待历元结束的时间
+        self.latency = LatencyStats()
+        # 每个 batch 从第一个数据包加入到写入 ring 的等待时间
+        self.batch_hold = LatencyStats()
+
+        # 已断开的客户端的计数: 发送的字节数, 发送次数, 丢弃次数, 丢弃的字节数
+        self.closed_stats = [0, 0, 0, 0]
+        self.first_send_time = 0    # 第一次向客户端发送数据的时间 (time.time), 含已断开的客户端
+
+    def put_data(self, data):
+        """加入要分发的数据，并唤醒 ServerThread
+
+        可在其他线程中调用。
+
+        Args:
+            data (bytes): 要分发的数据
+        """
+        self.data_queue.put((data, time.perf_counter()))
+        if not self.wakeup_pending:
+            self.wakeup_pending = True
+            self.wakeup()
+
+    def wakeup(self):
+        """唤醒阻塞在 poll 中的 ServerThread"""
+        try:
+            self.wakeup_send.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            pass    # 缓冲区满，说明已经有未处理的唤醒
+        except OSError as e:
+            log.debug('dispatcher wakeup error: %s' % e)
+
+    def poll(self, timeout):
+        """等待并处理 selector 上的事件
+
+        key.data 为事件回调，参数为就绪的事件。
+
+        Args:
+            timeout (float): 超时时间 (s)
+        """
+        if self.batch_deadline is not None:
+            timeout = min(timeout, max(0, self.batch_deadline - time.perf_counter()))
+        for key, mask in self.selector.select(timeout):
+            key.data(mask)
+        # 兜底: 即使唤醒丢失，队列中的数据最迟在本次 poll 超时后分发
+        if self.data_queue.qsize() > 0:
+            self.dispatch()
+        # 等待历元结束超时，之后的数据包属于新的历元
+        if self.batch_deadline is not None and time.perf_counter() >= self.batch_deadline:
+            self.flush_batch()
+            self.epoch_open = False
+
     def dispatch(self):
-        """每次执行时，把 self.data_queue 中的所有数据包合并，再分发给各 SenderThread"""
-        data = b''
+        """每次执行时，取出 self.data_queue 中的所有数据包
+
+        rtcm 数据先切分为完整的报文，需要时再转码。
+        观测报文的同步标志为 0 时 (或 epoch_batch 为 0 时每个数据包), 把攒下的数据包写入 ring，再通知各客户端发送。
+        基站信息、星历等其他报文加入当前的 batch, 历元之间收到时等下一个历元一起写入；
+        不是单条报文的数据 (无法解析的数据、其他协议) 不等待。
+        """
+        # 先取走唤醒字节，再清除标记，最后取队列:
+        # 清除标记之前加入的数据会在下面取出，之后加入的数据会再次唤醒
+        try:
+            while len(self.wakeup_rcv.recv(4096)) > 0:
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        self.wakeup_pending = False
         try:
             while self.data_queue.qsize() > 0:
-                data += self.data_queue.get(block=False)
+                data, rcv_time = self.data_queue.get(block=False)
                 self.data_queue.task_done()
+                for packet in self.transcode(self.framer.split(data) if self.framer is not None else (data,)):
+                    if len(self.batch) == 0:
+                        self.batch_deadline = rcv_time + self.epoch_batch
+                    epoch_start, epoch_end = self.update_epoch(packet, self.epoch_batch > 0)
+                    self.batch.append((packet, rcv_time, epoch_start, time.perf_counter()))
+                    if epoch_end or self.epoch_batch <= 0:
+                        self.flush_batch()
         except queue.Empty:
             pass
-        if len(data) > 0:
-            num_of_sender = self.send_data(bytes(data))
-            log.debug('send %d bytes to %d clients.' % (len(data), num_of_sender))
+
+    def transcode(self, packets):
+        """对切分后的报文转码
+
+        Args:
+            packets (list[bytes]): 报文
+
+        Returns:
+            return (list[bytes]): 转码后的报文，不转码时为 packets
+        """
+        if self.transcoder is None:
+            return packets
+        transcoded = []
+        for packet in packets:
+            transcoded += self.transcoder.transcode_stream(packet)
+        return transcoded
+
+    def flush_batch(self):
+        """把 batch 中的数据包写入 ring，再通知各客户端发送"""
+        if len(self.batch) == 0:
+            return
+        flush_time = time.perf_counter()
+        self.batch_hold.update(flush_time - self.batch[0][3])
+        len_data = 0
+        for data, rcv_time, epoch_start, batch_time in self.batch:
+            if self.append_to_ring(data, rcv_time, epoch_start):
+                len_data += len(data)
+            self.latency.update(time.perf_counter() - rcv_time - (flush_time - batch_time))
+        self.batch.clear()
+        self.batch_deadline = None
+        if len_data > 0:
+            num_of_sender = self.notify_clients()
+            log.debug('send %d bytes to %d clients.' % (len_data, num_of_sender))
+
+    def get_latency_string(self):
+        """延迟统计，用于显示
+
+        Returns:
+            return (str): 分发延迟，以及等待历元结束的时间
+        """
+        return 'dispatch latency: %s; epoch batch hold: %s' \
+               % (self.latency.get_string(), self.batch_hold.get_string())
+
+    def get_stats(self):
+        """发送给客户端的计数，含已断开的客户端
+
+        Returns:
+            return (dict): bytes_out, sends_out, clients, drop_count, drop_bytes, first_send_time
+        """
+        stats = list(self.closed_stats)
+        clients = self.clients.copy()
+        for sender in clients.values():
+            stats = [total + count for total, count in zip(stats, (
+                sender.sent_bytes, sender.send_count, sender.drop_count, sender.drop_bytes))]
+            self.update_first_send_time(sender)
+        return {'bytes_out': stats[0], 'sends_out': stats[1], 'clients': len(clients),
+                'drop_count': stats[2], 'drop_bytes': stats[3], 'first_send_time': self.first_send_time}
+
+    def update_first_send_time(self, sender):
+        """记录最早的一次向客户端发送数据的时间
+
+        Args:
+            sender (ClientConnection): 客户端
+        """
+        if sender.first_send_time > 0 and (self.first_send_time == 0 or sender.first_send_time < self.first_send_time):
+            self.first_send_time = sender.first_send_time
 
     def send_data(self, data):
         """分发数据
@@ -42,34 +215,168 @@ class Dispatcher:
         Args:
             data (bytes): 要分发的数据
 
+        Returns:
+            return (int): 客户端数量
+        """
+        epoch_start = self.update_epoch(data, False)[0]
+        self.append_to_ring(data, epoch_start=epoch_start)
+        return self.notify_clients()
+
+    def update_epoch(self, data, batching):
+        """根据数据包更新当前历元的状态
+
+        观测报文由同步标志决定历元是否结束。基站信息、星历等其他报文不结束历元；
+        历元之间收到时，batching 为 True 则开始新的历元 (与之后的观测报文一起写入),
+        否则不改变状态。不是单条报文的数据 (无法解析的数据、其他协议) 单独作为一个历元。
+
+        Args:
+            data (bytes): 数据包
+            batching (bool): 是否按历元合并写入
+
+        Returns:
+            epoch_start (bool): 是否为历元起点
+            epoch_end (bool): 是否为历元结束
+        """
+        epoch_start = not self.epoch_open
+        sync = get_sync_flag(data)
+        if sync is not None:
+            self.epoch_open = sync
+        elif is_single_frame(data):
+            self.epoch_open = self.epoch_open or batching
+        else:
+            self.epoch_open = False
+        return epoch_start, not self.epoch_open
+
+    def append_to_ring(self, data, rcv_time=None, epoch_start=True):
+        """把数据包写入 ring，并记录历元边界
+
+        Args:
+            data (bytes): 数据包
+            rcv_time (float): 接收时间 (time.perf_counter)
+            epoch_start (bool): 是否为历元起点
+
+        Returns:
+            return (bool): 是否写入成功
+        """
+        ret = self.ring.append(data, rcv_time, epoch_start)
+        if self.snapshot_cache is not None:
+            self.snapshot_cache.update(data)
+        return ret
+
+    def notify_clients(self):
+        """ring 中有新数据时，通知各客户端发送
+
+        select 模式下直接发送，thread 模式下唤醒各 SenderThread。
+
         Returns:
             return (int): 客户端数量
         """
         clients = self.clients.copy()   # 防止因中途被修改而异常
         for _id, sender in clients.items():
             if sender.running:
-                sender.data_queue.put(data)
+                if isinstance(sender, SenderThread):
+                    sender.wakeup()
+                else:
+                    sender.send_data()
             else:
                 del self.clients[_id]
+                self.closed_stats = [total + count for total, count in zip(self.closed_stats, (
+                    sender.sent_bytes, sender.send_count, sender.drop_count, sender.drop_bytes))]
+                self.update_first_send_time(sender)
         return len(clients)
 
-    def add_client(self, client_socket, address):
+    def add_client(self, client_socket, address, adopted=False):
         """新的客户端连入时调用此函数
 
-        建立新的 SenderThread 并加入分发列表。
+        建立新的 SenderThread (或 select 模式下的 ClientConnection) 并加入分发列表。
+        新客户端首先收到缓存的基站信息和星历报文。
 
         Args:
             client_socket (socket.socket): 与客户端通信的 socket
             address (tuple[str, int]): 客户端地址
+            adopted (bool): 是否为旧进程移交的客户端，已经收到过缓存的报文
         """
-        sender = SenderThread(client_socket, address, self.new_client_id)
+        snapshot = self.snapshot_cache.get_snapshot() if self.snapshot_cache is not None and not adopted else b''
+        if self.sender_mode == 'select':
+            sender = ClientConnection(client_socket, address, self.new_client_id, self.selector, self.ring,
+                                      self.max_coalesce_size, self.policy, snapshot, self.link_compression)
+            sender.send_data()
+        else:
+            sender = SenderThread(client_socket, address, self.new_client_id, self.ring,
+                                  self.max_coalesce_size, self.policy, snapshot, self.link_compression)
+            sender.start()
         self.clients[self.new_client_id] = sender
         self.new_client_id += 1
-        sender.start()
+
+    def detach_all_clients(self):
+        """停止向所有客户端发送，取出 socket, 用于移交给新的进程
+
+        Returns:
+            return (list[tuple[socket.socket, tuple]]): (客户端 socket, 客户端地址)
+        """
+        for _id, sender in self.clients.items():
+            if isinstance(sender, SenderThread) and sender.running:
+                sender.detaching = True
+                sender.running = False
+                sender.wakeup()
+        for _id, sender in self.clients.items():
+            if isinstance(sender, SenderThread):
+                sender.join()
+        clients = []
+        deadline = time.time() + HANDOFF_SEND_TIMEOUT
+        for _id, sender in self.clients.items():
+            if sender.running or sender.detaching:
+                client_socket = sender.detach(deadline)
+                if client_socket is not None:
+                    clients.append((client_socket, sender.address))
+        self.clients.clear()
+        self.selector.close()
+        self.wakeup_rcv.close()
+        self.wakeup_send.close()
+        return clients
 
     def close_all_clients(self):
         """关闭所有与客户端的连接"""
         for _id, sender in self.clients.items():
-            sender.running = False
+            if isinstance(sender, SenderThread):
+                sender.running = False
+                sender.wakeup()
+            else:
+                sender.disconnect()
         for _id, sender in self.clients.items():
-            sender.join()
+            if isinstance(sender, SenderThread):
+                sender.join()
+        self.selector.close()
+        self.wakeup_rcv.close()
+        self.wakeup_send.close()
+
+
+class LatencyStats:
+    """延迟统计: 最近一次、平均、最大"""
+
+    def __init__(self):
+        """构造函数"""
+        self.last = 0
+        self.max = 0
+        self.sum = 0
+        self.count = 0
+
+    def update(self, latency):
+        """记录一次延迟
+
+        Args:
+            latency (float): 延迟 (s)
+        """
+        self.last = latency
+        self.max = max(self.max, latency)
+        self.sum += latency
+        self.count += 1
+
+    def get_string(self):
+        """用于显示
+
+        Returns:
+            return (str): 最近一次、平均、最大延迟 (ms)
+        """
+        avg = self.sum / self.count if self.count > 0 else 0
+        return 'last %.3f ms, avg %.3f ms, max %.3f ms' % (self.last * 1000, avg * 1000, self.max * 1000)
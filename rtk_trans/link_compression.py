@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : link_compression.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : rtk_trans 之间的压缩链路
+#
+
+import time
+import zlib
+
+from rtk_utils import log
+
+# 下游 rtk_trans 连接上游的 listenPort 后发送 LINK_HELLO，请求压缩。
+# 上游在数据包边界处回复 LINK_ACK，之后发送的数据均为 zlib 流。
+# 两者都是一行文本，不支持压缩的一方会当作无法解析的数据丢弃。
+LINK_HELLO = b'$PRTKZ,HELLO,zlib\r\n'
+LINK_ACK = b'$PRTKZ,ACK,zlib\r\n'
+LINK_COMPRESS_LEVEL = 6
+# 下游等待 LINK_ACK 的最大数据量和时间，超过时认为上游不支持压缩，之后直接转发
+LINK_NEGOTIATE_BYTES = 65536
+LINK_NEGOTIATE_TIMEOUT = 10     # s
+
+
+class LinkCompressor:
+    """上游的压缩工具，每个客户端一个，并统计压缩率和耗时"""
+
+    def __init__(self):
+        """构造函数"""
+        self.compressor = zlib.compressobj(LINK_COMPRESS_LEVEL)
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.flush_count = 0
+        self.time_sum = 0   # 压缩耗时 (s)
+
+    def compress(self, views, flush):
+        """压缩数据
+
+        Args:
+            views (list[memoryview]): 要压缩的数据
+            flush (bool): 是否 flush。每个历元结束时 flush，下游可以立即解压出完整的历元
+
+        Returns:
+            return (bytes): 压缩后的数据
+        """
+        time_start = time.perf_counter()
+        data = b''.join(self.compressor.compress(view) for view in views)
+        if flush:
+            data += self.compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.flush_count += 1
+        self.time_sum += time.perf_counter() - time_start
+        self.raw_bytes += sum(len(view) for view in views)
+        self.compressed_bytes += len(data)
+        return data
+
+    def get_stats_string(self):
+        """统计，用于显示
+
+        Returns:
+            return (str): 压缩率，每个历元的平均耗时 (ms)
+        """
+        ratio = self.compressed_bytes / self.raw_bytes if self.raw_bytes > 0 else 1
+        latency = self.time_sum / self.flush_count if self.flush_count > 0 else 0
+        return 'zlib %.1f%%, %.3f ms' % (ratio * 100, latency * 1000)
+
+
+class LinkDecompressor:
+    """下游的解压工具
+
+    发送 LINK_HELLO 后，在收到的数据中查找 LINK_ACK。LINK_ACK 之前的数据未压缩，之后的数据需要解压。
+    上游不是 rtk_trans 时不会回复 LINK_ACK，收到 LINK_NEGOTIATE_BYTES 的数据或超过 LINK_NEGOTIATE_TIMEOUT 后不再查找，
+    之后的数据不拷贝，原样返回。
+    """
+
+    def __init__(self):
+        """构造函数"""
+        self.decompressor = None    # 收到 LINK_ACK 后才建立
+        self.negotiating = True     # 是否仍在查找 LINK_ACK
+        self.negotiate_bytes = 0
+        self.negotiate_deadline = time.monotonic() + LINK_NEGOTIATE_TIMEOUT
+        self.pending = b''          # 可能是 LINK_ACK 开头的一部分，留到下次
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.decompress_count = 0
+        self.time_sum = 0   # 解压耗时 (s)
+
+    def feed(self, data):
+        """处理收到的数据
+
+        Args:
+            data (memoryview): 收到的数据
+
+        Returns:
+            return (list[bytes]): 解压后的数据，未压缩时可能直接返回 data
+        """
+        chunks = []
+        if not self.negotiating and self.decompressor is None:
+            return [data]
+        if self.decompressor is None:
+            data = self.pending + bytes(data)
+            index = data.find(LINK_ACK)
+            self.negotiate_bytes += len(data) - len(self.pending)
+            if index < 0 and (self.negotiate_bytes >= LINK_NEGOTIATE_BYTES
+                              or time.monotonic() >= self.negotiate_deadline):
+                log.info('link decompressor: no response from upstream, uncompressed link.')
+                self.negotiating = False
+                self.pending = b''
+                return [data]
+            if index < 0:
+                len_pending = self.get_len_ack_prefix(data)
+                self.pending = data[len(data) - len_pending:]
+                if len(data) > len_pending:
+                    chunks.append(data[:len(data) - len_pending])
+                return chunks
+            if index > 0:
+                chunks.append(data[:index])
+            self.pending = b''
+            self.negotiating = False
+            self.decompressor = zlib.decompressobj()
+            data = data[index + len(LINK_ACK):]
+        if len(data) > 0:
+            time_start = time.perf_counter()
+            raw = self.decompressor.decompress(data)
+            self.time_sum += time.perf_counter() - time_start
+            self.decompress_count += 1
+            self.compressed_bytes += len(data)
+            self.raw_bytes += len(raw)
+            if len(raw) > 0:
+                chunks.append(raw)
+        return chunks
+
+    @staticmethod
+    def get_len_ack_prefix(data):
+        """data 末尾与 LINK_ACK 开头相同的最大长度"""
+        for length in range(min(len(data), len(LINK_ACK) - 1), 0, -1):
+            if data.endswith(LINK_ACK[:length]):
+                return length
+        return 0
+
+    def get_stats_string(self):
+        """统计，用于显示
+
+        Returns:
+            return (str): 压缩率，每次解压的平均耗时 (ms)
+        """
+        if self.decompressor is None:
+            return 'uncompressed'
+        ratio = self.compressed_bytes / self.raw_bytes if self.raw_bytes > 0 else 1
+        latency = self.time_sum / self.decompress_count if self.decompress_count > 0 else 0
+        return 'zlib %.1f%%, %.3f ms' % (ratio * 100, latency * 1000)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : listen_worker.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : 与主进程共用 listenPort 的分发进程
+#
+
+import queue
+import threading
+
+from rtk_trans.server_thread import ServerThread
+from rtk_utils.config_loader import Entry
+from rtk_utils import log
+
+FORWARD_QUEUE_SIZE = 256    # 每个分发进程最多积压的数据包数，超过时丢弃
+FORWARD_STOP_TIMEOUT = 1    # 退出时等待转发线程的时间 (s)
+
+
+def listen_worker_main(quit_event, data_conn, name, config):
+    """分发进程主函数
+
+    与 RtkGroup 的进程一起以 SO_REUSEPORT 监听同一个 listenPort，由内核分配客户端连接。
+    差分数据由 RtkGroup 的进程从基站接收，经 pipe 转发到本进程。
+
+    Args:
+        quit_event (multiprocessing.Event): 需要退出的事件
+        data_conn (multiprocessing.connection.Connection): 接收差分数据的 pipe
+        name (str): 进程名
+        config (Entry): 配置表
+    """
+    log.init(name, config.enable_log)
+    log.info('listen worker: start')
+
+    server = ServerThread(config.listen_port, config)
+    server.start()
+
+    try:
+        while server.running and not quit_event.is_set():
+            if data_conn.poll(1):
+                server.dispatcher.put_data(data_conn.recv_bytes())
+    except (EOFError, OSError):
+        pass    # RtkGroup 的进程已退出
+    except KeyboardInterrupt:
+        pass
+
+    server.running = False
+    server.join()
+    data_conn.close()
+
+    log.info('listen worker: bye')
+    log.close(name)
+
+
+class ListenWorkerForwarder(threading.Thread):
+    """经 pipe 向一个分发进程转发差分数据的线程
+
+    接收基站数据的线程只把数据放入有界队列，不等待 pipe,
+    某个分发进程卡住时只丢弃发往它的数据，不影响接收和其他分发进程。
+    """
+
+    def __init__(self, data_conn, worker_id):
+        """构造函数
+
+        Args:
+            data_conn (multiprocessing.connection.Connection): 向分发进程转发数据的 pipe
+            worker_id (int): 分发进程的序号，仅用于 log
+        """
+        super().__init__()
+        self.daemon = True  # send_bytes 可能因分发进程卡住而一直阻塞，不能妨碍进程退出
+        self.data_conn = data_conn
+        self.worker_id = worker_id
+        self.data_queue = queue.Queue(maxsize=FORWARD_QUEUE_SIZE)
+        self.drop_count = 0
+        self.running = True
+
+    def put_data(self, data):
+        """加入要转发的数据，不阻塞，队列满时丢弃
+
+        Args:
+            data (bytes): 要转发的数据
+        """
+        if not self.running:
+            return
+        try:
+            self.data_queue.put_nowait(data)
+        except queue.Full:
+            self.drop_count += 1
+            if self.drop_count % 1000 == 1:
+                log.warning('listen worker %d: pipe is full, %d packet(s) dropped.' % (self.worker_id, self.drop_count))
+
+    def run(self):
+        """线程主函数，逐个发送队列中的数据"""
+        while self.running:
+            try:
+                data = self.data_queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            if data is None:
+                break
+            try:
+                self.data_conn.send_bytes(data)
+            except (OSError, ValueError) as e:
+                log.warning('listen worker %d: pipe closed: %s' % (self.worker_id, e))
+                break
+        self.running = False
+
+    def stop(self):
+        """通知线程退出，不等待"""
+        self.running = False
+        try:
+            self.data_queue.put_nowait(None)
+        except queue.Full:
+            pass    # 线程最迟在 get 超时后退出
@@ -6,78 +6,190 @@
 # Description   : 管理一组差分
 # 
 
-from multiprocessing import Process, Event
+import socket
+import time
+from multiprocessing import Process, Event, Pipe
 
+from rtk_trans.listen_worker import listen_worker_main
 from rtk_trans.rtk_thread import RtkThread
+from rtk_trans.socket_handoff import HANDOFF_SUPPORTED, HANDOFF_TIMEOUT, send_sockets, recv_sockets, close_sockets
 from rtk_utils.config_loader import Entry
 from rtk_utils import log, base64_log
 from rtk_utils.http_thread import RtkStatus
+from rtk_utils.status_board import StatusBoard, StatusReporter, STATUS_FLUSH_INTERVAL
 
 
 class RtkGroup:
-    def __init__(self, name, thread_id, config, status_queue):
+    def __init__(self, name, thread_id, config, status_board, handoff=None):
         """初始化
 
         Args:
             name (str): rtk 线程名
             thread_id (int): 线程 id
             config (Entry): 配置表
-            status_queue (multiprocessing.Queue): 更新差分状态的队列
+            status_board (StatusBoard): 差分状态表
+            handoff (dict[int, tuple]): 旧进程移交的各端口的监听 socket 和客户端，见 socket_handoff
         """
         self.name = name
         self.thread_id = thread_id
         self.config = config
-        self.status_queue = status_queue
+        self.status_board = status_board
+        slot_index = status_board.alloc(name)
+        start_time = time.time()    # 用于统计启动各阶段的耗时
 
         self.quit_event = Event()
+        # 重新加载配置时，旧进程经 ctrl_conn 把 socket 移交给主进程，再由主进程交给新进程
+        self.handoff_event = Event()
+        self.ctrl_conn, ctrl_conn_child = socket.socketpair() if HANDOFF_SUPPORTED else (None, None)
+
+        # listenWorkers > 1 时，其余的分发进程经 pipe 接收数据。分发进程由本进程创建，因为 daemon 进程不能有子进程
+        self.workers = []
+        data_conns = []
+        for i in range(1, config.listen_workers):
+            worker_name = '%s_w%d' % (self.name, i)
+            rcv_conn, send_conn = Pipe(duplex=False)
+            worker = Process(name=worker_name, target=listen_worker_main,
+                             args=(self.quit_event, rcv_conn, worker_name, self.config))
+            worker.daemon = True
+            self.workers.append(worker)
+            data_conns.append(send_conn)
+
         self.p = Process(name=self.name, target=process_main,
-                         args=(self.quit_event, self.status_queue, self.name, self.config))
+                         args=(self.quit_event, self.handoff_event, ctrl_conn_child, self.status_board, slot_index,
+                               start_time, self.name, self.config, data_conns, handoff))
         self.p.daemon = True
-        self.status_queue.put((self.name, RtkStatus.S_UNKNOWN))
+        self.ctrl_conn_child = ctrl_conn_child
 
     def start(self):
         if not self.p.is_alive():
             self.run()
 
     def run(self):
+        for worker in self.workers:
+            worker.start()
         self.p.start()
+        if self.ctrl_conn_child is not None:
+            self.ctrl_conn_child.close()
 
     def stop(self):
         # require stop
         self.quit_event.set()
 
-    def join(self):
-        self.p.join()
-        self.status_queue.put((self.name, RtkStatus.S_TERMINATED))
+    def join(self, timeout=None):
+        """等待进程退出
+
+        Args:
+            timeout (float): 超时 (s), 超时后强制结束进程。None 表示一直等待
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        for p in [self.p] + self.workers:
+            join_or_kill(p, deadline)
+        if self.ctrl_conn is not None:
+            self.ctrl_conn.close()
+        self.status_board.set_state(self.name, RtkStatus.S_TERMINATED)
+
+    def can_handoff(self, config):
+        """能否把 socket 移交给使用新配置的 RtkGroup
+
+        Args:
+            config (Entry): 新的配置表
+
+        Returns:
+            return (bool): 能否移交
+        """
+        # listenWorkers > 1 时，其他分发进程中的客户端无法移交
+        return HANDOFF_SUPPORTED and self.p.is_alive() and self.config.listen_workers == 1 \
+            and config.listen_workers == 1
+
+    def request_handoff(self):
+        """请求进程移交各端口的监听 socket 和客户端 socket, 之后进程退出，不等待
+
+        之后需要调用 recv_handoff 和 join
+        """
+        self.handoff_event.set()
+        # 同时唤醒进程的主循环，主循环先检查 handoff_event
+        self.quit_event.set()
+
+    def recv_handoff(self, timeout=HANDOFF_TIMEOUT):
+        """接收进程移交的 socket
+
+        Args:
+            timeout (float): 超时 (s)
+
+        Returns:
+            return (dict[int, tuple[socket.socket, list[tuple[socket.socket, tuple]]]]):
+                端口 -> (监听 socket, [(客户端 socket, 客户端地址)])
+        """
+        return recv_sockets(self.ctrl_conn, timeout)
 
     def is_alive(self):
         return self.p.is_alive()
 
 
-def process_main(quit_event, queue_out, name, config):
+def join_or_kill(p, deadline=None):
+    """等待进程退出，到 deadline 时仍未退出则强制结束
+
+    Args:
+        p (multiprocessing.Process): 进程
+        deadline (float): 最迟的时间 (time.time), None 表示一直等待
+    """
+    p.join(max(0, deadline - time.time()) if deadline is not None else None)
+    if p.is_alive():
+        log.warning('%s did not stop in time, kill.' % p.name)
+        p.kill()
+        p.join()
+
+
+def process_main(quit_event, handoff_event, ctrl_conn, status_board, slot_index, start_time, name, config, data_conns,
+                 handoff):
     """进程主函数
 
     Args:
         quit_event (multiprocessing.Event): 需要退出的事件
-        queue_out (multiprocessing.Queue): 每当收到数据时，将线程名填入此队列
+        handoff_event (multiprocessing.Event): 需要移交 socket 并退出的事件
+        ctrl_conn (socket.socket): 移交 socket 用的 unix socket
+        status_board (StatusBoard): 差分状态表
+        slot_index (int): 本组差分在状态表中的 slot 编号
+        start_time (float): 主进程请求启动的时间 (time.time)
         name (str): 线程名
         config (Entry): 配置表
+        data_conns (list[multiprocessing.connection.Connection]): 向各分发进程转发数据的 pipe
+        handoff (dict[int, tuple]): 旧进程移交的各端口的监听 socket 和客户端
     """
     log.init(name, config.enable_log)
     base64_log.init(name + '_raw', config.enable_raw)
 
-    rtk_thread = RtkThread(name, config, lambda status: queue_out.put((name, status)))
+    status_reporter = StatusReporter(name, status_board.get_slot(slot_index), start_time=start_time)
+    rtk_thread = RtkThread(name, config, status_reporter.update, data_conns, handoff)
+    status_reporter.get_stats = rtk_thread.get_stats
     rtk_thread.start()
 
     while rtk_thread.running:
         try:
-            if quit_event.wait(timeout=3):      # true means event set
+            quit_event.wait(timeout=STATUS_FLUSH_INTERVAL)
+            # request_handoff 先设置 handoff_event 再设置 quit_event
+            if handoff_event.is_set():
+                sockets = rtk_thread.detach_servers()
+                try:
+                    send_sockets(ctrl_conn, sockets)
+                    log.info('rtk group: handed off %d port(s).' % len(sockets))
+                except Exception as e:
+                    log.error('rtk group: failed to hand off sockets: %s' % e)
+                close_sockets(sockets)
+                break
+            if quit_event.is_set():
                 break
+            status_reporter.flush()
         except KeyboardInterrupt:
             pass
 
-    rtk_thread.running = False
+    rtk_thread.stop()
     rtk_thread.join()
+    status_reporter.flush()
+    for data_conn in data_conns:
+        data_conn.close()
+    if ctrl_conn is not None:
+        ctrl_conn.close()
 
     log.close(name)
     base64_log.close(name + '_raw')
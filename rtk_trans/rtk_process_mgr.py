@@ -11,74 +11,177 @@ import threading
 import time
 
 from rtk_trans.rtk_group import RtkGroup
+from rtk_trans.rtk_worker_pool import RtkWorkerPool, PooledEntry
+from rtk_trans.socket_handoff import HANDOFF_TIMEOUT, close_sockets
 from rtk_utils import log
 from rtk_utils.config_loader import Entry
 from rtk_utils.http_process import HttpProcess
+from rtk_utils.status_board import StatusBoard
+
+SHUTDOWN_TIMEOUT = 10   # 等待 rtk 线程退出的时间 (s), 超时后强制结束进程
 
 
 class RtkProcessMgr(threading.Thread):
-    def __init__(self, configs):
+    def __init__(self, configs, config_watcher=None):
         super().__init__()
         self.init_configs = configs
+        self.configs = configs
+        self.config_watcher = config_watcher    # 增量加载配置文件，为 None 时不检查配置文件的变化
+        self.config_lock = threading.Lock()     # 手动重新加载和自动重新加载不同时进行
         self.rtk_threads = {}
         self.thread_count = 0
         self.web_interface_thread = None
+        self.worker_pool = None     # 配置了 workerPool 时，各组差分在进程池中运行
         self.rtk_names_queue = multiprocessing.Queue()
-        self.status_queue = multiprocessing.Queue()
+        self.status_board = StatusBoard.from_config(configs)
         self.running = True
 
-    def start_threads_from_config(self, configs):
-        """读取配置文件，启动所有 rtk 线程"""
+    def start_threads_from_config(self, configs, diff=None):
+        """读取配置文件，启动所有 rtk 线程
 
-        # web 管理界面
-        try:
-            port = configs['webInterface']['port']
-            if configs['webInterface']['allow'].lower() == 'true':
-                self.start_web_interface(port)
-        except Exception as e:
-            log.error('main: failed to start web interface: %s' % e)
+        Args:
+            configs (dict): 配置
+            diff (EntryDiff): 与上次加载相比的变化，为 None 时检查所有 entry
+        """
+        # 只有其他文件中的 entry 改变时，不必检查 conf/config.json 中的其他配置
+        if diff is None or diff.main_changed:
+            # web 管理界面
+            try:
+                port = configs['webInterface']['port']
+                if configs['webInterface']['allow'].lower() == 'true':
+                    self.start_web_interface(port)
+            except Exception as e:
+                log.error('main: failed to start web interface: %s' % e)
+            # 工作进程池
+            try:
+                if 'workerPool' in configs.keys() and self.worker_pool is None:
+                    self.worker_pool = RtkWorkerPool(configs['workerPool'], self.status_board)
+                    self.worker_pool.start()
+            except Exception as e:
+                log.error('main: failed to start worker pool: %s' % e)
+                self.worker_pool = None
         # rtk 转发服务
         try:
             if 'entry' in configs.keys():
-                self.start_rtk_threads(configs['entry'])
+                self.start_rtk_threads(configs['entry'], diff)
         except Exception as e:
             log.error('main: failed to start rtk threads: %s' % e)
         # web 管理界面的配置
         try:
-            if configs['webInterface']['allow'].lower() == 'true':
+            names_changed = diff is None or len(diff.added) > 0 or len(diff.removed) > 0
+            if names_changed and configs['webInterface']['allow'].lower() == 'true':
                 self.update_web_interface(sorted(configs['entry'].keys()))
         except Exception as e:
             log.error('main: failed to update web interface: %s' % e)
 
-    def start_rtk_threads(self, entries):
+    def start_rtk_threads(self, entries, diff=None):
         """根据配置文件启动 rtk 线程
 
         Args:
             entries (dict[str, Entry]): 各组 rtk 转发配置
+            diff (EntryDiff): 与上次加载相比的变化，为 None 时检查所有 entry，否则只处理变化的 entry
         """
         if isinstance(entries, dict):
+            names = [name for name, config in entries.items() if isinstance(config, Entry)] if diff is None \
+                else diff.added + diff.changed
             # stop threads not in config
-            for name in sorted(self.rtk_threads.keys()):
-                if name not in entries.keys():
-                    self.stop_and_wait_for_thread(name)
+            if diff is None:
+                removed = sorted(name for name in self.rtk_threads.keys() if name not in entries.keys())
+            else:
+                removed = diff.removed
+            # 配置改变或已退出，需要重启的
+            restart = [name for name in names if name in self.rtk_threads.keys() and not (
+                self.rtk_threads[name].is_alive() and self.rtk_threads[name].config == entries[name])]
+            handoffs = self.request_handoffs(restart, entries)
+            # 先通知所有线程退出，再一起等待
+            for name in removed + restart:
+                self.stop_thread(name)
+            self.wait_for_threads(removed + restart)
             # start threads from config
-            for name, config in entries.items():
-                if isinstance(config, Entry):
-                    # start one thread
-                    try:
-                        if name in self.rtk_threads.keys():
-                            # 如果已有
-                            rtk_group = self.rtk_threads[name]
-                            # 判断配置是否发生改变，如果不变并且在运行，就跳过
-                            if rtk_group.is_alive() and rtk_group.config == config:
-                                continue
-                            self.stop_and_wait_for_thread(name)
-                        rtk_group = RtkGroup(name, self.thread_count, config, self.status_queue)
-                        self.thread_count += 1
-                        rtk_group.start()
-                        self.rtk_threads[name] = rtk_group
-                    except Exception as e:
-                        log.error('main: failed to start thread %s: %s' % (name, e))
+            for name in names:
+                self.start_rtk_thread(name, entries[name], handoffs.pop(name, None))
+
+    def request_handoffs(self, names, entries):
+        """配置改变时，请求 rtk 线程移交监听 socket 和已连接的客户端，使客户端不断开
+
+        先通知所有线程，再依次接收，各线程同时移交，共用一个超时。
+        之后需要调用 stop_thread 和 wait_for_threads
+
+        Args:
+            names (list[str]): 需要重启的 rtk 线程名
+            entries (dict[str, Entry]): 新的配置
+
+        Returns:
+            return (dict[str, dict[int, tuple]]): 线程名 -> 各端口的监听 socket 和客户端，见 RtkGroup.recv_handoff,
+                不能移交的线程不在其中
+        """
+        if self.worker_pool is not None:
+            return {}
+        requested = []
+        for name in names:
+            rtk_group = self.rtk_threads[name]
+            if isinstance(rtk_group, RtkGroup) and rtk_group.can_handoff(entries[name]):
+                rtk_group.request_handoff()
+                requested.append(name)
+        handoffs = {}
+        deadline = time.time() + HANDOFF_TIMEOUT
+        for name in requested:
+            try:
+                handoffs[name] = self.rtk_threads[name].recv_handoff(max(0, deadline - time.time()))
+            except Exception as e:
+                log.warning('main: failed to hand off sockets of %s: %s' % (name, e))
+        return handoffs
+
+    def start_rtk_thread(self, name, config, handoff=None):
+        """启动一个 rtk 线程，已有时如果配置改变或已退出则重启
+
+        Args:
+            name (str): rtk 线程名
+            config (Entry): 配置
+            handoff (dict[int, tuple]): 旧进程移交的各端口的监听 socket 和客户端，见 request_handoffs
+        """
+        try:
+            if name in self.rtk_threads.keys():
+                # 如果已有
+                rtk_group = self.rtk_threads[name]
+                # 判断配置是否发生改变，如果不变并且在运行，就跳过
+                if rtk_group.is_alive() and rtk_group.config == config:
+                    return
+                self.stop_and_wait_for_thread(name)
+            if self.worker_pool is not None:
+                rtk_group = PooledEntry(self.worker_pool, name, self.thread_count, config, self.status_board)
+            else:
+                rtk_group = RtkGroup(name, self.thread_count, config, self.status_board, handoff)
+            self.thread_count += 1
+            rtk_group.start()
+            self.rtk_threads[name] = rtk_group
+        except Exception as e:
+            log.error('main: failed to start thread %s: %s' % (name, e))
+        finally:
+            # 新进程已持有副本，或启动失败，关闭主进程中的副本
+            if handoff is not None:
+                close_sockets(handoff)
+
+    def reload_config(self, only_changed=False):
+        """重新加载配置文件
+
+        Args:
+            only_changed (bool): 为 True 时只在配置文件改变后加载，并且只处理变化的 entry;
+                为 False 时检查所有 entry, 同时重启已退出的 rtk 线程
+        """
+        if self.config_watcher is None:
+            return
+        with self.config_lock:
+            if only_changed and not self.config_watcher.has_changed():
+                return
+            time_start = time.perf_counter()
+            configs, diff = self.config_watcher.load()
+            self.configs = configs
+            if only_changed and diff.is_empty():
+                return
+            log.info('main: reload config, %s.' % diff)
+            self.start_threads_from_config(configs, diff if only_changed else None)
+            log.info('main: config reloaded in %.1f ms.' % ((time.perf_counter() - time_start) * 1000))
 
     def stop_thread(self, name):
         """停止某 rtk 线程，不等待
@@ -91,32 +194,47 @@ class RtkProcessMgr(threading.Thread):
         try:
             if name in self.rtk_threads.keys():
                 rtk_thread = self.rtk_threads[name]
-                if isinstance(rtk_thread, RtkGroup):
+                if isinstance(rtk_thread, (RtkGroup, PooledEntry)):
                     rtk_thread.stop()
                     log.info('main: require stop thread %d %s.' % (rtk_thread.thread_id, name))
         except Exception as e:
             log.error('main: failed to stop thread %s: %s' % (name, e))
 
-    def wait_for_thread(self, name):
+    def wait_for_thread(self, name, timeout=SHUTDOWN_TIMEOUT):
         """等待某 rtk 线程完全退出
 
         在 stop_thread 之后调用
 
         Args:
             name (str): rtk 线程名
+            timeout (float): 超时 (s), 超时后强制结束进程
         """
         try:
             if name in self.rtk_threads.keys():
                 rtk_thread = self.rtk_threads[name]
-                if isinstance(rtk_thread, RtkGroup):
+                if isinstance(rtk_thread, (RtkGroup, PooledEntry)):
                     # wait
-                    rtk_thread.join()
+                    rtk_thread.join(timeout)
                 log.info('main: thread %d %s has stopped.' % (rtk_thread.thread_id, name))
                 # remove
                 del self.rtk_threads[name]
+                self.status_board.free(name)
         except Exception as e:
             log.error('main: error when wait for thread %s: %s' % (name, e))
 
+    def wait_for_threads(self, names, timeout=SHUTDOWN_TIMEOUT):
+        """等待多个 rtk 线程完全退出，共用一个超时
+
+        在对各线程调用 stop_thread 之后调用，各线程同时退出
+
+        Args:
+            names (list[str]): rtk 线程名
+            timeout (float): 超时 (s), 超时后强制结束仍未退出的进程
+        """
+        deadline = time.time() + timeout
+        for name in names:
+            self.wait_for_thread(name, max(0, deadline - time.time()))
+
     def stop_and_wait_for_thread(self, name):
         """停止某 rtk 线程，等待直到退出成功
 
@@ -134,7 +252,7 @@ class RtkProcessMgr(threading.Thread):
         """
         if self.web_interface_thread is None:
             # start new
-            self.web_interface_thread = HttpProcess(port, self.rtk_names_queue, self.status_queue)
+            self.web_interface_thread = HttpProcess(port, self.rtk_names_queue, self.status_board)
             self.web_interface_thread.start()
 
     def update_web_interface(self, rtk_names):
@@ -156,19 +274,40 @@ class RtkProcessMgr(threading.Thread):
     def run(self):
         """线程管理工具的主循环，阻塞运行直到 looping 为 False"""
         # start rtk
+        time_start = time.perf_counter()
         self.start_threads_from_config(self.init_configs)
+        log.info('main: %d rtk thread(s) started in %.1f ms.'
+                 % (len(self.rtk_threads), (time.perf_counter() - time_start) * 1000))
 
         # wait
+        last_watch_time = time.time()
         while self.running:
             time.sleep(1)
+            # 配置文件改变时自动重新加载
+            watch_interval = self.configs.get('configWatchInterval', 0)
+            if watch_interval > 0 and time.time() - last_watch_time >= watch_interval:
+                last_watch_time = time.time()
+                try:
+                    self.reload_config(only_changed=True)
+                except Exception as e:
+                    log.error('main: failed to reload config: %s' % e)
+            if self.worker_pool is not None:
+                try:
+                    self.worker_pool.check()
+                except Exception as e:
+                    log.error('main: failed to rebalance worker pool: %s' % e)
 
         # quit & clean up
-        for name in self.rtk_threads.keys():
-            self.stop_thread(name)
-        for name in sorted(self.rtk_threads.keys()):
-            self.wait_for_thread(name)
+        time_start = time.perf_counter()
+        names = sorted(self.rtk_threads.keys())
+        if self.worker_pool is not None:
+            # 各工作进程同时停止其中所有的差分
+            self.worker_pool.stop(SHUTDOWN_TIMEOUT)
+        else:
+            for name in names:
+                self.stop_thread(name)
+            self.wait_for_threads(names)
         self.stop_and_wait_for_web_interface()
+        log.info('main: %d rtk thread(s) stopped in %.1f ms.' % (len(names), (time.perf_counter() - time_start) * 1000))
 
-        # clear queue
-        while not self.status_queue.empty():
-            self.status_queue.get(block=False)
+        self.status_board.close()
@@ -7,10 +7,12 @@
 # 
 
 import threading
-import time
 
+from rtk_protocol.msm_transcoder import MsmTranscoder
 from rtk_trans.control_thread import ControlThread
+from rtk_trans.listen_worker import FORWARD_STOP_TIMEOUT, ListenWorkerForwarder
 from rtk_trans.server_thread import ServerThread
+from rtk_trans.socket_handoff import close_sockets
 from rtk_trans.station_client_thread import StationClientThread
 from rtk_trans.station_server_thread import StationServerThread
 from rtk_utils.config_loader import Entry
@@ -19,20 +21,30 @@ from rtk_utils import log
 
 
 class RtkThread(threading.Thread):
-    def __init__(self, name, config, update_status_cb):
+    def __init__(self, name, config, update_status_cb, data_conns=None, handoff=None):
         """初始化
 
         Args:
             name (str): rtk 线程名
             config (Entry): 配置 dict
             update_status_cb (Callable[[str], None]): 更新差分状态的回调函数
+            data_conns (list[multiprocessing.connection.Connection]): 向其他分发进程转发数据的 pipe
+            handoff (dict[int, tuple]): 旧进程移交的各端口的监听 socket 和客户端，见 socket_handoff
         """
         super().__init__()
         self.name = name
         self.update_status_cb = update_status_cb
+        # 每个 pipe 由一个转发线程发送，接收线程不会被卡住的分发进程阻塞
+        self.forwarders = [ListenWorkerForwarder(data_conn, worker_id)
+                           for worker_id, data_conn in enumerate(data_conns or [], 1)]
+        self.handoff = handoff if handoff is not None else {}
         self.server = None
+        self.transcode_servers = {}     # 端口 -> (ServerThread, MsmTranscoder), 向这些端口发送转码后的数据
         self.controller = None
         self.station = None
+        self.rcv_bytes = 0      # 收到的字节数
+        self.rcv_count = 0      # 收到的数据包数
+        self.quit_event = threading.Event()     # 需要退出时唤醒主循环
         self.running = True
 
         self.config = config
@@ -48,7 +60,14 @@ class RtkThread(threading.Thread):
         Args:
             data (bytes): 收到的数据包
         """
-        self.server.dispatcher.data_queue.put(data)
+        self.rcv_bytes += len(data)
+        self.rcv_count += 1
+        self.server.dispatcher.put_data(data)
+        # 在各端口的 ServerThread 中转码，不占用接收线程
+        for port, (server, transcoder) in self.transcode_servers.items():
+            server.dispatcher.put_data(data)
+        for forwarder in self.forwarders:
+            forwarder.put_data(data)
         self.update_status_cb(None)
 
     def got_command_cb(self, command):
@@ -59,35 +78,115 @@ class RtkThread(threading.Thread):
         """
         if command == b'reset server':
             old_server = self.server
-            self.server = ServerThread(self.listen_port)
+            self.server = ServerThread(self.listen_port, self.config)
             old_server.running = False
             self.server.start()
+            for port, (old_transcode_server, transcoder) in self.transcode_servers.copy().items():
+                server = ServerThread(port, self.config, transcoder=transcoder)
+                self.transcode_servers[port] = (server, transcoder)
+                old_transcode_server.running = False
+                server.start()
         elif command == b'list':
             self.controller.msg_queue.put('client count: %d\r\n' % len(self.server.dispatcher.clients))
+            self.controller.msg_queue.put('%s\r\n' % self.server.dispatcher.get_latency_string())
+            connection = self.station.connection_thread
+            if connection is not None and connection.link_decompressor is not None:
+                self.controller.msg_queue.put('station link: %s\r\n' % connection.link_decompressor.get_stats_string())
             for _id, sender in self.server.dispatcher.clients.copy().items():
-                self.controller.msg_queue.put('%d: %s, %d\r\n' %
-                                              (sender.sender_id, sender.address, sender.send_count))
+                self.controller.msg_queue.put('%d: %s, %d, drop %d (%d bytes), %s%s\r\n' %
+                                              (sender.sender_id, sender.address, sender.send_count,
+                                               sender.drop_count, sender.drop_bytes, sender.last_gga,
+                                               sender.get_link_string()))
+            for forwarder in self.forwarders:
+                self.controller.msg_queue.put('listen worker %d: drop %d\r\n'
+                                              % (forwarder.worker_id, forwarder.drop_count))
         elif command.startswith(b'send:') and len(command) > len('send:'):
             self.station.send(command[len('send:'):])
 
-    def stop_thread(self, name, thread_to_stop):
-        """结束指定线程
+    def get_client_count(self):
+        """所有端口的客户端数
+
+        Returns:
+            return (int): 客户端数
+        """
+        servers = [self.server] + [server for server, transcoder in self.transcode_servers.values()]
+        return sum(len(server.dispatcher.clients) for server in servers if server is not None)
+
+    def get_stats(self):
+        """收发计数，所有端口之和
+
+        Returns:
+            return (dict): bytes_in, frames_in, bytes_out, sends_out, clients, drop_count, drop_bytes,
+                以及 listenPort 开始监听的时间 bind_time, 所有端口中第一次向客户端发送数据的时间 first_send_time
+        """
+        stats = {'bytes_in': self.rcv_bytes, 'frames_in': self.rcv_count,
+                 'bind_time': self.server.bind_time if self.server is not None else 0}
+        servers = [self.server] + [server for server, transcoder in self.transcode_servers.values()]
+        for server in servers:
+            if server is not None:
+                for key, value in server.dispatcher.get_stats().items():
+                    if key == 'first_send_time':
+                        if value > 0 and (stats.get(key, 0) == 0 or value < stats[key]):
+                            stats[key] = value
+                    else:
+                        stats[key] = stats.get(key, 0) + value
+        return stats
+
+    def detach_servers(self):
+        """停止各端口的 ServerThread, 取出监听 socket 和客户端 socket, 用于移交给新的进程
+
+        Returns:
+            return (dict[int, tuple[socket.socket, list[tuple[socket.socket, tuple]]]]):
+                端口 -> (监听 socket, [(客户端 socket, 客户端地址)])
+        """
+        sockets = {}
+        servers = [(self.listen_port, self.server)] + \
+                  [(port, server) for port, (server, transcoder) in self.transcode_servers.items()]
+        for port, server in servers:
+            if server is not None and server.is_alive():
+                detached = server.detach()
+                if detached is not None:
+                    sockets[port] = detached
+        return sockets
+
+    def stop(self):
+        """通知线程退出，不等待"""
+        self.running = False
+        self.quit_event.set()
+
+    def stop_threads(self, threads):
+        """结束多个线程
+
+        先通知所有线程退出，再逐个等待，耗时取决于最慢的线程，而不是各线程之和。
 
         Args:
-            name (str): 要结束的线程名，名字仅用于 log
-            thread_to_stop (threading.Thread): 要结束的线程
+            threads (list[tuple[str, threading.Thread]]): (线程名, 要结束的线程), 名字仅用于 log
         """
-        try:
-            thread_to_stop.running = False
-            thread_to_stop.join()
-        except Exception as e:
-            log.error('rtk thread: failed to stop thread %s: %s' % (name, e))
+        for name, thread_to_stop in threads:
+            try:
+                thread_to_stop.running = False
+                if isinstance(thread_to_stop, ServerThread):
+                    thread_to_stop.dispatcher.wakeup()
+            except Exception as e:
+                log.error('rtk thread %s: failed to stop thread %s: %s' % (self.name, name, e))
+        for name, thread_to_stop in threads:
+            try:
+                thread_to_stop.join()
+            except Exception as e:
+                log.error('rtk thread %s: failed to stop thread %s: %s' % (self.name, name, e))
 
     def run(self):
-        log.info('rtk thread: start')
+        log.info('rtk thread %s: start' % self.name)
 
         # threads
-        self.server = ServerThread(self.listen_port)
+        self.server = ServerThread(self.listen_port, self.config, self.handoff.pop(self.listen_port, None))
+        for port, transcode in self.config.transcode_ports.items():
+            transcoder = MsmTranscoder.from_config(transcode)
+            self.transcode_servers[port] = (ServerThread(port, self.config, self.handoff.pop(port, None), transcoder),
+                                            transcoder)
+        # 新配置中不再使用的端口
+        close_sockets(self.handoff)
+        self.handoff = {}
         self.controller = ControlThread(self.control_port, self.got_command_cb)
         # station_mode 指基站的模式，本地的模式与之相反
         if self.station_mode == 'server':
@@ -100,19 +199,27 @@ class RtkThread(threading.Thread):
                                                self.got_data_cb, self.update_status_cb)
 
         self.server.start()
+        for port, (server, transcoder) in self.transcode_servers.items():
+            server.start()
+        for forwarder in self.forwarders:
+            forwarder.start()
         self.controller.start()
         self.station.start()
 
         # wait
         while self.running and self.server.running and self.station.running:
-            time.sleep(2)
+            self.quit_event.wait(timeout=2)
 
         # quit & clean up
-        self.stop_thread('controller', self.controller)
-        self.stop_thread('station', self.station)
-        self.stop_thread('server', self.server)
+        threads = [('controller', self.controller), ('station', self.station), ('server', self.server)]
+        threads += [('server %d' % port, server) for port, (server, transcoder) in self.transcode_servers.items()]
+        for forwarder in self.forwarders:
+            forwarder.stop()
+        self.stop_threads(threads)
+        for forwarder in self.forwarders:
+            forwarder.join(FORWARD_STOP_TIMEOUT)
 
         self.update_status_cb(RtkStatus.S_TERMINATED)
 
-        log.info('rtk thread: bye')
+        log.info('rtk thread %s: bye' % self.name)
         self.running = False
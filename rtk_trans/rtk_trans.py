@@ -14,6 +14,7 @@ import time
 from rtk_trans.rtk_process_mgr import RtkProcessMgr
 from rtk_utils import log, base64_log
 from rtk_utils import config_loader
+from rtk_utils.status_board import STARTUP_PHASES, get_startup_report
 
 
 class Rtk:
@@ -21,13 +22,14 @@ class Rtk:
         self.is_interrupt = False
 
         # config
-        self.configs = config_loader.load_config()
+        self.config_watcher = config_loader.ConfigWatcher()
+        self.configs, diff = self.config_watcher.load()
         if 'logPath' in self.configs.keys() and os.path.isdir(self.configs['logPath']):
             log.log_dir = self.configs['logPath']
         if 'rawPath' in self.configs.keys() and os.path.isdir(self.configs['rawPath']):
             base64_log.log_dir = self.configs['rawPath']
 
-        self.rtk_mgr = RtkProcessMgr(self.configs)
+        self.rtk_mgr = RtkProcessMgr(self.configs, self.config_watcher)
 
         # log init
         multiprocessing.current_process().name = 'rtk'
@@ -42,23 +44,41 @@ class Rtk:
         try:
             while True:
                 time.sleep(2)   # 减少死锁概率
-                print("enter 'q' to quit, 'r' to reload, 'l' to list ports.")
+                print("enter 'q' to quit, 'r' to reload, 'l' to list ports, 's' to show status, "
+                      "'t' to show startup time.")
                 key = input().lower().strip()
                 if key == 'q':
                     break
                 elif key == 'r':
                     log.info('main: reload config.')
-                    configs = config_loader.load_config()
-                    self.configs = configs
-                    self.rtk_mgr.start_threads_from_config(self.configs)
+                    self.rtk_mgr.reload_config()
                 elif key == 'l':
                     try:
                         print('name, station_port, dispatch_port, control_port')
-                        for name, config in sorted(self.configs['entry'].items()):
+                        for name, config in sorted(self.rtk_mgr.configs['entry'].items()):
                             print('%s, %d, %d, %s'
                                   % (name, config.station_port, config.listen_port, str(config.control_port)))
                     except Exception as e:
                         print('Error when list config: %s' % e)
+                elif key == 's':
+                    try:
+                        print('name, status, bytes_in, frames_in, bytes_out, sends_out, clients, '
+                              'drop_count, drop_bytes')
+                        for name, values in sorted(self.rtk_mgr.status_board.read_all().items()):
+                            print('%s, %s, %d, %d, %d, %d, %d, %d, %d'
+                                  % (name, values['state'], values['bytes_in'], values['frames_in'],
+                                     values['bytes_out'], values['sends_out'], values['clients'],
+                                     values['drop_count'], values['drop_bytes']))
+                    except Exception as e:
+                        print('Error when show status: %s' % e)
+                elif key == 't':
+                    try:
+                        print('name, %s (ms)' % ', '.join(phase for phase, field in STARTUP_PHASES))
+                        for name, values in sorted(self.rtk_mgr.status_board.read_all().items()):
+                            print('%s, %s' % (name, ', '.join('%.1f' % ms if ms is not None else '-'
+                                                              for phase, ms in get_startup_report(values))))
+                    except Exception as e:
+                        print('Error when show startup time: %s' % e)
         except KeyboardInterrupt:
             pass
         except (EOFError, OSError):
@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : rtk_worker_pool.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : 多组差分共用的工作进程池
+#
+
+import itertools
+import multiprocessing
+import threading
+import time
+from multiprocessing import Process, Pipe
+
+from rtk_trans.rtk_group import join_or_kill
+from rtk_trans.rtk_thread import RtkThread
+from rtk_utils.config_loader import Entry, WorkerPoolConfig
+from rtk_utils import log
+from rtk_utils.http_thread import RtkStatus
+from rtk_utils.status_board import StatusBoard, StatusReporter, STATUS_FLUSH_INTERVAL
+
+# 一组差分的负载 = 收到的字节率 * (1 + 客户端数) + ENTRY_BASE_LOAD,
+# 即每秒收发的字节数，加上每组差分固定的开销 (线程、心跳等)。尚未测量时按 ENTRY_BASE_LOAD 计
+ENTRY_BASE_LOAD = 1000
+REQUEST_TIMEOUT = 30    # 等待工作进程回复的时间 (s)
+JOIN_MIN_TIMEOUT = 0.5  # 共用的超时已用完时，等待已停止的差分回复 join 的时间 (s)
+MIGRATE_TIMEOUT = 5     # 迁移时等待差分在原工作进程中停止的时间 (s)
+
+
+class RtkWorker:
+    """工作进程，在同一个进程中运行若干组差分的 RtkThread
+
+    主进程经 pipe 发送命令，工作进程依次处理并回复。
+    """
+
+    def __init__(self, worker_id, status_board):
+        """初始化
+
+        Args:
+            worker_id (int): 工作进程 id
+            status_board (StatusBoard): 差分状态表
+        """
+        self.worker_id = worker_id
+        self.name = 'worker%d' % worker_id
+        self.entries = {}           # 差分名 -> Entry
+        self.loads = {}             # 差分名 -> 负载
+        self.counters = {}          # 差分名 -> (收到的字节数, 统计时间)
+        self.alive_entries = set()  # 仍在运行的差分名
+        self.lock = threading.Lock()
+        self.seq = itertools.count()
+        self.cmd_conn, child_conn = Pipe()
+        self.p = Process(name=self.name, target=worker_main, args=(child_conn, status_board, self.name))
+        self.p.daemon = True
+
+    def start(self):
+        self.p.start()
+
+    def join(self, deadline=None):
+        """等待进程退出
+
+        Args:
+            deadline (float): 最迟的时间 (time.time), 之后强制结束进程。None 表示一直等待
+        """
+        join_or_kill(self.p, deadline)
+
+    def is_alive(self):
+        return self.p.is_alive()
+
+    def post(self, command, *args):
+        """发送命令，不等待回复。回复会在之后的 request 中被忽略
+
+        Args:
+            command (str): 命令
+            args: 命令的参数
+        """
+        with self.lock:
+            if not self.p.is_alive():
+                raise Exception('%s is not running.' % self.name)
+            self.cmd_conn.send((next(self.seq), command) + args)
+
+    def request(self, command, *args, timeout=REQUEST_TIMEOUT):
+        """发送命令，等待回复
+
+        Args:
+            command (str): 命令
+            args: 命令的参数
+            timeout (float): 等待回复的时间 (s)
+
+        Returns:
+            return: 工作进程的回复
+        """
+        with self.lock:
+            if not self.p.is_alive():
+                raise Exception('%s is not running.' % self.name)
+            seq = next(self.seq)
+            self.cmd_conn.send((seq, command) + args)
+            deadline = time.time() + timeout
+            while True:
+                # 忽略之前超时的命令的回复
+                remaining = deadline - time.time()
+                if remaining <= 0 or not self.cmd_conn.poll(remaining):
+                    raise Exception('%s: no reply to %s.' % (self.name, command))
+                reply_seq, ok, result = self.cmd_conn.recv()
+                if reply_seq == seq:
+                    break
+        if not ok:
+            raise Exception('%s: %s' % (self.name, result))
+        return result
+
+    def get_load(self):
+        """所有差分的负载之和"""
+        return sum(self.loads.get(name, ENTRY_BASE_LOAD) for name in self.entries.keys())
+
+
+class RtkWorkerPool:
+    """工作进程池
+
+    每组差分放到负载最低的工作进程中运行。
+    定期统计各组差分的负载。开启 rebalance 时，最高的工作进程超过平均值的 hotRatio 倍时，迁移其中一组差分。
+    """
+
+    def __init__(self, config, status_board):
+        """初始化
+
+        Args:
+            config (WorkerPoolConfig): 进程池配置
+            status_board (StatusBoard): 差分状态表
+        """
+        self.config = config
+        self.status_board = status_board
+        self.workers = [RtkWorker(i, status_board) for i in range(config.workers)]
+        self.placement = {}     # 差分名 -> RtkWorker
+        self.stopping = set()   # 已通知停止、尚未 join 的差分名，工作进程重启时不再启动
+        self.lock = threading.RLock()
+        self.last_rebalance_time = time.time()
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        log.info('pool: %d workers started.' % len(self.workers))
+
+    def stop(self, timeout=None):
+        """停止所有工作进程
+
+        先通知所有工作进程退出，再等待。
+
+        Args:
+            timeout (float): 超时 (s), 超时后强制结束工作进程。None 表示一直等待
+        """
+        with self.lock:
+            for worker in self.workers:
+                try:
+                    worker.post('quit')
+                except Exception as e:
+                    log.error('pool: failed to stop %s: %s' % (worker.name, e))
+            deadline = time.time() + timeout if timeout is not None else None
+            for worker in self.workers:
+                worker.join(deadline)
+            self.placement.clear()
+            self.stopping.clear()
+
+    def start_entry(self, name, config):
+        """在负载最低的工作进程中启动一组差分
+
+        Args:
+            name (str): rtk 线程名
+            config (Entry): 配置表
+        """
+        with self.lock:
+            workers = [worker for worker in self.workers if worker.is_alive()]
+            if len(workers) == 0:
+                raise Exception('no worker is running.')
+            self.place(name, config, min(workers, key=RtkWorker.get_load))
+
+    def place(self, name, config, worker):
+        """在指定的工作进程中启动一组差分"""
+        worker.request('start', name, config, self.status_board.slot_indexes[name], time.time())
+        worker.entries[name] = config
+        worker.alive_entries.add(name)
+        self.placement[name] = worker
+        log.info('pool: %s started in %s.' % (name, worker.name))
+
+    def stop_entry(self, name):
+        """停止一组差分，不等待
+
+        之后需要调用 join_entry
+        """
+        with self.lock:
+            if name in self.placement.keys():
+                self.stopping.add(name)
+                self.placement[name].post('stop', name)
+
+    def join_entry(self, name, timeout=None):
+        """等待一组差分完全退出
+
+        线程无法强制结束，超时后强制结束所在的工作进程，其中其他的差分在新的工作进程中重新启动。
+
+        Args:
+            name (str): rtk 线程名
+            timeout (float): 超时 (s), None 表示 REQUEST_TIMEOUT
+        """
+        with self.lock:
+            self.stopping.discard(name)
+            worker = self.placement.pop(name, None)
+            if worker is None:
+                return
+            timeout = max(timeout, JOIN_MIN_TIMEOUT) if timeout is not None else REQUEST_TIMEOUT
+            if self.join_in_worker(name, worker, timeout):
+                self.respawn_workers()
+
+    def join_in_worker(self, name, worker, timeout):
+        """在工作进程中停止一组差分并等待退出，调用者已将其从 placement 中删除
+
+        超时 (或出错) 时强制结束工作进程，确保该差分的线程不再运行。
+
+        Args:
+            name (str): rtk 线程名
+            worker (RtkWorker): 差分所在的工作进程
+            timeout (float): 超时 (s)
+
+        Returns:
+            return (bool): 是否强制结束了工作进程，需调用 respawn_workers
+        """
+        try:
+            worker.request('join', name, timeout=timeout)
+            return False
+        except Exception as e:
+            if not worker.is_alive():
+                raise
+            log.warning('pool: %s did not stop in time (%s), kill %s.' % (name, e, worker.name))
+            worker.join(time.time())
+            return True
+        finally:
+            self.remove(name, worker)
+
+    def remove(self, name, worker):
+        """从工作进程的记录中删除一组差分"""
+        worker.entries.pop(name, None)
+        worker.loads.pop(name, None)
+        worker.counters.pop(name, None)
+        worker.alive_entries.discard(name)
+
+    def is_entry_alive(self, name):
+        """差分是否仍在运行"""
+        worker = self.placement.get(name)
+        return worker is not None and worker.is_alive() and name in worker.alive_entries
+
+    def check(self):
+        """由主循环定期调用，每隔 rebalanceInterval 重启意外退出的工作进程、统计负载，开启 rebalance 时迁移"""
+        if time.time() - self.last_rebalance_time < self.config.rebalance_interval:
+            return
+        self.last_rebalance_time = time.time()
+        with self.lock:
+            self.respawn_workers()
+            self.update_loads()
+            if self.config.rebalance:
+                self.rebalance()
+
+    def respawn_workers(self):
+        """重启意外退出的工作进程，其中的差分重新分配"""
+        for i, worker in enumerate(self.workers):
+            if worker.is_alive():
+                continue
+            log.error('pool: %s exited unexpectedly, exitcode %s.' % (worker.name, worker.p.exitcode))
+            new_worker = RtkWorker(worker.worker_id, self.status_board)
+            new_worker.start()
+            self.workers[i] = new_worker
+            for name, config in sorted(worker.entries.items()):
+                del self.placement[name]
+                if name in self.stopping:
+                    continue
+                try:
+                    self.start_entry(name, config)
+                except Exception as e:
+                    log.error('pool: failed to restart %s: %s' % (name, e))
+
+    def update_loads(self):
+        """向各工作进程查询收到的字节数和客户端数，计算负载"""
+        for worker in self.workers:
+            try:
+                stats = worker.request('load')
+            except Exception as e:
+                log.error('pool: failed to get load of %s: %s' % (worker.name, e))
+                continue
+            now = time.time()
+            worker.alive_entries = set(name for name, (rcv_bytes, clients, alive) in stats.items() if alive)
+            for name, (rcv_bytes, clients, alive) in stats.items():
+                if name in worker.counters.keys():
+                    last_bytes, last_time = worker.counters[name]
+                    rate = (rcv_bytes - last_bytes) / (now - last_time) if now > last_time else 0
+                    worker.loads[name] = rate * (1 + clients) + ENTRY_BASE_LOAD
+                worker.counters[name] = (rcv_bytes, now)
+
+    def rebalance(self):
+        """负载最高的工作进程过热时，迁移一组差分到负载最低的工作进程
+
+        选择迁移后两者中较高的负载最低的一组差分，迁移后不能比原来更高，避免来回迁移。
+        """
+        workers = [worker for worker in self.workers if worker.is_alive()]
+        if len(workers) < 2:
+            return
+        loads = {worker.name: worker.get_load() for worker in workers}
+        hot = max(workers, key=lambda worker: loads[worker.name])
+        cold = min(workers, key=lambda worker: loads[worker.name])
+        mean = sum(loads.values()) / len(workers)
+        if loads[hot.name] <= mean * self.config.hot_ratio:
+            return
+        best_name = None
+        best_max = loads[hot.name]
+        for name in hot.entries.keys():
+            load = hot.loads.get(name, ENTRY_BASE_LOAD)
+            new_max = max(loads[hot.name] - load, loads[cold.name] + load)
+            if new_max < best_max:
+                best_name, best_max = name, new_max
+        if best_name is not None:
+            self.migrate(best_name, hot, cold)
+
+    def migrate(self, name, src, dst):
+        """迁移一组差分
+
+        先在原工作进程中停止，释放端口后再在新的工作进程中启动，期间客户端会断开重连。
+        MIGRATE_TIMEOUT 内未停止时与 join_entry 相同，强制结束原工作进程，其中其他的差分重新启动。
+        """
+        config = src.entries[name]
+        load = src.loads.get(name, ENTRY_BASE_LOAD)
+        log.info('pool: migrate %s from %s to %s, load %.0f.' % (name, src.name, dst.name, load))
+        del self.placement[name]
+        try:
+            killed = self.join_in_worker(name, src, MIGRATE_TIMEOUT)
+        except Exception as e:
+            # 原工作进程已退出，差分的线程也已结束
+            log.error('pool: failed to stop %s in %s: %s' % (name, src.name, e))
+            killed = True
+        if killed:
+            self.respawn_workers()
+        self.place(name, config, dst)
+        dst.loads[name] = load
+
+
+class PooledEntry:
+    """运行在工作进程池中的一组差分，接口与 RtkGroup 相同"""
+
+    def __init__(self, pool, name, thread_id, config, status_board):
+        """初始化
+
+        Args:
+            pool (RtkWorkerPool): 工作进程池
+            name (str): rtk 线程名
+            thread_id (int): 线程 id
+            config (Entry): 配置表
+            status_board (StatusBoard): 差分状态表
+        """
+        self.pool = pool
+        self.name = name
+        self.thread_id = thread_id
+        self.config = config
+        self.status_board = status_board
+        self.status_board.alloc(self.name)
+
+    def start(self):
+        if not self.is_alive():
+            self.pool.start_entry(self.name, self.config)
+
+    def stop(self):
+        # require stop
+        self.pool.stop_entry(self.name)
+
+    def join(self, timeout=None):
+        """等待差分线程退出，超时后强制结束所在的工作进程
+
+        Args:
+            timeout (float): 超时 (s), None 表示 REQUEST_TIMEOUT
+        """
+        self.pool.join_entry(self.name, timeout)
+        self.status_board.set_state(self.name, RtkStatus.S_TERMINATED)
+
+    def is_alive(self):
+        return self.pool.is_entry_alive(self.name)
+
+
+def worker_main(cmd_conn, status_board, name):
+    """工作进程主函数
+
+    Args:
+        cmd_conn (multiprocessing.connection.Connection): 接收命令、发送回复的 pipe
+        status_board (StatusBoard): 差分状态表
+        name (str): 进程名
+    """
+    log.init(name, False)
+    log.info('worker: start')
+
+    rtk_threads = {}
+    status_reporters = {}   # 差分名 -> StatusReporter
+    running = True
+    while running:
+        try:
+            for status_reporter in status_reporters.values():
+                status_reporter.flush()
+            if not cmd_conn.poll(STATUS_FLUSH_INTERVAL):
+                continue
+            message = cmd_conn.recv()
+        except KeyboardInterrupt:
+            continue
+        except (EOFError, OSError):
+            break   # 主进程已退出
+        seq, command, args = message[0], message[1], message[2:]
+        try:
+            result = handle_command(rtk_threads, status_reporters, status_board, command, *args)
+            reply = (seq, True, result)
+        except Exception as e:
+            log.error('worker: failed to handle %s: %s' % (command, e))
+            reply = (seq, False, str(e))
+        if command == 'quit':
+            running = False
+        try:
+            cmd_conn.send(reply)
+        except (EOFError, OSError):
+            break
+
+    stop_all(rtk_threads)
+    for status_reporter in status_reporters.values():
+        status_reporter.flush()
+    cmd_conn.close()
+
+    log.info('worker: bye')
+    log.close(name)
+
+
+def handle_command(rtk_threads, status_reporters, status_board, command, *args):
+    """处理主进程的命令
+
+    Args:
+        rtk_threads (dict[str, RtkThread]): 本进程中的差分线程
+        status_reporters (dict[str, StatusReporter]): 各组差分的状态更新
+        status_board (StatusBoard): 差分状态表
+        command (str): 命令
+        args: 命令的参数
+
+    Returns:
+        return: 回复的内容
+    """
+    if command == 'start':
+        name, config, slot_index, start_time = args
+        if config.enable_log:
+            # 日志按工作进程记录，其中任一组差分开启 enableLog 时写入文件
+            log.enable_file(multiprocessing.current_process().name)
+        if name in rtk_threads.keys():
+            if rtk_threads[name].is_alive():
+                raise Exception('%s is already running.' % name)
+            del rtk_threads[name]
+        if config.listen_workers > 1:
+            log.warning('worker: %s: listenWorkers is ignored in worker pool.' % name)
+        if config.enable_raw:
+            log.warning('worker: %s: enableRaw is ignored in worker pool.' % name)
+        status_reporter = StatusReporter(name, status_board.get_slot(slot_index), start_time=start_time)
+        rtk_thread = RtkThread(name, config, status_reporter.update)
+        status_reporter.get_stats = rtk_thread.get_stats
+        rtk_thread.start()
+        rtk_threads[name] = rtk_thread
+        status_reporters[name] = status_reporter
+    elif command == 'stop':
+        name, = args
+        if name in rtk_threads.keys():
+            rtk_threads[name].stop()
+    elif command == 'join':
+        name, = args
+        if name in rtk_threads.keys():
+            rtk_thread = rtk_threads.pop(name)
+            rtk_thread.stop()
+            rtk_thread.join()
+            status_reporters.pop(name).flush()
+    elif command == 'load':
+        return {name: (rtk_thread.rcv_bytes, rtk_thread.get_client_count(), rtk_thread.is_alive())
+                for name, rtk_thread in rtk_threads.items()}
+    elif command == 'quit':
+        stop_all(rtk_threads)
+    else:
+        raise Exception('unknown command %s.' % command)
+    return None
+
+
+def stop_all(rtk_threads):
+    """停止本进程中所有的差分线程"""
+    for rtk_thread in rtk_threads.values():
+        rtk_thread.stop()
+    for rtk_thread in rtk_threads.values():
+        rtk_thread.join()
+    rtk_threads.clear()
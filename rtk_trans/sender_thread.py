@@ -6,74 +6,96 @@
 # Description   :
 #
 
-import queue
+import selectors
 import socket
 import threading
 
+from rtk_trans.client_connection import ClientConnection
 from rtk_utils import log
 
 
-class SenderThread(threading.Thread):
-    """负责与一个客户端通信的线程"""
+class SenderThread(ClientConnection, threading.Thread):
+    """负责与一个客户端通信的线程
 
-    def __init__(self, client_socket, address, _id):
+    thread 模式下使用。收发逻辑与 ClientConnection 相同，但每个客户端有自己的线程。
+    selector 同时监视客户端 socket 与本线程的唤醒 socket, 无限期阻塞，没有定时轮询。
+    ring 中有新数据或需要退出时，由 Dispatcher 逐个写唤醒 socket, 只唤醒需要的线程。
+    selector 为 poll/select, 每个客户端占用自己的 socket 和一对唤醒 socket。
+    """
+
+    def __init__(self, client_socket, address, _id, ring, max_coalesce_size, policy, snapshot,
+                 link_compression=False):
         """构造函数
 
         Args:
             client_socket (socket.socket): 与客户端通信的 socket
             address (tuple[str, int]): 客户端地址
             _id (int): SenderThread 的 ID
+            ring (BroadcastRing): 待分发数据所在的缓冲区
+            max_coalesce_size (int): 每次写 socket 的最大长度
+            policy (ClientPolicy): 慢客户端的处理策略
+            snapshot (bytes): 连接建立后首先发送的缓存报文
+            link_compression (bool): 客户端 (下游的 rtk_trans) 请求时，是否压缩发送的数据
         """
-        super().__init__()
-        self.client_socket = client_socket
-        self.address = address
-        self.sender_id = _id
-        self.data_queue = queue.Queue()
-        self.send_count = 0
-        self.running = True
+        threading.Thread.__init__(self)
+        # epoll/kqueue 本身也占用一个 fd, 这里只监视两个 socket, 用 poll 即可
+        selector = selectors.PollSelector() if hasattr(selectors, 'PollSelector') else selectors.SelectSelector()
+        ClientConnection.__init__(self, client_socket, address, _id, selector, ring,
+                                  max_coalesce_size, policy, snapshot, link_compression)
+
+        # 有新数据或需要退出时唤醒 selector
+        self.wakeup_rcv, self.wakeup_send = socket.socketpair()
+        self.wakeup_rcv.setblocking(False)
+        self.wakeup_send.setblocking(False)
+        self.wakeup_pending = False
+        self.selector.register(self.wakeup_rcv, selectors.EVENT_READ, self.handle_wakeup)
 
     def run(self):
         """线程主函数
 
-        循环运行，接收来自客户端的数据并丢弃，向客户端发送 data_queue 中的数据包。
-        当 data_queue 过长时，丢弃旧的数据包。
+        循环运行，等待唤醒、socket 可读或可写。接收来自客户端的数据，向客户端发送 ring 中 cursor 之后的数据。
         """
-        log.info('sender thread %d: start, %s' % (self.sender_id, self.address))
         try:
+            self.send_data()    # snapshot
             while self.running:
-                # ignore old data
-                while self.data_queue.qsize() > 10:
-                    self.data_queue.get(block=False)
-                # send data
-                try:
-                    data = self.data_queue.get(timeout=1)
-                    self.client_socket.settimeout(5)
-                    self.client_socket.sendall(data)
-                    self.send_count += 1
-                    self.data_queue.task_done()
-                except queue.Empty:
-                    pass
-                # rcv useless data
-                try:
-                    self.client_socket.settimeout(0.1)
-                    rcv_buf = self.client_socket.recv(256)
-                    if len(rcv_buf) == 0:
-                        log.info('sender thread %d has disconnected.' % self.sender_id)
-                        # 退出
-                        break
-                except socket.timeout:
-                    pass
+                for key, mask in self.selector.select():
+                    key.data(mask)
         except Exception as e:
             log.error('sender thread %d error: %s' % (self.sender_id, e))
-        self.disconnect()
         self.running = False
-        log.info('sender thread %d: bye' % self.sender_id)
+        self.close()
+        self.selector.close()
+        self.wakeup_rcv.close()
+        self.wakeup_send.close()
+
+    def wakeup(self):
+        """ring 中有新数据或需要退出时，唤醒阻塞在 select 中的线程
+
+        在 Dispatcher 所在的线程中调用。已有未处理的唤醒时不再写 socket。
+        """
+        if self.wakeup_pending:
+            return
+        self.wakeup_pending = True
+        try:
+            self.wakeup_send.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            pass    # 缓冲区满，说明已经有未处理的唤醒
+        except OSError as e:
+            log.debug('sender thread %d wakeup error: %s' % (self.sender_id, e))
+
+    def handle_wakeup(self, mask):
+        """唤醒 socket 的事件回调
 
-    def disconnect(self):
-        """断开连接"""
+        Args:
+            mask (int): 就绪的事件
+        """
+        # 先取走唤醒字节，再清除标记，最后读 ring:
+        # 清除标记之前写入 ring 的数据会在下面发送，之后写入的数据会再次唤醒
         try:
-            self.client_socket.close()
-        except socket.error:
+            while len(self.wakeup_rcv.recv(4096)) > 0:
+                pass
+        except (BlockingIOError, InterruptedError):
             pass
-        except Exception as e:
-            log.error('sender thread %d exception when close: %s' % (self.sender_id, e))
+        self.wakeup_pending = False
+        if self.running:
+            self.send_data()
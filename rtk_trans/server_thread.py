@@ -7,54 +7,105 @@
 # 
 
 import os
+import selectors
 import socket
 import threading
+import time
 
 from rtk_trans.dispatcher import Dispatcher
+from rtk_utils.config_loader import Entry
 from rtk_utils import log
 
 
 class ServerThread(threading.Thread):
     """监听来自客户端的连接的线程"""
 
-    def __init__(self, port):
+    def __init__(self, port, config, handoff=None, transcoder=None):
         """构造函数
 
         Args:
             port (int): 监听的端口
+            config (Entry): 配置
+            handoff (tuple[socket.socket, list[tuple[socket.socket, tuple]]]):
+                旧进程移交的监听 socket 和客户端, None 表示新建监听 socket
+            transcoder (MsmTranscoder): 分发前对报文转码, None 表示不转码
         """
         super().__init__()
         self.port = port
-        self.dispatcher = Dispatcher()
+        self.reuse_port = config.listen_workers > 1
+        self.dispatcher = Dispatcher(config, transcoder)
+        self.handoff = handoff
+        self.detaching = False
+        self.detached = None    # detach 后取出的 (监听 socket, [(客户端 socket, 客户端地址)])
+        self.bind_time = 0      # 开始监听的时间 (time.time)
         self.running = True
 
     def run(self):
         """线程主函数
 
-        循环运行，接受新的客户端的连接。
+        循环运行，接受新的客户端的连接。收到差分数据时由 dispatcher 唤醒并立即分发。
+        select 模式下，同时在本线程中处理所有客户端 socket 的读写。
         """
         log.info('server thread: start, port: %d' % self.port)
         try:
-            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            if os.name != 'nt':
-                server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            server.bind(('0.0.0.0', self.port))
-            server.listen(100)      # 并发
-            server.settimeout(1)    # timeout: 1s
+            if self.handoff is not None:
+                # 沿用旧进程的监听 socket 和客户端连接
+                server, clients = self.handoff
+                self.handoff = None
+                for client_socket, address in clients:
+                    self.dispatcher.add_client(client_socket, address, adopted=True)
+                log.info('server thread: adopted %d client(s)' % len(clients))
+            else:
+                server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                if os.name != 'nt':
+                    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+                if self.reuse_port:
+                    # 多个进程监听同一端口，由内核分配连接
+                    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+                server.bind(('0.0.0.0', self.port))
+                server.listen(100)      # 并发
+            server.setblocking(False)
+            self.bind_time = time.time()
+            self.dispatcher.selector.register(server, selectors.EVENT_READ, lambda mask: self.accept(server))
             while self.running:
-                # 接受连接
-                try:
-                    conn, address = server.accept()
-                    conn.settimeout(3)
-                    self.dispatcher.add_client(conn, address)
-                    log.debug('new client from: %s' % str(address))
-                except socket.timeout:
-                    pass
-                # 分发数据
+                # 接受连接、分发数据, select 模式下还包括客户端的读写
+                self.dispatcher.poll(timeout=1)     # timeout: 1s
+            self.dispatcher.selector.unregister(server)
+            if self.detaching:
+                # 已收到的数据先写入 ring, 由 detach_all_clients 发送
                 self.dispatcher.dispatch()
-            server.close()
-            self.dispatcher.close_all_clients()
+                self.dispatcher.flush_batch()
+                self.detached = (server, self.dispatcher.detach_all_clients())
+            else:
+                server.close()
+                self.dispatcher.close_all_clients()
             log.info('server thread: bye')
         except Exception as e:
             log.error('server thread error: %s' % e)
             self.running = False
+
+    def detach(self):
+        """停止服务，取出监听 socket 和客户端 socket, 用于移交给新的进程
+
+        Returns:
+            return (tuple[socket.socket, list[tuple[socket.socket, tuple]]]):
+                (监听 socket, [(客户端 socket, 客户端地址)]), 线程异常退出时为 None
+        """
+        self.detaching = True
+        self.running = False
+        self.dispatcher.wakeup()
+        self.join()
+        return self.detached
+
+    def accept(self, server):
+        """接受新的客户端连接
+
+        Args:
+            server (socket.socket): server socket
+        """
+        try:
+            conn, address = server.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        self.dispatcher.add_client(conn, address)
+        log.debug('new client from: %s' % str(address))
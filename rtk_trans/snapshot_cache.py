@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : snapshot_cache.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   :
+#
+
+import time
+
+from rtk_protocol.rtcm_util import get_bits, get_msg_type, iter_frames
+
+# 基站信息类报文，每种只保留最新的一条
+STATION_MSG_TYPES = (1005, 1006, 1007, 1008, 1033, 1230)
+# 星历报文，每颗卫星保留最新的一条。值为卫星号的 bit 数
+EPHEMERIS_MSG_TYPES = {1019: 6, 1020: 6, 1041: 6, 1042: 6, 1044: 4, 1045: 6, 1046: 6}
+# 超过此时间 (s) 没有更新的报文不再发送
+SNAPSHOT_MAX_AGE = 600
+
+
+class SnapshotCache:
+    """缓存最新的基站信息和星历报文，新客户端连入时立即发送，不必等待下一次播发"""
+
+    def __init__(self):
+        """构造函数"""
+        self.messages = {}      # (报文类型, 卫星号) -> (报文, 接收时间)
+
+    def update(self, data):
+        """收到数据包时调用，缓存其中需要的报文
+
+        Args:
+            data (bytes): 数据包，一般为单条 rtcm 报文，也可以是包含多条报文的任意数据
+        """
+        if len(data) >= 8 and data[0] == 0xd3 and ((data[1] & 0b11) << 8) + data[2] + 6 == len(data):
+            self.cache_message(data, get_msg_type(data[3:]))
+            return
+        for index, len_message, msg_type in iter_frames(data):
+            if len_message > 0 and (msg_type in STATION_MSG_TYPES or msg_type in EPHEMERIS_MSG_TYPES):
+                self.cache_message(bytes(data[index:index + len_message]), msg_type)
+
+    def cache_message(self, data, msg_type):
+        """缓存一条需要的报文，其他报文忽略
+
+        Args:
+            data (bytes): 完整的单条 rtcm 报文
+            msg_type (int): 报文类型
+        """
+        if msg_type in STATION_MSG_TYPES:
+            self.messages[(msg_type, 0)] = (data, time.time())
+        elif msg_type in EPHEMERIS_MSG_TYPES:
+            # 卫星号紧跟在 3 字节帧头和 12 bit 的报文类型之后
+            sat_id = get_bits(data, 36, EPHEMERIS_MSG_TYPES[msg_type])
+            self.messages[(msg_type, sat_id)] = (data, time.time())
+
+    def get_snapshot(self):
+        """获取所有未过期的缓存报文
+
+        Returns:
+            return (bytes): 按报文类型、卫星号排列的报文
+        """
+        now = time.time()
+        for key, (data, rcv_time) in list(self.messages.items()):
+            if now - rcv_time > SNAPSHOT_MAX_AGE or now < rcv_time:
+                del self.messages[key]
+        return b''.join(data for key, (data, rcv_time) in sorted(self.messages.items()))
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : socket_handoff.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : 重新加载配置时，在进程间移交监听 socket 和客户端 socket
+#
+
+import pickle
+import socket
+import struct
+from multiprocessing import reduction
+
+# 需要 unix socket 和 SCM_RIGHTS, Windows 上不支持
+HANDOFF_SUPPORTED = hasattr(socket, 'AF_UNIX') and hasattr(reduction, 'sendfds')
+HANDOFF_TIMEOUT = 10    # 等待旧进程移交 socket 的时间 (s)
+MAX_FDS_PER_MESSAGE = 200   # 每条消息最多附带的文件描述符数，SCM_RIGHTS 有上限
+HEADER_FORMAT = struct.Struct('<I')
+
+
+def send_sockets(conn, sockets):
+    """经 unix socket 发送各端口的监听 socket 和客户端 socket
+
+    Args:
+        conn (socket.socket): unix socket
+        sockets (dict[int, tuple[socket.socket, list[tuple[socket.socket, tuple]]]]):
+            端口 -> (监听 socket, [(客户端 socket, 客户端地址)])
+    """
+    header = []
+    fds = []
+    for port, (server, clients) in sockets.items():
+        header.append((port, [address for client, address in clients]))
+        fds.append(server.fileno())
+        fds.extend(client.fileno() for client, address in clients)
+    data = pickle.dumps(header)
+    conn.sendall(HEADER_FORMAT.pack(len(data)) + data)
+    for i in range(0, len(fds), MAX_FDS_PER_MESSAGE):
+        reduction.sendfds(conn, fds[i:i + MAX_FDS_PER_MESSAGE])
+
+
+def recv_sockets(conn, timeout=HANDOFF_TIMEOUT):
+    """接收 send_sockets 发送的 socket
+
+    Args:
+        conn (socket.socket): unix socket
+        timeout (float): 超时 (s)
+
+    Returns:
+        return (dict[int, tuple[socket.socket, list[tuple[socket.socket, tuple]]]]):
+            端口 -> (监听 socket, [(客户端 socket, 客户端地址)])
+    """
+    conn.settimeout(timeout)
+    len_data = HEADER_FORMAT.unpack(recv_all(conn, HEADER_FORMAT.size))[0]
+    header = pickle.loads(recv_all(conn, len_data))
+    count = sum(1 + len(addresses) for port, addresses in header)
+    fds = []
+    while len(fds) < count:
+        fds.extend(reduction.recvfds(conn, min(MAX_FDS_PER_MESSAGE, count - len(fds))))
+    sockets = {}
+    fds.reverse()
+    for port, addresses in header:
+        server = socket.socket(fileno=fds.pop())
+        sockets[port] = (server, [(socket.socket(fileno=fds.pop()), address) for address in addresses])
+    return sockets
+
+
+def recv_all(conn, length):
+    """接收指定长度的数据"""
+    data = b''
+    while len(data) < length:
+        chunk = conn.recv(length - len(data))
+        if len(chunk) == 0:
+            raise EOFError('connection closed during handoff.')
+        data += chunk
+    return data
+
+
+def close_sockets(sockets):
+    """关闭本进程中的 socket, 不影响已移交给其他进程的副本
+
+    Args:
+        sockets (dict[int, tuple[socket.socket, list[tuple[socket.socket, tuple]]]]): 各端口的 socket
+    """
+    for port, (server, clients) in sockets.items():
+        server.close()
+        for client, address in clients:
+            client.close()
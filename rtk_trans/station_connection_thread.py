@@ -11,11 +11,14 @@ import socket
 import threading
 
 from rtk_protocol.select_protocol import select_protocol
+from rtk_trans.link_compression import LINK_HELLO, LinkDecompressor
 from rtk_utils import log, base64_log
 from rtk_utils.config_loader import Entry
 from rtk_utils.http_thread import RtkStatus
 
 BUFFER_SIZE = 4096
+MAX_BUFFER_SIZE = 65536
+SHRINK_AFTER_READS = 64     # 连续多少次 recv 都用不到一半的缓冲区时减半
 
 
 class StationConnectionThread(threading.Thread):
@@ -39,11 +42,20 @@ class StationConnectionThread(threading.Thread):
         self.address = address
 
         self.data_queue = queue.Queue()
+        self.max_coalesce_size = config.max_coalesce_size
         self.protocol_handler = select_protocol(config.__dict__)
+        # 差分源为上游的 rtk_trans 时，请求压缩链路
+        self.link_decompressor = LinkDecompressor() if config.compress_station_link else None
 
         self.got_data_cb = lambda data: None    # 连接建立后再设置
         self.update_status_cb = lambda status: None
 
+        # 接收缓冲区，重复使用。一次 recv 填满时加倍，直到 MAX_BUFFER_SIZE；
+        # 连续 SHRINK_AFTER_READS 次 recv 都不到一半时减半，直到 BUFFER_SIZE
+        self.rcv_buffer = bytearray(BUFFER_SIZE)
+        self.rcv_view = memoryview(self.rcv_buffer)
+        self.small_read_count = 0
+
         self.rcv_count = 0
         self.handshake_ok = False
         self.running = True
@@ -68,17 +80,20 @@ class StationConnectionThread(threading.Thread):
     def send_and_receive_data(self):
         """循环发送、接收数据"""
         timeout_count = 0
+        if self.link_decompressor is not None:
+            self.client_socket.sendall(LINK_HELLO)
         while self.running:
             # 发送数据
             self.send_data_from_queue()
             # 接收数据
             try:
-                data = self.client_socket.recv(BUFFER_SIZE)
+                len_data = self.client_socket.recv_into(self.rcv_view)
                 # 连接失败的处理
-                if len(data) == 0:
+                if len_data == 0:
                     raise RuntimeError('socket connection broken')
                 # 收到数据后的处理
-                self.parse_data(data)
+                self.parse_data(self.rcv_view[:len_data])
+                self.resize_buffer(len_data)
                 timeout_count = 0
             except socket.timeout:
                 # 超时处理，超时 10 次时主动断开
@@ -90,37 +105,96 @@ class StationConnectionThread(threading.Thread):
         self.disconnect()
 
     def send_data_from_queue(self):
-        """发送队列里的所有数据"""
-        data = b''
+        """发送队列里的所有数据
+
+        每次合并不超过 max_coalesce_size 的数据包后发送。
+        """
+        buffers = []
+        len_buffers = 0
         try:
             while self.data_queue.qsize() > 0:
-                data += self.data_queue.get(block=False)
+                data = self.data_queue.get(block=False)
                 self.data_queue.task_done()
+                if len_buffers > 0 and len_buffers + len(data) > self.max_coalesce_size:
+                    self.client_socket.sendall(b''.join(buffers))
+                    buffers.clear()
+                    len_buffers = 0
+                buffers.append(data)
+                len_buffers += len(data)
         except queue.Empty:
             pass
-        if len(data) > 0:
-            self.client_socket.sendall(data)
+        if len_buffers > 0:
+            self.client_socket.sendall(b''.join(buffers))
+
+    def resize_buffer(self, len_data):
+        """根据 recv 的长度调整接收缓冲区
+
+        被填满时加倍，以减少 recv 次数；数据率下降后，连续多次用不到一半时减半，释放内存。
+
+        Args:
+            len_data (int): 本次 recv 的长度
+        """
+        size = len(self.rcv_buffer)
+        if len_data == size:
+            self.small_read_count = 0
+            if size < MAX_BUFFER_SIZE:
+                self.set_buffer_size(min(size * 2, MAX_BUFFER_SIZE))
+        elif len_data <= size // 2 and size > BUFFER_SIZE:
+            self.small_read_count += 1
+            if self.small_read_count >= SHRINK_AFTER_READS:
+                self.small_read_count = 0
+                self.set_buffer_size(max(size // 2, BUFFER_SIZE))
+        else:
+            self.small_read_count = 0
+
+    def set_buffer_size(self, size):
+        """更换接收缓冲区
+
+        Args:
+            size (int): 新的缓冲区大小
+        """
+        self.rcv_buffer = bytearray(size)
+        self.rcv_view = memoryview(self.rcv_buffer)
+        log.debug('station connection thread: buffer size %d' % size)
 
     def parse_data(self, data):
         """收到数据后的处理
 
+        data 指向接收缓冲区，返回后会被覆盖，需要保留的数据由 protocol_handler 拷贝。
+        不过滤报文时，握手后直接转发，只拷贝一次。
+
         Args:
-            data (list): 新收到的数据
+            data (memoryview): 新收到的数据
         """
         self.rcv_count += 1
         log.debug('rcv %d bytes. id: %d' % (len(data), self.rcv_count))
-        base64_log.raw(bytes(data))
+        if self.link_decompressor is not None:
+            for chunk in self.link_decompressor.feed(data):
+                self.handle_data(chunk)
+        else:
+            self.handle_data(data)
+
+    def handle_data(self, data):
+        """处理 (解压后的) 差分数据
+
+        Args:
+            data (memoryview): 差分数据
+        """
+        base64_log.raw(data)
+        if self.handshake_ok and self.protocol_handler.passthrough:
+            self.got_data_cb(bytes(data))
+            return
         self.protocol_handler.push_back(data)
 
         # 握手
         if not self.handshake_ok:
             self.handshake_ok = self.protocol_handler.handshake()
         # 处理
-        while self.running and self.handshake_ok:
-            data = self.protocol_handler.get_parsed_data()
-            if data is None or len(data) <= 0:
-                break
-            self.got_data_cb(data)
+        if self.handshake_ok:
+            for data in self.protocol_handler.get_parsed_data_list():
+                if not self.running:
+                    break
+                self.got_data_cb(data)
 
     def add_data_to_send_queue(self, data):
         """向发送队列加入数据
@@ -8,8 +8,12 @@
 
 import json
 import os
+import socket
 import sys
 
+from rtk_protocol.msm_transcoder import MsmTranscoder
+from rtk_protocol.rtcm_filter import RtcmFilter
+from rtk_protocol.select_protocol import DEFAULT_PROTOCOL, get_protocol_names
 from rtk_utils import log
 
 
@@ -23,17 +27,71 @@ class Entry(object):
         self.listen_port = int(config['listenPort'])
         self.control_port = int(config['controlPort']) \
             if 'controlPort' in config.keys() else None
+        self.protocol = str(config['protocol']).lower().strip() \
+            if 'protocol' in config.keys() else DEFAULT_PROTOCOL
         self.filter = list(config['filter']) \
             if 'filter' in config.keys() else None
+        self.filter_exclude = list(config['filterExclude']) \
+            if 'filterExclude' in config.keys() else None
+        self.decimation = dict(config['decimation']) \
+            if 'decimation' in config.keys() else None
         self.enable_log = (str(config['enableLog']).lower().strip() == 'true') \
             if 'enableLog' in config.keys() else False
         self.enable_raw = (str(config['enableRaw']).lower().strip() == 'true') \
             if 'enableRaw' in config.keys() else False
+        self.sender_mode = str(config['senderMode']).lower().strip() \
+            if 'senderMode' in config.keys() else 'thread'
+        self.max_coalesce_size = int(config['maxCoalesceSize']) \
+            if 'maxCoalesceSize' in config.keys() else 65536
+        self.client_max_bytes = int(config['clientMaxBytes']) \
+            if 'clientMaxBytes' in config.keys() else 65536
+        self.client_max_age_ms = int(config['clientMaxAgeMs']) \
+            if 'clientMaxAgeMs' in config.keys() else 10000
+        self.client_overflow = str(config['clientOverflow']).lower().strip() \
+            if 'clientOverflow' in config.keys() else 'dropoldest'
+        self.snapshot_cache = (str(config['snapshotCache']).lower().strip() == 'true') \
+            if 'snapshotCache' in config.keys() else True
+        self.listen_workers = int(config['listenWorkers']) \
+            if 'listenWorkers' in config.keys() else 1
+        self.epoch_batch_ms = int(config['epochBatchMs']) \
+            if 'epochBatchMs' in config.keys() else 50
+        self.compress_station_link = (str(config['compressStationLink']).lower().strip() == 'true') \
+            if 'compressStationLink' in config.keys() else False
+        self.compress_listen_link = (str(config['compressListenLink']).lower().strip() == 'true') \
+            if 'compressListenLink' in config.keys() else False
+        self.transcode = dict(config['transcode']) \
+            if 'transcode' in config.keys() else None
+        self.transcode_ports = {int(port): dict(transcode) for port, transcode in config['transcodePorts'].items()} \
+            if 'transcodePorts' in config.keys() else {}
 
         if self.station_mode != 'server' and self.station_mode != 'client':
             raise Exception('Unrecognized station mode "%s". Should be "server" or "client".' % self.station_mode)
         if self.station_mode == 'server' and self.station_ip_address is None:
             raise Exception('Server station ip not set.')
+        if self.protocol not in get_protocol_names():
+            raise Exception('Unrecognized protocol "%s". Should be one of %s.' % (self.protocol, get_protocol_names()))
+        # 检查报文过滤、转码规则
+        RtcmFilter.from_config(self.__dict__)
+        MsmTranscoder.from_config(self.transcode)
+        for port, transcode in self.transcode_ports.items():
+            if port == self.listen_port:
+                raise Exception('transcodePorts should not contain listenPort.')
+            MsmTranscoder.from_config(transcode)
+        if self.sender_mode != 'thread' and self.sender_mode != 'select':
+            raise Exception('Unrecognized sender mode "%s". Should be "thread" or "select".' % self.sender_mode)
+        if self.max_coalesce_size <= 0:
+            raise Exception('maxCoalesceSize should be positive.')
+        if self.client_max_bytes <= 0:
+            raise Exception('clientMaxBytes should be positive.')
+        if self.client_overflow != 'dropoldest' and self.client_overflow != 'disconnect':
+            raise Exception('Unrecognized client overflow "%s". Should be "dropOldest" or "disconnect".'
+                            % self.client_overflow)
+        if self.epoch_batch_ms < 0:
+            raise Exception('epochBatchMs should not be negative.')
+        if self.listen_workers < 1:
+            raise Exception('listenWorkers should be positive.')
+        if self.listen_workers > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+            raise Exception('listenWorkers > 1 requires SO_REUSEPORT.')
 
     def __str__(self):
         return str(self.__dict__)
@@ -42,45 +100,201 @@ class Entry(object):
         return self.__dict__ == other.__dict__
 
 
+class WorkerPoolConfig(object):
+    """工作进程池配置对象"""
+    def __init__(self, config):
+        self.workers = int(config['workers']) \
+            if 'workers' in config.keys() else (os.cpu_count() or 1)
+        self.rebalance_interval = int(config['rebalanceInterval']) \
+            if 'rebalanceInterval' in config.keys() else 30
+        self.hot_ratio = float(config['hotRatio']) \
+            if 'hotRatio' in config.keys() else 1.5
+        self.rebalance = (str(config['rebalance']).lower().strip() == 'true') \
+            if 'rebalance' in config.keys() else False
+
+        if self.workers < 1:
+            raise Exception('workers should be positive.')
+        if self.rebalance_interval <= 0:
+            raise Exception('rebalanceInterval should be positive.')
+        if self.hot_ratio <= 1:
+            raise Exception('hotRatio should be greater than 1.')
+
+    def __str__(self):
+        return str(self.__dict__)
+
+    def __eq__(self, other):
+        return self.__dict__ == other.__dict__
+
+
+class EntryDiff(object):
+    """两次加载之间各组差分配置的变化"""
+    def __init__(self, added, removed, changed, main_changed):
+        """构造函数
+
+        Args:
+            added (list[str]): 新增的差分名
+            removed (list[str]): 删除的差分名
+            changed (list[str]): 配置改变的差分名
+            main_changed (bool): conf/config.json 是否改变
+        """
+        self.added = added
+        self.removed = removed
+        self.changed = changed
+        self.main_changed = main_changed
+
+    def is_empty(self):
+        return len(self.added) == 0 and len(self.removed) == 0 and len(self.changed) == 0 and not self.main_changed
+
+    def __str__(self):
+        return '%d added, %d removed, %d changed' % (len(self.added), len(self.removed), len(self.changed))
+
+
+class ConfigWatcher(object):
+    """增量加载配置文件
+
+    记录 conf/ 中各 json 文件的修改时间和大小，重新加载时只解析发生变化的文件，并给出各组差分配置的变化。
+    conf/config.json 中的 entry 优先，其他文件按文件名顺序，同名的 entry 只取第一个。
+    """
+    def __init__(self, config_dir=None):
+        """构造函数
+
+        Args:
+            config_dir (str): 配置文件目录，默认为 conf/
+        """
+        self.config_dir = config_dir if config_dir is not None else os.path.join(sys.path[0], 'conf')
+        # 文件名 -> (修改时间和大小, 文件中除 entry 外的配置, 文件中 entry 的 json, 解析后的 entry)
+        # config.json 不存在时修改时间和大小为 None, 保留上次的内容
+        self.files = {'config.json': (None, {}, {}, {})}
+        self.entries = {}   # 上次加载的所有 entry
+
+    def scan(self):
+        """获取 conf/ 中各 json 文件的修改时间和大小
+
+        Returns:
+            return (dict[str, tuple[int, int]]): 文件名 -> (mtime_ns, size)
+        """
+        stamps = {}
+        try:
+            for dir_entry in os.scandir(self.config_dir):
+                if dir_entry.name.endswith('.json') and dir_entry.is_file():
+                    stat = dir_entry.stat()
+                    stamps[dir_entry.name] = (stat.st_mtime_ns, stat.st_size)
+        except OSError as e:
+            log.error('main: failed to scan config dir: %s' % e)
+        return stamps
+
+    def has_changed(self):
+        """配置文件是否有变化，只检查修改时间和大小
+
+        Returns:
+            return (bool): 有文件新增、删除或修改
+        """
+        stamps = self.scan()
+        return any(stamps.get(file_name) != (self.files[file_name][0] if file_name in self.files.keys() else None)
+                   for file_name in stamps.keys() | self.files.keys())
+
+    def load_file(self, file_name, stamp):
+        """解析一个配置文件。解析失败时保留该文件上次的内容，文件再次修改后重试
+
+        Args:
+            file_name (str): 文件名
+            stamp (tuple[int, int]): 修改时间和大小
+        """
+        old = self.files[file_name][1:] if file_name in self.files.keys() else ({}, {}, {})
+        try:
+            with open(os.path.join(self.config_dir, file_name)) as config_fp:
+                configs = json.load(config_fp)
+            if file_name == 'config.json':
+                json_entries = configs.pop('entry', {})
+            else:
+                json_entries = configs['entry']
+                configs = {}
+        except Exception as e:
+            log.error('main: failed to load config from conf/%s: %s' % (file_name, e))
+            self.files[file_name] = (stamp,) + old
+            return
+        old_configs, old_json_entries, old_entries = old
+        entries = {}
+        for name, json_entry in json_entries.items():
+            # 未改变的 entry 沿用上次的 Entry, 不必重新检查
+            if name in old_entries.keys() and old_json_entries[name] == json_entry:
+                entries[name] = old_entries[name]
+                continue
+            try:
+                entries[name] = Entry(json_entry)
+            except Exception as e:
+                log.error('failed to parse config %s: %s' % (name, e))
+        self.files[file_name] = (stamp, configs, json_entries, entries)
+
+    def load(self):
+        """加载配置文件，只重新解析发生变化的文件
+
+        Returns:
+            return (tuple[dict, EntryDiff]): 配置, 与上次加载相比的变化
+        """
+        stamps = self.scan()
+        main_changed = 'config.json' in stamps.keys() and stamps['config.json'] != self.files['config.json'][0]
+        for file_name in list(self.files.keys()):
+            if file_name not in stamps.keys() and file_name != 'config.json':
+                del self.files[file_name]
+        if 'config.json' not in stamps.keys():
+            # 与解析失败相同，保留上次的内容 (webInterface 等配置和其中的 entry), 文件恢复后重新加载
+            log.error('main: failed to load config from conf/config.json: file not found')
+            self.files['config.json'] = (None,) + self.files['config.json'][1:]
+        for file_name, stamp in stamps.items():
+            if file_name not in self.files.keys() or self.files[file_name][0] != stamp:
+                self.load_file(file_name, stamp)
+
+        # main config
+        configs = dict(self.files['config.json'][1])
+        entries = dict(self.files['config.json'][3])
+        # other entries
+        for file_name in sorted(self.files.keys()):
+            if file_name != 'config.json':
+                for name, entry in self.files[file_name][3].items():
+                    if name not in entries.keys():
+                        entries[name] = entry
+        configs['entry'] = entries
+
+        # 工作进程池，未配置时每组差分一个进程
+        if 'workerPool' in configs.keys():
+            try:
+                configs['workerPool'] = WorkerPoolConfig(configs['workerPool'])
+            except Exception as e:
+                log.error('failed to parse config workerPool: %s' % e)
+                del configs['workerPool']
+        # 检查配置文件变化的间隔 (s), 0 表示不检查，只在手动重新加载时读取
+        if 'configWatchInterval' in configs.keys():
+            try:
+                configs['configWatchInterval'] = float(configs['configWatchInterval'])
+            except Exception as e:
+                log.error('failed to parse config configWatchInterval: %s' % e)
+                del configs['configWatchInterval']
+
+        # 状态表的 slot 数，只在启动时读取
+        if 'statusBoardSlots' in configs.keys():
+            try:
+                configs['statusBoardSlots'] = int(configs['statusBoardSlots'])
+                if configs['statusBoardSlots'] <= 0:
+                    raise Exception('statusBoardSlots should be positive.')
+            except Exception as e:
+                log.error('failed to parse config statusBoardSlots: %s' % e)
+                del configs['statusBoardSlots']
+
+        # diff
+        old_entries = self.entries
+        added = sorted(name for name in entries.keys() if name not in old_entries.keys())
+        removed = sorted(name for name in old_entries.keys() if name not in entries.keys())
+        changed = sorted(name for name, entry in entries.items() if name in old_entries.keys()
+                         and old_entries[name] is not entry and old_entries[name] != entry)
+        self.entries = entries
+        return configs, EntryDiff(added, removed, changed, main_changed)
+
+
 def load_config():
     """载入配置文件
 
     先读入 conf/config.json 中的配置，再读入 conf/ 中其他 json 文件里的 entry
     """
-    config_dir = os.path.join(sys.path[0], 'conf')
-    configs = {}
-    # main config
-    config_file_name = os.path.join(config_dir, 'config.json')
-    try:
-        with open(config_file_name) as config_fp:
-            configs = json.load(config_fp)
-    except Exception as e:
-        log.error('main: failed to load config from conf/config.json: %s' % e)
-    if 'entry' not in configs.keys():
-        configs['entry'] = {}
-
-    # other entries
-    for dir_path, dir_names, file_names in os.walk(config_dir):
-        for file_name in file_names:
-            if file_name != 'config.json' and file_name.endswith('.json'):
-                # load sub config
-                config_file_name = os.path.join(config_dir, file_name)
-                try:
-                    with open(config_file_name) as config_fp:
-                        sub_configs = json.load(config_fp)
-                    # insert into main config
-                    for name, config in sorted(sub_configs['entry'].items()):
-                        if name not in configs['entry'].keys():
-                            configs['entry'][name] = config
-                except Exception as e:
-                    log.error('main: failed to load config from conf/%s: %s' % (file_name, e))
-
-    # convert
-    entries = {}
-    for name, json_entry in configs['entry'].items():
-        try:
-            entries[name] = Entry(json_entry)
-        except Exception as e:
-            log.error('failed to parse config %s: %s' % (name, e))
-    configs['entry'] = entries
+    configs, diff = ConfigWatcher().load()
     return configs
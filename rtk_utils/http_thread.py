@@ -54,9 +54,12 @@ class HttpThread(threading.Thread):
 
 
 class RtkStatus:
-    """rtk 服务状态管理"""
-    rtk_last_rcv_time = {}
-    rtk_status = {}
+    """rtk 服务状态管理
+
+    各组差分的状态和计数由 status_board 读取。
+    """
+    rtk_names = []
+    status_board = None
     server_start_time = None
 
     S_UNKNOWN = 'unknown'
@@ -73,53 +76,26 @@ class RtkStatus:
             names (list[str]): 开启的 rtk 服务名
         """
         log.info('http thread: load %d name(s)' % len(names))
-        # update status
-        # add new name
-        for name in names:
-            if name not in RtkStatus.rtk_status:
-                RtkStatus.rtk_status[name] = RtkStatus.S_UNKNOWN
-                RtkStatus.rtk_last_rcv_time[name] = 'NULL'
-        # delete outdated name
-        for name in RtkStatus.rtk_status.copy().keys():
-            if name not in names:
-                del RtkStatus.rtk_status[name]
-                del RtkStatus.rtk_last_rcv_time[name]
-
-    @staticmethod
-    def update_rcv_time(name):
-        """接收到 rtk 数据，更新时间戳
-
-        Args:
-            name (str): rtk 服务名
-        """
-        try:
-            # 此处可能不是很线程安全
-            if name in RtkStatus.rtk_last_rcv_time.keys():
-                RtkStatus.rtk_last_rcv_time[name] = get_time_string()
-                RtkStatus.update_status(name, RtkStatus.S_RECEIVING)
-        except Exception as e:
-            log.warning('Failed when update rcv time: %s' % e)
+        RtkStatus.rtk_names = sorted(names)
 
     @staticmethod
-    def update_status(name, status):
-        """接收到 rtk 状态更新
+    def get_status_list():
+        """读取各组差分的状态
 
-        Args:
-            name (str): rtk 服务名
-            status (str): 服务当前状态, None 表示只 update_rcv_time
+        Returns:
+            return (list[tuple[str, str, str, dict]]): (rtk 服务名, 状态, 最后收到数据的时间, 各计数)
         """
-        if status is None:
-            RtkStatus.update_rcv_time(name)
-        else:
-            try:
-                if name in RtkStatus.rtk_status.keys():
-                    if status == RtkStatus.S_CONNECTED:
-                        if RtkStatus.rtk_status[name] not in (RtkStatus.S_UNKNOWN, RtkStatus.S_DISCONNECTED):
-                            # 特殊处理 S_CONNECTED，如果已经有连接，就不更新状态
-                            return
-                    RtkStatus.rtk_status[name] = status
-            except Exception as e:
-                log.warning('Failed when update status: %s' % e)
+        board = RtkStatus.status_board.read_all() if RtkStatus.status_board is not None else {}
+        status_list = []
+        for name in RtkStatus.rtk_names:
+            values = board.get(name)
+            if values is None:
+                status_list.append((name, RtkStatus.S_UNKNOWN, 'NULL', {}))
+            else:
+                timestamp = get_time_string(datetime.datetime.fromtimestamp(values['last_rcv_time'])) \
+                    if values['last_rcv_time'] > 0 else 'NULL'
+                status_list.append((name, values['state'], timestamp, values))
+        return status_list
 
 
 class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
@@ -150,12 +126,14 @@ class RequestHandler(BaseHTTPRequestHandler):
             self.wfile.write(b'<div>possible status: unknown, online, receiving, offline, terminated.</div>')
             self.wfile.write(b'<div>rtk server(s):</div>')
             self.wfile.write(b'<div>...</div>')
-            rtk_last_rcv_time = RtkStatus.rtk_last_rcv_time.copy()
-            rtk_status = RtkStatus.rtk_status.copy()
-            for name, timestamp in sorted(rtk_last_rcv_time.items()):
-                if name in rtk_status.keys():
-                    self.wfile.write(('<div class="rtk_status">%s, %s, %s</div>'
-                                      % (name, rtk_status[name], timestamp)).encode())
+            for name, status, timestamp, values in RtkStatus.get_status_list():
+                counters = ''
+                if len(values) > 0:
+                    counters = ', in %d bytes (%d), out %d bytes (%d), %d client(s), drop %d (%d bytes)' \
+                               % (values['bytes_in'], values['frames_in'], values['bytes_out'], values['sends_out'],
+                                  values['clients'], values['drop_count'], values['drop_bytes'])
+                self.wfile.write(('<div class="rtk_status">%s, %s, %s%s</div>'
+                                  % (name, status, timestamp, counters)).encode())
             self.wfile.write(b'<div>...</div>')
             self.wfile.write(b'</body></html>')
         except IOError:
@@ -60,15 +60,11 @@ class Log:
         color_formatter = logging.Formatter('%(asctime)s - %(name)s - %(colorlevelname)s - %(message)s')
 
         # to file
+        self.name = name
+        self.formatter = formatter
         self.fh = None
         if to_file:
-            log_path = str(os.path.join(log_dir, '%s.log' % name))
-            fh = logging.handlers.RotatingFileHandler(log_path, maxBytes=524288000, backupCount=10)
-            fh.setLevel(logging.DEBUG)
-            fh.doRollover()
-            fh.setFormatter(formatter)
-            self.logger.addHandler(fh)
-            self.fh = fh
+            self.add_file_handler()
 
         # to screen
         ch = logging.StreamHandler()
@@ -78,6 +74,16 @@ class Log:
         self.ch = ch
         self.logging = True
 
+    def add_file_handler(self):
+        """开始写入到文件系统"""
+        log_path = str(os.path.join(log_dir, '%s.log' % self.name))
+        fh = logging.handlers.RotatingFileHandler(log_path, maxBytes=524288000, backupCount=10)
+        fh.setLevel(logging.DEBUG)
+        fh.doRollover()
+        fh.setFormatter(self.formatter)
+        self.logger.addHandler(fh)
+        self.fh = fh
+
     def close(self):
         """关闭日志"""
         if self.logging:
@@ -97,6 +103,13 @@ def init(name, to_file=True):
         loggers[name] = logger
 
 
+def enable_file(name):
+    """已实例化的日志工具开始写入到文件系统，已经写入时不变"""
+    global loggers
+    if name in loggers.keys() and loggers[name].logging and loggers[name].fh is None:
+        loggers[name].add_file_handler()
+
+
 def close(name):
     """关闭一个日志工具"""
     global loggers
@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : status_board.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : 共享内存中的差分状态和计数
+#
+
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+from rtk_utils.http_thread import RtkStatus
+
+STATUS_BOARD_SLOTS = 1024      # 未配置 statusBoardSlots 时的最小 slot 数
+STATUS_BOARD_HEADROOM = 2       # 未配置 statusBoardSlots 时，slot 数至少为 entry 数的倍数，留给重新加载时新增的 entry
+SLOT_SIZE = 256
+NAME_SIZE = 128     # 名字的最大长度 (utf-8 编码后的字节数)
+STATUS_FLUSH_INTERVAL = 0.5     # 计数和最后收到数据的时间写入共享内存的间隔 (s)
+
+# 每个 slot: 序号 + 内容。序号为奇数时表示正在写入
+SEQ_FORMAT = struct.Struct('<I')
+SLOT_FORMAT = struct.Struct('<%dsBdQQQQIQQddddd' % NAME_SIZE)
+SLOT_FIELDS = ('name', 'state', 'last_rcv_time', 'bytes_in', 'frames_in', 'bytes_out', 'sends_out',
+               'clients', 'drop_count', 'drop_bytes',
+               'start_time', 'spawn_time', 'bind_time', 'first_rcv_time', 'first_send_time')
+# 启动的各阶段: 名称, 完成时间的字段。耗时从主进程请求启动 (start_time) 时算起
+STARTUP_PHASES = (('spawn', 'spawn_time'), ('bind', 'bind_time'), ('first upstream byte', 'first_rcv_time'),
+                  ('first rover served', 'first_send_time'))
+# 状态 -> 编号, 0 表示 slot 未使用
+STATES = (None, RtkStatus.S_UNKNOWN, RtkStatus.S_CONNECTED, RtkStatus.S_RECEIVING,
+          RtkStatus.S_DISCONNECTED, RtkStatus.S_TERMINATED)
+STATE_CODES = {state: code for code, state in enumerate(STATES)}
+
+
+class StatusBoardFullError(Exception):
+    """状态表的 slot 已用完，需在 conf/config.json 中增大 statusBoardSlots 并重启"""
+    pass
+
+
+class StatusBoard:
+    """共享内存中的状态表，每组差分一个固定大小的 slot
+
+    由主进程创建并分配 slot, 各组差分的进程写入自己的 slot, web 管理进程等直接读取。
+    每个 slot 同一时刻只有一个写入者，读取时以序号判断是否读到了写入一半的内容 (seqlock)，不加锁。
+    """
+
+    def __init__(self, slots=STATUS_BOARD_SLOTS):
+        """构造函数，在主进程中调用
+
+        Args:
+            slots (int): slot 数
+        """
+        self.slots = slots
+        self.shm = shared_memory.SharedMemory(create=True, size=slots * SLOT_SIZE)
+        self.shm.buf[:slots * SLOT_SIZE] = bytes(slots * SLOT_SIZE)
+        self.slot_indexes = {}  # 差分名 -> slot 编号, 仅主进程使用
+        self.free_indexes = list(range(slots - 1, -1, -1))  # 未使用的 slot 编号, 仅主进程使用
+
+    @staticmethod
+    def from_config(configs):
+        """根据配置生成状态表
+
+        共享内存的大小在创建后不能改变。配置了 statusBoardSlots 时使用该值，
+        否则为 entry 数的 STATUS_BOARD_HEADROOM 倍，且不少于 STATUS_BOARD_SLOTS。
+
+        Args:
+            configs (dict): 配置
+
+        Returns:
+            return (StatusBoard): 状态表
+        """
+        if 'statusBoardSlots' in configs.keys():
+            return StatusBoard(configs['statusBoardSlots'])
+        return StatusBoard(max(STATUS_BOARD_SLOTS, len(configs.get('entry', {})) * STATUS_BOARD_HEADROOM))
+
+    def close(self):
+        """释放共享内存，在主进程中所有子进程退出后调用"""
+        self.shm.close()
+        self.shm.unlink()
+
+    def alloc(self, name):
+        """为一组差分分配 slot, 在主进程中调用
+
+        Args:
+            name (str): rtk 服务名
+
+        Returns:
+            return (int): 分配的 slot 编号, slot 已用完时抛出 StatusBoardFullError
+        """
+        if name not in self.slot_indexes.keys():
+            if len(self.free_indexes) == 0:
+                raise StatusBoardFullError('status board is full (%d slots), set "statusBoardSlots" in '
+                                           'conf/config.json to a larger value and restart.' % self.slots)
+            self.slot_indexes[name] = self.free_indexes.pop()
+        index = self.slot_indexes[name]
+        self.get_slot(index).write(name, RtkStatus.S_UNKNOWN)
+        return index
+
+    def free(self, name):
+        """释放一组差分的 slot, 在主进程中调用
+
+        Args:
+            name (str): rtk 服务名
+        """
+        if name in self.slot_indexes.keys():
+            index = self.slot_indexes.pop(name)
+            self.get_slot(index).write('', None)
+            self.free_indexes.append(index)
+
+    def set_state(self, name, state):
+        """更新一组差分的状态，保留计数。在主进程中，该组差分的进程退出后调用
+
+        Args:
+            name (str): rtk 服务名
+            state (str): 状态
+        """
+        if name in self.slot_indexes.keys():
+            slot = self.get_slot(self.slot_indexes[name])
+            values = slot.read()
+            if values is not None:
+                values['state'] = state
+                slot.write(**values)
+
+    def get_slot(self, index):
+        """获取 slot, 用于写入
+
+        Args:
+            index (int): slot 编号
+
+        Returns:
+            return (StatusSlot): slot
+        """
+        return StatusSlot(self.shm.buf, index * SLOT_SIZE)
+
+    def read_all(self):
+        """读取所有使用中的 slot
+
+        Returns:
+            return (dict[str, dict]): 差分名 -> 各字段
+        """
+        status = {}
+        for index in range(self.slots):
+            values = self.get_slot(index).read()
+            if values is not None and values['state'] is not None:
+                status[values['name']] = values
+        return status
+
+
+class StatusSlot:
+    """共享内存中的一个 slot"""
+
+    def __init__(self, buf, offset):
+        """构造函数
+
+        Args:
+            buf (memoryview): 共享内存
+            offset (int): slot 的位置
+        """
+        self.buf = buf
+        self.offset = offset
+
+    def write(self, name, state, last_rcv_time=0, bytes_in=0, frames_in=0, bytes_out=0, sends_out=0,
+              clients=0, drop_count=0, drop_bytes=0,
+              start_time=0, spawn_time=0, bind_time=0, first_rcv_time=0, first_send_time=0):
+        """写入 slot, 调用者需保证同一时刻只有一个写入者
+
+        Args:
+            name (str): rtk 服务名
+            state (str): 状态, None 表示 slot 未使用
+            last_rcv_time (float): 最后收到数据的时间 (time.time), 0 表示未收到
+            bytes_in (int): 收到的字节数
+            frames_in (int): 收到的数据包数
+            bytes_out (int): 发送给客户端的字节数
+            sends_out (int): 发送给客户端的次数
+            clients (int): 客户端数
+            drop_count (int): 慢客户端丢弃数据的次数
+            drop_bytes (int): 慢客户端丢弃的字节数
+            start_time (float): 主进程请求启动的时间 (time.time), 以下各时间为 0 表示尚未到达该阶段
+            spawn_time (float): 进程 (或工作进程中的线程) 开始运行的时间
+            bind_time (float): 开始监听 listenPort 的时间
+            first_rcv_time (float): 第一次收到基站数据的时间
+            first_send_time (float): 第一次向客户端发送数据的时间
+        """
+        seq = SEQ_FORMAT.unpack_from(self.buf, self.offset)[0]
+        SEQ_FORMAT.pack_into(self.buf, self.offset, (seq + 1) & 0xffffffff)
+        SLOT_FORMAT.pack_into(self.buf, self.offset + SEQ_FORMAT.size, name.encode('utf-8')[:NAME_SIZE],
+                              STATE_CODES[state], last_rcv_time, bytes_in, frames_in, bytes_out, sends_out,
+                              clients, drop_count, drop_bytes,
+                              start_time, spawn_time, bind_time, first_rcv_time, first_send_time)
+        SEQ_FORMAT.pack_into(self.buf, self.offset, (seq + 2) & 0xffffffff)
+
+    def read(self):
+        """读取 slot, 可在任意进程中调用
+
+        Returns:
+            return (dict): 各字段，一直未能读到完整内容时为 None
+        """
+        for i in range(100):
+            seq = SEQ_FORMAT.unpack_from(self.buf, self.offset)[0]
+            if seq % 2 == 1:
+                time.sleep(0)
+                continue
+            values = SLOT_FORMAT.unpack_from(self.buf, self.offset + SEQ_FORMAT.size)
+            if SEQ_FORMAT.unpack_from(self.buf, self.offset)[0] == seq:
+                values = dict(zip(SLOT_FIELDS, values))
+                values['name'] = values['name'].rstrip(b'\0').decode('utf-8', errors='ignore')
+                values['state'] = STATES[values['state']] if values['state'] < len(STATES) else None
+                return values
+        return None
+
+
+def get_startup_report(values):
+    """一组差分启动的各阶段耗时
+
+    Args:
+        values (dict): StatusSlot.read 的返回值
+
+    Returns:
+        return (list[tuple[str, float]]): 阶段名, 从请求启动到完成该阶段的耗时 (ms), 尚未完成时为 None
+    """
+    report = []
+    for phase, field in STARTUP_PHASES:
+        if values['start_time'] > 0 and values[field] > 0:
+            report.append((phase, (values[field] - values['start_time']) * 1000))
+        else:
+            report.append((phase, None))
+    return report
+
+
+class StatusReporter:
+    """一组差分的状态更新，作为 update_status_cb 使用
+
+    状态变化时立即写入 slot; 收到数据时只记录时间，与计数一起每 STATUS_FLUSH_INTERVAL 由 flush 写入。
+    各线程的写入由 lock 串行化，读取者不受影响。
+    """
+
+    def __init__(self, name, slot, get_stats=None, start_time=0):
+        """构造函数，在差分的进程开始运行时调用
+
+        Args:
+            name (str): rtk 服务名
+            slot (StatusSlot): 分配给本组差分的 slot
+            get_stats (Callable[[], dict]): 获取计数的函数，返回值为 StatusSlot.write 的参数
+            start_time (float): 主进程请求启动的时间 (time.time)
+        """
+        self.name = name
+        self.slot = slot
+        self.get_stats = get_stats
+        self.lock = threading.Lock()
+        self.state = RtkStatus.S_UNKNOWN
+        self.last_rcv_time = 0
+        self.start_time = start_time
+        self.spawn_time = time.time()
+        self.first_rcv_time = 0
+
+    def update(self, status):
+        """更新状态
+
+        Args:
+            status (str): 服务当前状态, None 表示收到数据
+        """
+        if status is None:
+            self.last_rcv_time = time.time()
+            if self.first_rcv_time == 0:
+                self.first_rcv_time = self.last_rcv_time
+            if self.state == RtkStatus.S_RECEIVING:
+                return
+            status = RtkStatus.S_RECEIVING
+        elif status == RtkStatus.S_CONNECTED and self.state not in (RtkStatus.S_UNKNOWN, RtkStatus.S_DISCONNECTED):
+            # 已经有连接时不更新状态
+            return
+        with self.lock:
+            self.state = status
+            self.write_locked()
+
+    def flush(self):
+        """写入计数和最后收到数据的时间，由所在进程的主循环定期调用"""
+        with self.lock:
+            self.write_locked()
+
+    def write_locked(self):
+        """写入 slot, 需持有 lock"""
+        stats = self.get_stats() if self.get_stats is not None else {}
+        self.slot.write(self.name, self.state, self.last_rcv_time, start_time=self.start_time,
+                        spawn_time=self.spawn_time, first_rcv_time=self.first_rcv_time, **stats)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : rtcm_samples.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : 测试用的 rtcm 数据
+#
+
+from rtk_protocol.msm_transcoder import BitWriter, SAT_FIELDS, SIG_FIELDS
+from rtk_protocol.rtcm_util import crc24q_func
+
+
+def make_frame(msg_type, len_body, rng):
+    """生成一条 CRC 正确的 rtcm 报文，报文内容随机"""
+    body = bytes([msg_type >> 4, ((msg_type & 0xf) << 4) | rng.randrange(16)]) + rng.randbytes(len_body - 2)
+    message = bytes([0xd3, len_body >> 8, len_body & 0xff]) + body
+    return message + crc24q_func(message).to_bytes(3, 'big')
+
+
+def make_stream(count, rng):
+    """生成多条报文组成的数据流"""
+    frames = [make_frame(rng.choice((1005, 1019, 1033, 1230)), rng.randrange(19, 400), rng) for _ in range(count)]
+    return frames, b''.join(frames)
+
+
+def split_randomly(data, rng):
+    """把数据切分为任意长度的片段，模拟 TCP 收到的数据"""
+    chunks = []
+    pos = 0
+    while pos < len(data):
+        len_chunk = rng.randrange(1, 700)
+        chunks.append(data[pos:pos + len_chunk])
+        pos += len_chunk
+    return chunks
+
+
+def make_msm(msg_type, satellites, signals, multiple_message, rng, epoch_time=0):
+    """生成一条 MSM 报文，各卫星的所有信号都有观测值，观测值随机
+
+    Args:
+        msg_type (int): 报文类型，如 1077
+        satellites (list[int]): 卫星号
+        signals (list[int]): 信号号
+        multiple_message (bool): 同步标志
+        rng (random.Random): 随机数
+        epoch_time (int): 历元时间
+    """
+    level = msg_type % 10
+    writer = BitWriter()
+    writer.write(msg_type, 12)
+    writer.write(1234, 12)      # 基站 ID
+    writer.write(epoch_time, 30)
+    writer.write(1 if multiple_message else 0, 1)
+    writer.write(0, 18)         # IODS, 保留, 时钟校准, 扩展时钟, 平滑标志, 平滑间隔
+    writer.write(sum(1 << (64 - sat) for sat in satellites), 64)
+    writer.write(sum(1 << (32 - sig) for sig in signals), 32)
+    writer.write_bits('1' * (len(satellites) * len(signals)))
+    for df, bits, signed in SAT_FIELDS[level]:
+        for _ in satellites:
+            writer.write(rng.randrange(1 << bits), bits)
+    for df, bits, signed in SIG_FIELDS[level]:
+        for _ in range(len(satellites) * len(signals)):
+            writer.write(rng.randrange(705) if df == 407 else rng.randrange(1, 1 << bits), bits)
+    payload = writer.to_bytes()
+    message = bytes([0xd3, len(payload) >> 8, len(payload) & 0xff]) + payload
+    return message + crc24q_func(message).to_bytes(3, 'big')
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : test_config_loader.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : ConfigWatcher 增量加载的测试
+#
+
+import json
+import os
+import tempfile
+import unittest
+
+from rtk_utils.config_loader import ConfigWatcher
+
+
+def make_entry(listen_port, **kwargs):
+    entry = {'stationPort': 1, 'stationMode': 'server', 'stationIpAddress': '127.0.0.1', 'listenPort': listen_port}
+    entry.update(kwargs)
+    return entry
+
+
+class ConfigWatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.config_dir = self.tmp_dir.name
+        self.mtime = 1000000000 * 10 ** 9
+        self.write('config.json', {'webInterface': {'port': 8080}, 'entry': {'a': make_entry(2001)}})
+        self.write('more.json', {'entry': {'b': make_entry(2002), 'c': make_entry(2003)}})
+        self.watcher = ConfigWatcher(self.config_dir)
+        self.configs, diff = self.watcher.load()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def write(self, file_name, configs, text=None):
+        """写入配置文件，每次修改时间都不同，不受文件系统时间精度的影响"""
+        path = os.path.join(self.config_dir, file_name)
+        with open(path, 'w') as config_fp:
+            config_fp.write(text if text is not None else json.dumps(configs))
+        self.mtime += 10 ** 9
+        os.utime(path, ns=(self.mtime, self.mtime))
+
+    def assert_diff(self, diff, added=(), removed=(), changed=(), main_changed=False):
+        self.assertEqual((diff.added, diff.removed, diff.changed, diff.main_changed),
+                         (list(added), list(removed), list(changed), main_changed))
+
+    def test_first_load(self):
+        self.assertEqual(sorted(self.configs['entry'].keys()), ['a', 'b', 'c'])
+        self.assertEqual(self.configs['webInterface'], {'port': 8080})
+        self.assertFalse(self.watcher.has_changed())
+
+    def test_added_removed_changed(self):
+        self.write('more.json', {'entry': {'b': make_entry(2012), 'd': make_entry(2004)}})
+        self.assertTrue(self.watcher.has_changed())
+        configs, diff = self.watcher.load()
+        self.assert_diff(diff, added=['d'], removed=['c'], changed=['b'])
+        self.assertEqual(configs['entry']['b'].listen_port, 2012)
+        # 未改变的文件和 entry 沿用上次的对象
+        self.assertIs(configs['entry']['a'], self.configs['entry']['a'])
+        self.assertFalse(self.watcher.has_changed())
+        self.assert_diff(self.watcher.load()[1])
+
+    def test_removed_file(self):
+        os.remove(os.path.join(self.config_dir, 'more.json'))
+        self.assertTrue(self.watcher.has_changed())
+        configs, diff = self.watcher.load()
+        self.assert_diff(diff, removed=['b', 'c'])
+
+    def test_bad_json_keeps_old_entries(self):
+        self.write('more.json', None, '{"entry": {')
+        configs, diff = self.watcher.load()
+        self.assert_diff(diff)
+        self.assertEqual(sorted(configs['entry'].keys()), ['a', 'b', 'c'])
+        # 修改后重试
+        self.write('more.json', {'entry': {'b': make_entry(2002)}})
+        configs, diff = self.watcher.load()
+        self.assert_diff(diff, removed=['c'])
+
+    def test_bad_entry_is_skipped(self):
+        self.write('more.json', {'entry': {'b': make_entry(2002), 'c': make_entry(2003, stationMode='bad')}})
+        configs, diff = self.watcher.load()
+        self.assert_diff(diff, removed=['c'])
+
+    def test_missing_main_config_keeps_old_contents(self):
+        os.remove(os.path.join(self.config_dir, 'config.json'))
+        self.assertTrue(self.watcher.has_changed())
+        configs, diff = self.watcher.load()
+        self.assert_diff(diff)
+        self.assertEqual(sorted(configs['entry'].keys()), ['a', 'b', 'c'])
+        self.assertEqual(configs['webInterface'], {'port': 8080})
+        self.assertFalse(self.watcher.has_changed())
+        # 文件恢复后重新加载
+        self.write('config.json', {'entry': {'a': make_entry(2011)}})
+        configs, diff = self.watcher.load()
+        self.assert_diff(diff, changed=['a'], main_changed=True)
+        self.assertNotIn('webInterface', configs.keys())
+
+    def test_first_file_wins(self):
+        self.write('a.json', {'entry': {'b': make_entry(2022), 'c': make_entry(2023)}})
+        self.write('config.json', {'webInterface': {'port': 8080},
+                                   'entry': {'a': make_entry(2001), 'c': make_entry(2033)}})
+        configs, diff = self.watcher.load()
+        # config.json 优先，其他文件按文件名顺序
+        self.assertEqual({name: entry.listen_port for name, entry in configs['entry'].items()},
+                         {'a': 2001, 'b': 2022, 'c': 2033})
+        self.assert_diff(diff, changed=['b', 'c'], main_changed=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
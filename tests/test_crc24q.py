@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : test_crc24q.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : 查表法 CRC-24Q 的测试
+#
+
+import random
+import unittest
+
+try:
+    import crcmod
+except ImportError:
+    crcmod = None
+
+from rtk_protocol.crc24q import CRC24Q_POLY, crc24q, crc24q_batch, crc24q_bytewise, numpy
+
+
+def crc24q_reference(data):
+    """逐 bit 计算 CRC-24Q, 即 RTCM 10403 中的定义"""
+    crc = 0
+    for b in data:
+        crc ^= b << 16
+        for i in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= CRC24Q_POLY
+    return crc
+
+
+class Crc24qTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(2)
+        # 覆盖 slicing-by-4 对齐之外的 0~3 字节
+        lengths = list(range(12)) + [rng.randrange(1, 1030) for _ in range(50)]
+        self.messages = [rng.randbytes(length) for length in lengths]
+
+    @unittest.skipIf(crcmod is None, 'crcmod is not installed')
+    def test_reference_matches_crcmod(self):
+        crc24q_func = crcmod.mkCrcFun(0b1100001100100110011111011, initCrc=0, rev=False)
+        for message in self.messages:
+            self.assertEqual(crc24q_reference(message), crc24q_func(message))
+
+    def test_table_matches_reference(self):
+        for message in self.messages:
+            expected = crc24q_reference(message)
+            self.assertEqual(crc24q(message), expected)
+            self.assertEqual(crc24q_bytewise(message), expected)
+            self.assertEqual(crc24q(memoryview(message)), expected)
+
+    def test_incremental(self):
+        message = self.messages[-1]
+        for split in (0, 1, 5, len(message)):
+            self.assertEqual(crc24q(message[split:], crc24q(message[:split])), crc24q_reference(message))
+
+    @unittest.skipIf(numpy is None, 'numpy is not installed')
+    def test_batch_matches_reference(self):
+        self.assertEqual(list(crc24q_batch(self.messages)), [crc24q_reference(m) for m in self.messages])
+        self.assertEqual(len(crc24q_batch([])), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : test_dispatcher.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : Dispatcher 的测试
+#
+
+import random
+import selectors
+import socket
+import time
+import unittest
+from unittest import mock
+
+from rtcm_samples import make_frame, make_msm, make_stream, split_randomly
+from rtk_protocol.msm_transcoder import MsmTranscoder
+from rtk_protocol.rtcm_util import iter_frames
+from rtk_trans.dispatcher import Dispatcher
+from rtk_utils.config_loader import Entry
+
+
+def make_config(**kwargs):
+    config = {'stationPort': 1, 'stationMode': 'server', 'stationIpAddress': '127.0.0.1', 'listenPort': 2}
+    config.update(kwargs)
+    return Entry(config)
+
+
+class RacingSocket:
+    """第一次 recv 之前先以生产者身份调用 put_data, 模拟 dispatch 与 put_data 交错执行"""
+
+    def __init__(self, dispatcher, sock):
+        self.dispatcher = dispatcher
+        self.sock = sock
+        self.raced = False
+
+    def recv(self, size):
+        if not self.raced:
+            self.raced = True
+            self.dispatcher.put_data(b'racing')
+        return self.sock.recv(size)
+
+
+class DispatcherWakeupTest(unittest.TestCase):
+    def setUp(self):
+        self.dispatcher = Dispatcher(make_config())
+
+    def tearDown(self):
+        self.dispatcher.selector.close()
+        self.dispatcher.wakeup_rcv.close()
+        self.dispatcher.wakeup_send.close()
+
+    def is_wakeup_readable(self):
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.dispatcher.wakeup_rcv, selectors.EVENT_READ)
+            return len(selector.select(0)) > 0
+
+    def test_put_data_during_dispatch_still_wakes_up(self):
+        dispatcher = self.dispatcher
+        dispatcher.put_data(b'first')
+        sock = dispatcher.wakeup_rcv
+        dispatcher.wakeup_rcv = RacingSocket(dispatcher, sock)
+        dispatcher.dispatch()
+        dispatcher.wakeup_rcv = sock
+        self.assertEqual(dispatcher.data_queue.qsize(), 0)
+
+        # 交错执行之后，新的数据仍然必须唤醒 selector
+        if self.is_wakeup_readable():
+            dispatcher.dispatch()
+        dispatcher.put_data(b'second')
+        self.assertTrue(self.is_wakeup_readable())
+
+    def test_poll_dispatches_queued_data_without_wakeup(self):
+        dispatcher = self.dispatcher
+        dispatcher.wakeup_pending = True    # 唤醒已丢失
+        dispatcher.put_data(b'data')
+        dispatcher.poll(timeout=0)
+        self.assertEqual(dispatcher.data_queue.qsize(), 0)
+
+
+class DispatcherFramingTest(unittest.TestCase):
+    """不解析报文直接转发时，收到的数据是任意切分的"""
+
+    def setUp(self):
+        self.rng = random.Random(5)
+
+    def test_ring_packets_are_frames(self):
+        dispatcher = Dispatcher(make_config())
+        frames, stream = make_stream(200, self.rng)
+        for chunk in split_randomly(stream, self.rng):
+            dispatcher.put_data(chunk)
+            dispatcher.dispatch()
+        dispatcher.flush_batch()
+        ring = dispatcher.ring
+        packets = [bytes(b''.join(ring.get_views(start, end - start))) for start, end in ring.frames]
+        self.assertEqual(packets, frames)
+        dispatcher.close_all_clients()
+
+    def test_unparsable_data_is_forwarded(self):
+        dispatcher = Dispatcher(make_config())
+        frames, stream = make_stream(3, self.rng)
+        stream = b'garbage\xd3' + frames[0] + b'\xd3\x00' + frames[1] + frames[2]
+        for chunk in split_randomly(stream, self.rng):
+            dispatcher.put_data(chunk)
+            dispatcher.dispatch()
+        dispatcher.flush_batch()
+        ring = dispatcher.ring
+        self.assertEqual(bytes(b''.join(ring.get_views(ring.head))), stream)
+        dispatcher.close_all_clients()
+
+    def test_slow_client_receives_whole_frames(self):
+        dispatcher = Dispatcher(make_config(senderMode='select', clientMaxBytes=4096, epochBatchMs=0))
+        local, remote = socket.socketpair()
+        local.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        remote.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        dispatcher.add_client(local, ('test', 0))
+        frames, stream = make_stream(2000, self.rng)
+        for chunk in split_randomly(stream, self.rng):
+            dispatcher.put_data(chunk)
+            dispatcher.dispatch()
+        # 客户端此时才开始读取，之前的数据大部分已被跳过
+        remote.setblocking(False)
+        received = bytearray()
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            dispatcher.poll(timeout=0.01)
+            try:
+                received += remote.recv(65536)
+            except BlockingIOError:
+                if not dispatcher.clients[0].has_pending_data():
+                    break
+        sender = dispatcher.clients[0]
+        self.assertGreater(sender.drop_count, 0)
+        self.assertGreater(len(received), 0)
+
+        frame_set = set(frames)
+        pos = 0
+        for index, len_message, msg_type in iter_frames(received):
+            self.assertEqual(index, pos, 'torn frame at %d' % pos)
+            if len_message > 0:
+                self.assertIn(bytes(received[index:index + len_message]), frame_set)
+                pos = index + len_message
+        self.assertEqual(pos, len(received))
+        dispatcher.close_all_clients()
+        remote.close()
+
+    def test_transcode_after_framing(self):
+        transcoder = MsmTranscoder(drop_gnss=['BDS'])
+        dispatcher = Dispatcher(make_config(), transcoder)
+        epochs = []
+        for epoch_time in range(20):
+            epochs += [make_msm(1077, [1, 5], [2], True, self.rng, epoch_time),
+                       make_msm(1127, [3], [2], False, self.rng, epoch_time)]
+        for chunk in split_randomly(b''.join(epochs), self.rng):
+            dispatcher.put_data(chunk)
+            dispatcher.dispatch()
+        ring = dispatcher.ring
+        packets = [bytes(b''.join(ring.get_views(start, end - start))) for start, end in ring.frames]
+        expected = []
+        reference = MsmTranscoder(drop_gnss=['BDS'])
+        for message in epochs:
+            expected += reference.transcode_stream(message)
+        self.assertEqual(packets, expected)
+        self.assertEqual(len(packets), 20)
+        dispatcher.close_all_clients()
+
+
+class DispatcherEpochBatchTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(9)
+        self.dispatcher = Dispatcher(make_config(epochBatchMs=1000))
+
+    def tearDown(self):
+        self.dispatcher.close_all_clients()
+
+    def make_epoch(self, epoch_time):
+        """一个历元: 两条观测报文，中间夹着星历和基站信息"""
+        return [make_msm(1077, [1, 2], [2], True, self.rng, epoch_time), make_frame(1019, 61, self.rng),
+                make_frame(1005, 19, self.rng), make_msm(1127, [3], [2], False, self.rng, epoch_time)]
+
+    def put(self, packets):
+        for packet in packets:
+            self.dispatcher.put_data(packet)
+        self.dispatcher.dispatch()
+
+    def test_other_messages_do_not_end_epoch(self):
+        dispatcher = self.dispatcher
+        first, second = self.make_epoch(0), self.make_epoch(1)
+        self.put(first[:3])
+        self.assertEqual(dispatcher.ring.tail, 0)
+        self.put(first[3:])
+        self.assertEqual(dispatcher.ring.tail, len(b''.join(first)))
+
+        # 历元之间收到的星历随下一个历元一起写入
+        ephemeris = make_frame(1019, 61, self.rng)
+        self.put([ephemeris] + second[:3])
+        self.assertEqual(dispatcher.ring.tail, len(b''.join(first)))
+        self.put(second[3:])
+        self.assertEqual(list(dispatcher.ring.epoch_starts), [0, len(b''.join(first))])
+        self.assertEqual(dispatcher.batch_hold.count, 2)
+
+    def test_latency_excludes_batch_hold(self):
+        dispatcher = self.dispatcher
+        epoch = self.make_epoch(0)
+        self.put(epoch[:3])
+        time.sleep(0.2)
+        self.put(epoch[3:])
+        self.assertGreaterEqual(dispatcher.batch_hold.max, 0.2)
+        self.assertLess(dispatcher.latency.max, 0.1)
+
+
+class DispatcherHandoffTest(unittest.TestCase):
+    def test_slow_client_does_not_delay_handoff(self):
+        dispatcher = Dispatcher(make_config(senderMode='select', epochBatchMs=0))
+        slow_local, slow_remote = socket.socketpair()
+        slow_local.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        slow_remote.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        local, remote = socket.socketpair()
+        dispatcher.add_client(slow_local, ('slow', 0))
+        dispatcher.add_client(local, ('test', 0))
+        frames, stream = make_stream(100, random.Random(7))
+        dispatcher.put_data(stream)
+        dispatcher.dispatch()
+        received = bytearray()
+        deadline = time.time() + 5
+        while dispatcher.clients[1].has_pending_data() and time.time() < deadline:
+            dispatcher.poll(timeout=0.01)
+            received += remote.recv(65536)
+        self.assertTrue(dispatcher.clients[0].has_pending_data())
+
+        # 慢客户端用完共用的超时后断开，其余客户端仍然移交
+        with mock.patch('rtk_trans.dispatcher.HANDOFF_SEND_TIMEOUT', 0.3):
+            time_start = time.time()
+            clients = dispatcher.detach_all_clients()
+            self.assertLess(time.time() - time_start, 1)
+        self.assertEqual([address for client, address in clients], [('test', 0)])
+        remote.setblocking(False)
+        try:
+            while True:
+                received += remote.recv(65536)
+        except BlockingIOError:
+            pass
+        self.assertEqual(bytes(received), stream)
+        for client, address in clients:
+            client.close()
+        for sock in (slow_remote, remote):
+            sock.close()
+
+
+class SenderThreadWakeupTest(unittest.TestCase):
+    def test_idle_sender_is_woken_by_new_data_and_close(self):
+        dispatcher = Dispatcher(make_config(senderMode='thread', epochBatchMs=0))
+        local, remote = socket.socketpair()
+        dispatcher.add_client(local, ('test', 0))
+        sender = dispatcher.clients[0]
+        frames, stream = make_stream(20, random.Random(11))
+        time.sleep(0.1)     # 线程已阻塞在 select 中
+        for frame in frames:
+            dispatcher.put_data(frame)
+            dispatcher.dispatch()
+        remote.settimeout(2)
+        received = bytearray()
+        while len(received) < len(stream):
+            received += remote.recv(65536)
+        self.assertEqual(bytes(received), stream)
+
+        time_start = time.time()
+        dispatcher.close_all_clients()
+        self.assertLess(time.time() - time_start, 0.5)
+        self.assertFalse(sender.is_alive())
+        remote.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : test_link_compression.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : 压缩链路的测试
+#
+
+import random
+import unittest
+from unittest import mock
+
+from rtcm_samples import make_stream, split_randomly
+from rtk_trans.link_compression import LINK_ACK, LINK_NEGOTIATE_BYTES, LinkCompressor, LinkDecompressor
+
+
+class LinkDecompressorTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(13)
+
+    def feed_all(self, decompressor, chunks):
+        out = bytearray()
+        for chunk in chunks:
+            for data in decompressor.feed(memoryview(chunk)):
+                out += data
+        return bytes(out)
+
+    def test_ack_split_across_feeds(self):
+        plain = make_stream(20, self.rng)[1]
+        stream = make_stream(200, self.rng)[1]
+        compressed = LinkCompressor().compress([memoryview(stream)], True)
+        decompressor = LinkDecompressor()
+        out = self.feed_all(decompressor, split_randomly(plain + LINK_ACK + compressed, self.rng))
+        self.assertEqual(out, plain + stream)
+        self.assertIsNotNone(decompressor.decompressor)
+
+    def test_stop_negotiating_after_limit(self):
+        stream = make_stream(1000, self.rng)[1]
+        self.assertGreater(len(stream), LINK_NEGOTIATE_BYTES)
+        decompressor = LinkDecompressor()
+        out = self.feed_all(decompressor, split_randomly(stream, self.rng))
+        self.assertEqual(out, stream)
+        self.assertFalse(decompressor.negotiating)
+        # 之后的数据不拷贝
+        data = memoryview(b'data')
+        self.assertIs(decompressor.feed(data)[0], data)
+
+    def test_stop_negotiating_after_timeout(self):
+        decompressor = LinkDecompressor()
+        self.assertEqual(decompressor.feed(memoryview(b'$PRTKZ,')), [])
+        with mock.patch('rtk_trans.link_compression.time.monotonic', return_value=decompressor.negotiate_deadline):
+            self.assertEqual(b''.join(decompressor.feed(memoryview(b'GGA'))), b'$PRTKZ,GGA')
+        self.assertFalse(decompressor.negotiating)
+
+
+if __name__ == '__main__':
+    unittest.main()
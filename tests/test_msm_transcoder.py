@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : test_msm_transcoder.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : MsmTranscoder 同步标志的测试
+#
+
+import random
+import unittest
+
+from rtcm_samples import make_frame, make_msm
+from rtk_protocol.msm_transcoder import MsmTranscoder
+from rtk_protocol.rtcm_message import RtcmMessage
+from rtk_protocol.rtcm_util import check_frame
+
+
+def summarize(messages):
+    """(报文类型, 同步标志) 列表，同时检查 CRC"""
+    for message in messages:
+        assert check_frame(memoryview(message), 0, len(message)) == len(message)
+    return [(RtcmMessage(message).msg_type, RtcmMessage(message).multiple_message) for message in messages]
+
+
+class MsmTranscoderTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(17)
+
+    def make_epoch(self, msg_types, epoch_time=0):
+        return [make_msm(msg_type, [1, 5, 9], [2, 15], i < len(msg_types) - 1, self.rng, epoch_time)
+                for i, msg_type in enumerate(msg_types)]
+
+    def transcode_all(self, transcoder, messages):
+        out = []
+        for message in messages:
+            out += transcoder.transcode_stream(message)
+        return out
+
+    def test_drop_terminating_gnss(self):
+        transcoder = MsmTranscoder(drop_gnss=['Galileo'])
+        out = self.transcode_all(transcoder, self.make_epoch([1077, 1087, 1097]))
+        self.assertEqual(summarize(out), [(1077, True), (1087, False)])
+
+    def test_drop_middle_gnss(self):
+        transcoder = MsmTranscoder(drop_gnss=['GLONASS'])
+        epoch = self.make_epoch([1077, 1087, 1097])
+        out = self.transcode_all(transcoder, epoch)
+        self.assertEqual(out, [epoch[0], epoch[2]])
+
+    def test_drop_all_signals_of_terminating_msm(self):
+        transcoder = MsmTranscoder(msm_level=4, drop_signals={'BDS': [2, 15]})
+        epochs = self.make_epoch([1077, 1127], 1000) + self.make_epoch([1077, 1127], 2000)
+        out = self.transcode_all(transcoder, epochs)
+        self.assertEqual(summarize(out), [(1074, False), (1074, False)])
+
+    def test_non_msm_is_not_held(self):
+        transcoder = MsmTranscoder(drop_gnss=['BDS'])
+        epoch = self.make_epoch([1077, 1127])
+        station = make_frame(1005, 19, self.rng)
+        self.assertEqual(transcoder.transcode_stream(epoch[0]), [])
+        self.assertEqual(transcoder.transcode_stream(station), [station])
+        self.assertEqual(summarize(transcoder.transcode_stream(epoch[1])), [(1077, False)])
+
+
+if __name__ == '__main__':
+    unittest.main()
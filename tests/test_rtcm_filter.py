@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : test_rtcm_filter.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : rtcm 报文过滤、降频规则的测试
+#
+
+import unittest
+from unittest import mock
+
+from rtk_protocol.msm_transcoder import BitWriter
+from rtk_protocol.rtcm_filter import RtcmFilter, parse_msg_types
+
+
+def make_ephemeris(msg_type, sat_id, issue):
+    """生成一条只填写了卫星号和星历版本号的 GPS (1019) 星历报文，不含帧头和 CRC"""
+    writer = BitWriter()
+    writer.write(msg_type, 12)
+    writer.write(sat_id, 6)
+    writer.write(0, 30)     # 周数、URA 等
+    writer.write(issue, 8)
+    writer.write(0, 488 - 56)
+    return bytes(3) + writer.to_bytes()
+
+
+class RtcmFilterTest(unittest.TestCase):
+    def test_parse_msg_types(self):
+        self.assertEqual(parse_msg_types([1005, '1074-1077', '1230']), {1005, 1074, 1075, 1076, 1077, 1230})
+        for items in (['1077-1074'], [4096], ['-1']):
+            with self.assertRaises(Exception):
+                parse_msg_types(items)
+
+    def test_include_and_exclude(self):
+        rtcm_filter = RtcmFilter(include=['1070-1079', 1005], exclude=[1075])
+        msg_types = (1004, 1005, 1074, 1075, 1077, 1087)
+        accepted = [msg_type for msg_type in msg_types if rtcm_filter.accept(msg_type, b'', 0)]
+        self.assertEqual(accepted, [1005, 1074, 1077])
+        rtcm_filter = RtcmFilter(exclude=['1019-1020'])
+        self.assertEqual([rtcm_filter.accept(msg_type, b'', 0) for msg_type in (1005, 1019, 1020, 1077)],
+                         [True, False, False, True])
+
+    def test_from_config(self):
+        self.assertIsNone(RtcmFilter.from_config({}))
+        self.assertIsNotNone(RtcmFilter.from_config({'filter': []}))
+        self.assertIsNotNone(RtcmFilter.from_config({'decimation': {'1230': 10}}))
+
+    def test_decimation_interval(self):
+        rtcm_filter = RtcmFilter(decimation={'1005-1006': 10})
+        accepted = []
+        for now in (0, 5, 9.9, 10, 15, 21):
+            with mock.patch('rtk_protocol.rtcm_filter.time.monotonic', return_value=now):
+                accepted.append(rtcm_filter.accept(1005, b'', 0))
+        self.assertEqual(accepted, [True, False, False, True, False, True])
+        self.assertTrue(rtcm_filter.accept(1077, b'', 0))
+
+    def test_decimation_does_not_override_exclude(self):
+        rtcm_filter = RtcmFilter(exclude=[1005], decimation={1005: 10})
+        self.assertFalse(rtcm_filter.accept(1005, b'', 0))
+
+    def test_decimation_iode(self):
+        rtcm_filter = RtcmFilter(decimation={1019: 'iode'})
+        messages = [(1, 10), (2, 10), (1, 10), (1, 11), (2, 10), (1, 10)]
+        accepted = [rtcm_filter.accept(1019, make_ephemeris(1019, sat_id, issue), 0) for sat_id, issue in messages]
+        self.assertEqual(accepted, [True, True, False, True, False, True])
+
+    def test_invalid_decimation(self):
+        for decimation in ({1005: 'iode'}, {1005: 0}, {1005: 'fast'}):
+            with self.assertRaises(Exception):
+                RtcmFilter(decimation=decimation)
+
+
+if __name__ == '__main__':
+    unittest.main()
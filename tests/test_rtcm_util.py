@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : test_rtcm_util.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : rtcm 报文切分的测试
+#
+
+import random
+import unittest
+
+from rtcm_samples import make_stream, split_randomly
+from rtk_protocol.rtcm_checker import RtcmChecker
+from rtk_protocol.rtcm_filter import RtcmFilter
+from rtk_protocol.rtcm_util import iter_frames
+
+
+def corrupt_crc(frame):
+    """把报文的 CRC 改错"""
+    return frame[:-1] + bytes([frame[-1] ^ 0xff])
+
+
+class IterFramesTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(3)
+        self.frames, stream = make_stream(20, self.rng)
+        # 报文之间夹杂无法解析的数据: 不含引导字的数据、长度过长的引导字、CRC 错误的报文
+        self.garbage = [b'garbage', b'\xd3\x00\x13zz', b'\xd3', corrupt_crc(self.frames[0])]
+        self.stream = b''
+        self.positions = []
+        for frame in self.frames:
+            self.stream += self.rng.choice(self.garbage)
+            self.positions.append(len(self.stream))
+            self.stream += frame
+
+    def test_resync_after_garbage_and_bad_crc(self):
+        items = list(iter_frames(self.stream))
+        expected = [(index, len(frame)) for index, frame in zip(self.positions, self.frames)]
+        self.assertEqual([(index, len_message) for index, len_message, msg_type in items[:-1]], expected)
+        self.assertEqual(items[-1], (len(self.stream), -1, -1))
+
+    def test_partial_frame_at_end(self):
+        stream = self.frames[0] + self.frames[1][:10]
+        items = list(iter_frames(stream))
+        self.assertEqual(items, [(0, len(self.frames[0]), items[0][2]), (len(self.frames[0]), -2, -1)])
+
+    def test_start_and_end(self):
+        start = self.positions[3]
+        end = self.positions[5] + len(self.frames[5])
+        items = list(iter_frames(self.stream, start, end))
+        self.assertEqual([index for index, len_message, msg_type in items if len_message > 0],
+                         self.positions[3:6])
+        self.assertEqual(items[-1][:2], (end, -1))
+
+
+class RtcmCheckerTest(unittest.TestCase):
+    def test_frames_split_across_feeds(self):
+        rng = random.Random(4)
+        frames, stream = make_stream(200, rng)
+        stream = b'garbage' + frames[0] + corrupt_crc(frames[1]) + b''.join(frames[2:])
+        checker = RtcmChecker(RtcmFilter())
+        parsed = []
+        for chunk in split_randomly(stream, rng):
+            checker.push_back(chunk)
+            parsed += checker.get_parsed_data_list()
+        self.assertEqual(parsed, frames[:1] + frames[2:])
+        self.assertEqual(len(checker.data), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
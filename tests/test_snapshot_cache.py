@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : test_snapshot_cache.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : SnapshotCache 的测试
+#
+
+import random
+import unittest
+
+from rtcm_samples import make_frame
+from rtk_trans.snapshot_cache import SnapshotCache
+
+
+class SnapshotCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.rng = random.Random(6)
+
+    def test_single_frame(self):
+        cache = SnapshotCache()
+        station = make_frame(1005, 19, self.rng)
+        cache.update(station)
+        self.assertEqual(cache.get_snapshot(), station)
+
+    def test_multiple_frames_in_one_packet(self):
+        cache = SnapshotCache()
+        station = make_frame(1005, 19, self.rng)
+        msm = make_frame(1074, 200, self.rng)
+        antenna = make_frame(1033, 40, self.rng)
+        cache.update(b'\x00' + station + msm + antenna + station[:10])
+        self.assertEqual(cache.get_snapshot(), station + antenna)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+# -*- coding:utf-8 -*-
+# File          : test_status_board.py
+# Author        : bssthu
+# Project       : rtk_trans
+# Description   : StatusBoard 大小和 slot 分配的测试
+#
+
+import unittest
+
+from rtk_utils.status_board import StatusBoard, StatusBoardFullError, STATUS_BOARD_SLOTS
+
+
+class StatusBoardTest(unittest.TestCase):
+    def test_size_from_entry_count(self):
+        board = StatusBoard.from_config({'entry': {'e%d' % i: None for i in range(5000)}})
+        try:
+            self.assertGreaterEqual(board.slots, 5000 * 2)
+            for i in range(5000):
+                board.alloc('e%d' % i)
+            self.assertEqual(len(board.read_all()), 5000)
+        finally:
+            board.close()
+
+    def test_default_and_configured_size(self):
+        board = StatusBoard.from_config({})
+        self.assertEqual(board.slots, STATUS_BOARD_SLOTS)
+        board.close()
+        board = StatusBoard.from_config({'entry': {}, 'statusBoardSlots': 2})
+        self.assertEqual(board.slots, 2)
+        board.close()
+
+    def test_full_and_reuse(self):
+        board = StatusBoard(2)
+        try:
+            self.assertEqual([board.alloc('a'), board.alloc('b')], [0, 1])
+            self.assertEqual(board.alloc('a'), 0)
+            with self.assertRaisesRegex(StatusBoardFullError, 'statusBoardSlots'):
+                board.alloc('c')
+            board.free('a')
+            self.assertEqual(board.alloc('c'), 0)
+            self.assertEqual(sorted(board.read_all().keys()), ['b', 'c'])
+        finally:
+            board.close()
+
+
+if __name__ == '__main__':
+    unittest.main()